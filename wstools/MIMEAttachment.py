@@ -4,8 +4,6 @@
 #to standard!
 # http://bugs.python.org/issue5525
 
-#TODO do not load all the message in memory stream it from the disk
-
 import re
 import random
 import sys
@@ -18,6 +16,12 @@ _width = len(repr(sys.maxint-1))
 _fmt = '%%0%dd' % _width
 
 class MIMEMessage:
+    '''multipart/related message of a SOAP message and its attachments.
+
+    class variables:
+        blocksize -- attachments are read in blocks of this size.
+    '''
+    blocksize = 1 << 16
 
     def __init__(self):
         self._files = []
@@ -26,43 +30,86 @@ class MIMEMessage:
         self._boundary = ""
 
     def makeBoundary(self):
-        #create the boundary 
-        msgparts = []
-        msgparts.append(self._xmlMessage)
-        for i in self._files:
-            msgparts.append(i.read())
-        #this sucks, all in memory
-        alltext = NL.join(msgparts)
-        self._boundary  = _make_boundary(alltext)
-        #maybe I can save some memory
-        del alltext
-        del msgparts
+        #create the boundary, one not found in the XML message or the
+        #files, read (or written on demand) a block at a time.
+        boundary = _make_boundary()
+        b = boundary
+        counter = 0
+        while self._find('--' + b):
+            b = boundary + '.' + str(counter)
+            counter += 1
+        self._boundary = b
         self._startCID =  "<" + (_fmt % random.randrange(sys.maxint)) + (_fmt % random.randrange(sys.maxint)) + ">"
 
 
+    def _find(self, text):
+        '''True if text is in the XML message or one of the files.
+        '''
+        if type(self._xmlMessage) is str:
+            if text in self._xmlMessage:
+                return True
+        else:
+            # written once more to look at it, without keeping it
+            found, tail = [False], ['']
+            def scan(piece):
+                piece = tail[0] + piece
+                if text in piece:
+                    found[0] = True
+                tail[0] = piece[-len(text):]
+            self._xmlMessage(scan)
+            if found[0]:
+                return True
+        for file in self._files:
+            file.seek(0)
+            tail = ''
+            while True:
+                block = file.read(self.blocksize)
+                if not block:
+                    break
+                if text in tail + block:
+                    return True
+                tail = block[-len(text):]
+        return False
+
     def toString(self):
         '''it return a string with the MIME message'''
+        out = []
+        self.write(out.append)
+        return ''.join(out)
+
+    def write(self, write):
+        '''Write the MIME message by calling write with each piece,
+        the files are copied a block at a time.
+        '''
         if len(self._boundary) == 0:
             #the makeBoundary hasn't been called yet
             self.makeBoundary()
         #ok we have everything let's start to spit the message out
         #first the XML
-        returnstr = NL + "--" + self._boundary + NL
-        returnstr += "Content-Type: text/xml; charset=\"us-ascii\"" + NL
-        returnstr += "Content-Transfer-Encoding: 7bit" + NL
-        returnstr += "Content-Id: " + self._startCID + NL + NL
-        returnstr += self._xmlMessage + NL
+        write(NL + "--" + self._boundary + NL +
+              "Content-Type: text/xml; charset=\"us-ascii\"" + NL +
+              "Content-Transfer-Encoding: 7bit" + NL +
+              "Content-Id: " + self._startCID + NL + NL)
+        if type(self._xmlMessage) is str:
+            write(self._xmlMessage)
+        else:
+            self._xmlMessage(write)
+        write(NL)
         #then the files
         for file in self._files:
-            returnstr += "--" + self._boundary + NL
-            returnstr += "Content-Type: application/octet-stream" + NL
-            returnstr += "Content-Transfer-Encoding: binary" + NL
-            returnstr += "Content-Id: <" + str(id(file)) + ">" + NL + NL
+            write("--" + self._boundary + NL +
+                  "Content-Type: application/octet-stream" + NL +
+                  "Content-Transfer-Encoding: binary" + NL +
+                  "Content-Id: <" + str(id(file)) + ">" + NL + NL)
             file.seek(0)
-            returnstr += file.read() + NL
+            while True:
+                block = file.read(self.blocksize)
+                if not block:
+                    break
+                write(block)
+            write(NL)
         #closing boundary
-        returnstr += "--" + self._boundary + "--" + NL 
-        return returnstr
+        write("--" + self._boundary + "--" + NL)
 
     def attachFile(self, file):
         '''
@@ -72,7 +119,9 @@ class MIMEMessage:
 
     def addXMLMessage(self, xmlMessage):
         '''
-        it adds the XML message. we can have only one XML SOAP message
+        it adds the XML message. we can have only one XML SOAP message.
+        xmlMessage is a string, or a callable writing the message by
+        calling its argument with each piece.
         '''
         self._xmlMessage = xmlMessage
 
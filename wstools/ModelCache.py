@@ -0,0 +1,269 @@
+#! /usr/bin/env python
+"""On-disk cache of loaded WSDL and XMLSchema object models.
+
+A ModelCache pickles the model built by WSDLReader.loadFromURL or
+SchemaReader.loadFromURL along with the SHA-1 digest of every document
+read to build it: the document itself and whatever it wsdl:imports,
+xsd:imports or xsd:includes.  The next load unpickles the model if none
+of the documents changed: local files whose modification time and size
+are those recorded aren't read again, other documents are fetched to
+compare their digests, unless the entry is younger than maxage.
+
+    from wstools.ModelCache import ModelCache
+    reader = WSDLReader(cache=ModelCache('/var/cache/wsdl'))
+    wsdl = reader.loadFromURL('http://host/sdk/vim.wsdl')
+"""
+
+ident = "$Id$"
+
+import os, sys, gc, time, types, weakref, cPickle
+from xml.dom import Node
+from Utility import DOM
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+
+class ModelCache:
+    """Keeps pickled object models in a directory, one file per URL.
+
+    class variables:
+        version -- stored with each entry, entries written by another
+            version are rebuilt.
+    """
+    version = 2
+
+    def __init__(self, directory, maxage=None):
+        """directory -- where to keep the pickles, created on demand.
+           maxage -- seconds an entry is used without fetching the remote
+               documents it was built from again, None fetches them on
+               every load.
+        """
+        self.directory = directory
+        self.maxage = maxage
+
+    def getFile(self, url):
+        """Return the name of the file caching the model of url."""
+        return os.path.join(self.directory, '%s.pickle' %sha1(url).hexdigest())
+
+    def load(self, url, loader):
+        """Return the model of url, calling loader(url) to build it
+        when there is no current copy in the cache.
+           url -- URL or file name of the document
+           loader -- callable building the model
+        """
+        model = self._read(url)
+        if model is None:
+            model, documents = self._build(url, loader)
+            self._write(url, documents, model)
+        return model
+
+    def _build(self, url, loader):
+        """Call loader, returns (model, documents), documents lists the
+        (url, digest, stamp) of everything DOM.loadFromURL read meanwhile
+        in this thread, so loads made by other threads aren't recorded.
+        """
+        documents = []
+        def hook(location, data):
+            item = (location, sha1(data).hexdigest(), _stamp(location))
+            if item not in documents: documents.append(item)
+
+        DOM.addLoadHook(hook)
+        try:
+            model = loader(url)
+        finally:
+            DOM.removeLoadHook(hook)
+        return model, documents
+
+    def _read(self, url):
+        """Return the cached model of url, or None if there is no entry or
+        one of the documents it was built from changed.
+        """
+        try:
+            file = open(self.getFile(url), 'rb')
+        except IOError:
+            return None
+
+        try:
+            try:
+                unpickler = cPickle.Unpickler(file)
+                unpickler.persistent_load = _persistent_load
+                version, documents, created = unpickler.load()
+                if version != self.version:
+                    return None
+                fresh = self.maxage is not None and \
+                    0 <= time.time() - created < self.maxage
+                for location, digest, stamp in documents:
+                    if stamp is not None:
+                        if stamp == _stat(location): continue
+                    elif fresh and not os.path.isfile(location):
+                        continue
+                    if sha1(DOM.readURL(location)).hexdigest() != digest:
+                        return None
+                # the collector would otherwise rescan the partial
+                # graph over and over, it's most of the load time.
+                enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    model = unpickler.load()
+                    parents = unpickler.load()
+                finally:
+                    if enabled: gc.enable()
+            except Exception:
+                # unreadable or stale entry, it is rebuilt and replaced
+                return None
+        finally:
+            file.close()
+
+        for node in parents:
+            _link_siblings(node)
+        return model
+
+    def _write(self, url, documents, model):
+        """Pickle model to the file of url, a model that can't be written
+        is simply not cached.
+        """
+        name = self.getFile(url)
+        tmp = '%s.%d' %(name, os.getpid())
+        pickler = _ModelPickler()
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            file = open(tmp, 'wb')
+            try:
+                pickler.dump(file, (self.version, documents, time.time()),
+                             model)
+            finally:
+                file.close()
+            if os.path.exists(name):
+                os.remove(name)
+            os.rename(tmp, name)
+        except (EnvironmentError, cPickle.PickleError, TypeError,
+                RuntimeError):
+            # RuntimeError: models too deep for the recursion limit
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def _stat(location):
+    """(modification time, size) of a local file, None for anything else.
+    """
+    try:
+        st = os.stat(location)
+    except (EnvironmentError, TypeError, ValueError):
+        return None
+    return (st.st_mtime, st.st_size)
+
+def _stamp(location):
+    """The stamp recorded for a document read now, None unless it is a
+    local file unchanged for a while: a file written in the same second it
+    is read could change again without its stamp changing.
+    """
+    stamp = _stat(location)
+    if stamp is None or time.time() - stamp[0] < 2:
+        return None
+    return stamp
+
+
+_PLAIN_TYPES = dict.fromkeys([types.NoneType, str, unicode, int, long, float,
+                              tuple, list, dict])
+
+class _ModelPickler:
+    """Pickles the object models, which the stock pickler can't handle.
+    Weak references, bound methods and classes nested in classes (the
+    pickler only finds module level ones) are stored as persistent ids.  DOM
+    nodes are pickled without their sibling links, since following them
+    would recurse once per sibling, and the links are rebuilt from
+    childNodes of the parent nodes recorded while pickling.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.parents = []
+        self.classes = {}
+
+    def persistent_id(self, obj):
+        t = type(obj)
+        if t in _PLAIN_TYPES:
+            return None
+        if t is weakref.ReferenceType:
+            return ('ref', obj())
+        if t is types.MethodType:
+            return ('method', obj.im_self, obj.im_func.__name__)
+        if t is types.ClassType or t is type:
+            if not self.classes.has_key(obj):
+                self.classes[obj] = _nested_class_path(obj)
+            return self.classes[obj]
+        if t is types.InstanceType and isinstance(obj, Node) and \
+           not self.nodes.has_key(id(obj)):
+            d = obj.__dict__
+            self.nodes[id(obj)] = (d, d.pop('previousSibling', None),
+                                   d.pop('nextSibling', None))
+            if obj.childNodes:
+                self.parents.append(obj)
+        return None
+
+    def dump(self, file, header, model):
+        """Write header, model and the parent nodes of model to file.
+        """
+        pickler = cPickle.Pickler(file, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = self.persistent_id
+        try:
+            pickler.dump(header)
+            pickler.dump(model)
+            pickler.dump(self.parents)
+        finally:
+            for d,previous,next in self.nodes.values():
+                if previous is not None: d['previousSibling'] = previous
+                if next is not None: d['nextSibling'] = next
+            self.nodes = {}
+            self.parents = []
+
+
+class _Dead:
+    pass
+
+def _persistent_load(pid):
+    if pid[0] == 'ref':
+        if pid[1] is None:
+            return weakref.ref(_Dead())
+        return weakref.ref(pid[1])
+    if pid[0] == 'method':
+        return getattr(pid[1], pid[2])
+    if pid[0] == 'class':
+        obj = sys.modules[pid[1]]
+        for name in pid[2]:
+            obj = getattr(obj, name)
+        return obj
+    raise cPickle.UnpicklingError, 'unsupported persistent id %s' %pid[0]
+
+def _nested_class_path(cls):
+    '''Returns the persistent id of a class defined in the body of
+    another class, None for anything the pickler can find itself.
+    '''
+    module = sys.modules.get(cls.__module__)
+    if module is None or getattr(module, cls.__name__, None) is cls:
+        return None
+    scopes = [ ((name,), obj) for name,obj in module.__dict__.items()
+               if type(obj) in (types.ClassType, type) ]
+    while scopes:
+        path, scope = scopes.pop()
+        for name,obj in scope.__dict__.items():
+            if obj is cls:
+                return ('class', module.__name__, path + (name,))
+            if type(obj) in (types.ClassType, type) and \
+               obj.__module__ == module.__name__ and len(path) < 4:
+                scopes.append((path + (name,), obj))
+    return None
+
+def _link_siblings(node):
+    previous = None
+    for child in node.childNodes:
+        child.previousSibling = previous
+        if previous is not None:
+            previous.nextSibling = child
+        previous = child
+    if previous is not None:
+        previous.nextSibling = None
@@ -23,6 +23,13 @@ from TimeoutSocket import TimeoutSocket, TimeoutError
 from urlparse import urlparse
 from httplib import HTTPConnection, HTTPSConnection
 from exceptions import Exception
+
+# If we have no threading, hooks are simply process wide
+try:
+    from threading import local as _local
+except ImportError:
+    class _local:
+        pass
 try:
     from ZSI import _get_idstr
 except:
@@ -634,20 +641,43 @@ class DOM:
            document instance."""
         return xml.dom.minidom.parse(data)
 
-    def loadFromURL(self, url):
-        """Load an xml file from a URL and return a DOM document."""
+    # per thread list of callables taking (url, data), told of every
+    # document loadFromURL reads in the thread that added them; ModelCache
+    # uses it to learn what a model depends on.
+    _loadHooks = _local()
+
+    def addLoadHook(self, hook):
+        """Call hook(url, data) for each document loaded by this thread."""
+        hooks = getattr(self._loadHooks, 'hooks', None)
+        if hooks is None:
+            hooks = self._loadHooks.hooks = []
+        hooks.append(hook)
+
+    def removeLoadHook(self, hook):
+        self._loadHooks.hooks.remove(hook)
+
+    def readURL(self, url):
+        """Return the contents of a URL or file as a string."""
         if isfile(url) is True:
             file = open(url, 'r')
         else:
             file = urlopen(url)
 
         try:
-            result = self.loadDocument(file)
-        except Exception, ex:
+            return file.read()
+        finally:
             file.close()
+
+    def loadFromURL(self, url):
+        """Load an xml file from a URL and return a DOM document."""
+        data = self.readURL(url)
+        for hook in getattr(self._loadHooks, 'hooks', ()):
+            hook(url, data)
+
+        try:
+            result = self.loadDocument(StringIO(data))
+        except Exception, ex:
             raise ParseError(('Failed to load document %s' %url,) + ex.args)
-        else:
-            file.close()
         return result
 
 DOM = DOM()
@@ -715,7 +745,12 @@ class MessageInterface:
 
 
 class ElementProxy(Base, MessageInterface):
-    '''
+    '''The namespaces in scope of node are kept in a table (uri --> prefix,
+    prefix --> uri), read from the DOM on first use, kept up to date by the
+    declarations made through the proxy and shared with the elements it
+    creates until they declare one.  An element which declared one does
+    not see later declarations of its ancestors, it declares its own.  The
+    default namespace is under the xmlns prefix.
     '''
     _soap_env_prefix = 'soapenv'
     _soap_enc_prefix = 'soapenc'
@@ -746,12 +781,15 @@ class ElementProxy(Base, MessageInterface):
     }
     name = None
     namespaceURI = None
+    _uris = _prefixes = None
+    _nsown = False
 
     def __init__(self, sw, message=None):
         '''Initialize.
            sw -- SoapWriter
         '''
         self._indx = 0
+        self._uris = self._prefixes = None
         MessageInterface.__init__(self, sw)
         Base.__init__(self)
         self._dom = DOM
@@ -797,6 +835,7 @@ class ElementProxy(Base, MessageInterface):
             raise NamespaceError, 'unexpected node type %s, expecting %s' %(self.node, localName)
 
     def setNode(self, node=None):
+        self._uris = self._prefixes = None
         if node:
             if isinstance(node, ElementProxy):
                 self.node = node._getNode()
@@ -830,14 +869,63 @@ class ElementProxy(Base, MessageInterface):
         because when the current node is attached it copies the
         namespaces into the parent node.
         '''
+        prefixes = self._getNamespaces()[1]
         while 1:
             self._indx += 1
             prefix = 'ns%d' %self._indx
-            try:
-                self._dom.findNamespaceURI(prefix, self._getNode())
-            except DOMException, ex:
-                break
-        return prefix
+            if not prefixes.has_key(prefix):
+                return prefix
+
+    def _getNamespaces(self):
+        '''Returns the namespaces in scope of node, (uri --> prefix,
+        prefix --> uri), nearest declaration first.
+        '''
+        if self._prefixes is not None:
+            return self._uris, self._prefixes
+
+        uris, prefixes = {}, {}
+        node = self.node
+        while node is not None and node.nodeType != Node.DOCUMENT_NODE:
+            if node.nodeType == Node.ELEMENT_NODE:
+                for attr in node.attributes.values():
+                    if attr.namespaceURI != XMLNS.BASE or \
+                       prefixes.has_key(attr.localName):
+                        continue
+                    prefixes[attr.localName] = attr.value
+                    if attr.localName != self._xmlns_prefix:
+                        uris.setdefault(attr.value, attr.localName)
+                if hasattr(node, '__imported__'):
+                    break
+            node = node.parentNode
+        self._uris, self._prefixes, self._nsown = uris, prefixes, True
+        return uris, prefixes
+
+    def _declareNamespace(self, prefix, nsuri):
+        '''Add prefix --> nsuri to the namespaces in scope, the table is
+        copied the first time this element declares one.
+        '''
+        uris, prefixes = self._getNamespaces()
+        if not self._nsown:
+            uris, prefixes = self._uris, self._prefixes = \
+                uris.copy(), prefixes.copy()
+            self._nsown = True
+        old = prefixes.get(prefix)
+        if old is not None and uris.get(old) == prefix:
+            del uris[old]
+        prefixes[prefix] = nsuri
+        if prefix != self._xmlns_prefix:
+            uris[nsuri] = prefix
+
+    def _shareNamespaces(self, proxy):
+        '''proxy is a new child element, it shares the namespaces in scope
+        until it declares one, so they are no longer copied on declaration.
+        '''
+        uris, prefixes = self._getNamespaces()
+        if not self._nsown:
+            self._uris, self._prefixes = uris.copy(), prefixes.copy()
+            self._nsown = True
+        proxy._uris, proxy._prefixes = self._uris, self._prefixes
+        proxy._nsown = False
 
     def _getPrefix(self, node, nsuri):
         '''
@@ -888,6 +976,8 @@ class ElementProxy(Base, MessageInterface):
             value -- value of attribute
         '''
         self.node.setAttributeNS(namespaceURI, qualifiedName, value)
+        if namespaceURI == XMLNS.BASE and self._prefixes is not None:
+            self._declareNamespace(qualifiedName.split(':')[-1], value)
 
     #############################################
     #General Methods
@@ -898,9 +988,14 @@ class ElementProxy(Base, MessageInterface):
         return False
 
     def getPrefix(self, namespaceURI):
-        try:
-            prefix = self._getPrefix(node=self.node, nsuri=namespaceURI)
-        except NamespaceError, ex:
+        uris, prefixes = self._getNamespaces()
+        if prefixes.has_key(self._xmlns_prefix) and \
+           prefixes[self._xmlns_prefix] == namespaceURI:
+            return None
+        if namespaceURI == XMLNS.XML:
+            return self._xml_prefix
+        prefix = uris.get(namespaceURI)
+        if prefix is None:
             prefix = self._getUniquePrefix()
             self.setNamespaceAttribute(prefix, namespaceURI)
         return prefix
@@ -910,6 +1005,7 @@ class ElementProxy(Base, MessageInterface):
 
     def setDocument(self, document):
         self.node = document
+        self._uris = self._prefixes = None
 
     def importFromString(self, xmlString):
         doc = self._dom.loadDocument(StringIO(xmlString))
@@ -924,6 +1020,7 @@ class ElementProxy(Base, MessageInterface):
 
     def loadFromString(self, data):
         self.node = self._dom.loadDocument(StringIO(data))
+        self._uris = self._prefixes = None
 
     def canonicalize(self):
         return Canonicalize(self.node)
@@ -940,12 +1037,14 @@ class ElementProxy(Base, MessageInterface):
             qualifiedName = '%s:%s' %(prefix,localName)
         elif namespaceURI is localName is None:
             self.node = self._dom.createDocument(None,None,None)
+            self._uris, self._prefixes, self._nsown = {}, {}, True
             return
         else:
             raise KeyError, 'only support creation of document in %s' %self.reserved_ns[prefix]
 
         document = self._dom.createDocument(nsuri=namespaceURI, qname=qualifiedName, doctype=doctype)
         self.node = document.childNodes[0]
+        self._uris, self._prefixes, self._nsown = {}, {}, True
 
         #set up reserved namespace attributes
         for prefix,nsuri in self.reserved_ns.items():
@@ -953,6 +1052,28 @@ class ElementProxy(Base, MessageInterface):
                 qualifiedName='%s:%s' %(self._xmlns_prefix,prefix),
                 value=nsuri)
 
+    def getEnvelopeTemplate(self):
+        '''Returns a template of the document element, for createEnvelope.
+        '''
+        node = self.node
+        attrs = [ (attr.namespaceURI, attr.nodeName, attr.value)
+                  for attr in node.attributes.values() ]
+        uris, prefixes = self._getNamespaces()
+        return (node.namespaceURI, node.nodeName, tuple(attrs), uris.copy(),
+                prefixes.copy())
+
+    def createEnvelope(self, template):
+        '''Create a document whose element is a copy of the template one,
+        the namespaces in scope are not resolved again.
+        '''
+        namespaceURI, qualifiedName, attrs, uris, prefixes = template
+        document = self._dom.createDocument(nsuri=namespaceURI,
+                                            qname=qualifiedName)
+        node = self.node = document.childNodes[0]
+        for nsuri, qname, value in attrs:
+            node.setAttributeNS(nsuri, qname, value)
+        self._uris, self._prefixes, self._nsown = uris, prefixes, False
+
     #############################################
     #Methods for attributes
     #############################################
@@ -1055,6 +1176,7 @@ class ElementProxy(Base, MessageInterface):
             if prefix:
                 qualifiedName = '%s:%s' %(prefix, localName)
         node = self.createElementNS(namespaceURI, qualifiedName)
+        self._shareNamespaces(node)
         if declare:
             node._setAttributeNS(XMLNS.BASE, 'xmlns:%s' %prefix, namespaceURI)
         self._appendChild(node=node._getNode())
@@ -1066,6 +1188,7 @@ class ElementProxy(Base, MessageInterface):
         if prefix:
             qualifiedName = '%s:%s' %(prefix, localName)
         node = self.createElementNS(namespaceURI, qualifiedName)
+        self._shareNamespaces(node)
         self._insertBefore(newChild=node._getNode(), refChild=refChild._getNode())
         return node
 
@@ -1131,7 +1254,9 @@ class ElementProxy(Base, MessageInterface):
 
 class Collection(UserDict):
     """Helper class for maintaining ordered named collections."""
-    default = lambda self,k: k.name
+    def default(self, k):
+        return k.name
+
     def __init__(self, parent, key=None):
         UserDict.__init__(self)
         self.parent = weakref.ref(parent)
@@ -1160,7 +1285,9 @@ class Collection(UserDict):
 
 class CollectionNS(UserDict):
     """Helper class for maintaining ordered named collections."""
-    default = lambda self,k: k.name
+    def default(self, k):
+        return k.name
+
     def __init__(self, parent, key=None):
         UserDict.__init__(self)
         self.parent = weakref.ref(parent)
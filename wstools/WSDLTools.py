@@ -23,6 +23,13 @@ class WSDLReader:
     # strategy or other optimizations. Because application needs vary 
     # so widely, we don't try to provide any caching by default.
 
+    def __init__(self, cache=None):
+        """cache -- optional ModelCache, loadFromURL then reuses the WSDL
+           it pickled as long as the documents it was built from are
+           unchanged.
+        """
+        self.cache = cache
+
     def loadFromStream(self, stream, name=None):
         """Return a WSDL instance loaded from a stream object."""
         document = DOM.loadDocument(stream)
@@ -36,6 +43,11 @@ class WSDLReader:
 
     def loadFromURL(self, url):
         """Return a WSDL instance loaded from the given url."""
+        if self.cache is not None:
+            return self.cache.load(url, self._loadFromURL)
+        return self._loadFromURL(url)
+
+    def _loadFromURL(self, url):
         document = DOM.loadFromURL(url)
         wsdl = WSDL()
         wsdl.location = url
@@ -413,7 +425,9 @@ class ImportElement(Element):
 
 
 class Types(Collection):
-    default = lambda self,k: k.targetNamespace
+    def default(self, k):
+        return k.targetNamespace
+
     def __init__(self, parent):
         Collection.__init__(self, parent)
         self.documentation = ''
@@ -53,11 +53,13 @@ class SchemaReader:
     
     namespaceToSchema = {}
     
-    def __init__(self, domReader=None, base_url=None):
+    def __init__(self, domReader=None, base_url=None, cache=None):
         """domReader -- class must implement DOMAdapterInterface
            base_url -- base url string
+           cache -- optional ModelCache used by loadFromURL
         """
         self.__base_url = base_url
+        self.cache = cache
         self.__readerClass = domReader
         if not self.__readerClass:
             self.__readerClass = DOMAdapter
@@ -128,16 +130,23 @@ class SchemaReader:
            url -- URL to dereference
            schema -- Optional XMLSchema instance.
         """
-        reader = self.__readerClass()
         if self.__base_url:
             url = basejoin(self.__base_url,url)
 
+        if schema is None and self.cache is not None:
+            schema = self.cache.load(url, self.__loadFromURL)
+        else:
+            schema = self.__loadFromURL(url, schema)
+        self.__setIncludes(schema)
+        self.__setImports(schema)
+        return schema
+
+    def __loadFromURL(self, url, schema=None):
+        reader = self.__readerClass()
         reader.loadFromURL(url)
         schema = schema or XMLSchema()
         schema.setBaseUrl(url)
         schema.load(reader)
-        self.__setIncludes(schema)
-        self.__setImports(schema)
         return schema
 
     def loadFromFile(self, filename):
@@ -960,6 +969,10 @@ class XMLSchemaFake:
         self.targetNamespace = DOM.getAttr(element, 'targetNamespace')
         self.element = element
 
+def _name_key(k): return k.attributes['name']
+def _namespace_key(k): return k.attributes['namespace']
+def _location_key(k): return k.attributes['schemaLocation']
+
 class XMLSchema(XMLSchemaComponent):
     """A schema is a collection of schema components derived from one
        or more schema documents, that is, one or more <schema> element
@@ -1036,9 +1049,8 @@ class XMLSchema(XMLSchemaComponent):
         self.__node = None
         self.targetNamespace = None
         XMLSchemaComponent.__init__(self, parent)
-        f = lambda k: k.attributes['name']
-        ns = lambda k: k.attributes['namespace']
-        sl = lambda k: k.attributes['schemaLocation']
+        # module level key functions, a loaded schema can be pickled
+        f, ns, sl = _name_key, _namespace_key, _location_key
         self.includes = Collection(self, key=sl)
         self.imports = Collection(self, key=ns)
         self.elements = Collection(self, key=f)
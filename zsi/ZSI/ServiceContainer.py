@@ -4,6 +4,7 @@
 '''
 
 import urlparse, types, os, sys, cStringIO as StringIO, thread,re
+import threading, Queue
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from vmw.ZSI import ParseException, FaultFromException, FaultFromZSIException, Fault
 from vmw.ZSI import _copyright, _seqtypes, _get_element_nsuri_name, resolvers
@@ -21,6 +22,7 @@ Functions:
     GetSOAPContext
 
 Classes:
+    ThreadPoolMixIn
     SOAPContext
     NoSuchService
     PostNotSpecified
@@ -30,6 +32,7 @@ Classes:
     SimpleWSResource
     SOAPRequestHandler
     ServiceContainer
+    ThreadPoolServiceContainer
 """
 class NoSuchService(Exception): pass
 class UnknownRequestException(Exception): pass
@@ -141,12 +144,17 @@ def _Dispatch(ps, server, SendResponse, SendFault, post, action, nsdict={}, **kw
         return SendFault(FaultFromException(e, 0, sys.exc_info()[2]), **kw)
 
 
-def AsServer(port=80, services=()):
+def AsServer(port=80, services=(), workers=0, **kw):
     '''port --
        services -- list of service instances
+       workers -- number of worker threads, 0 serves one request at a time.
+       kw -- ThreadPoolServiceContainer keywords (queue_size, timeout)
     '''
     address = ('', port)
-    sc = ServiceContainer(address, services)
+    if workers:
+        sc = ThreadPoolServiceContainer(address, services, workers=workers, **kw)
+    else:
+        sc = ServiceContainer(address, services)
     sc.serve_forever()
 
 
@@ -298,19 +306,24 @@ class WSAResource(ServiceSOAPBinding):
                                                self.headers, soapAction)
 
             try:
-                _Dispatch(ps, self.server, self.send_xml, self.send_fault,
-                    post=post, action=soapAction)
-            except Exception, e:
-                self.send_fault(FaultFromException(e, 0, sys.exc_info()[2]))
-
-            # Clean up after the call
-            if _contexts.has_key(thread_id):
-                del _contexts[thread_id]
+                try:
+                    _Dispatch(ps, self.server, self.send_xml, self.send_fault,
+                        post=post, action=soapAction)
+                except Exception, e:
+                    self.send_fault(FaultFromException(e, 0, sys.exc_info()[2]))
+            finally:
+                # Clean up after the call, worker threads are reused
+                _contexts.pop(thread_id, None)
 
 
 class SOAPRequestHandler(BaseSOAPRequestHandler):
     '''SOAP handler.
     '''
+    def setup(self):
+        # a worker pool server sets the timeout of its requests
+        self.timeout = getattr(self.server, 'request_timeout', self.timeout)
+        BaseSOAPRequestHandler.setup(self)
+
     def do_POST(self):
         '''The POST command.
         action -- SOAPAction(HTTP header) or wsa:Action(SOAP:Header)
@@ -323,15 +336,10 @@ class SOAPRequestHandler(BaseSOAPRequestHandler):
             soapAction = soapAction.strip('\'"')
         post = post.strip('\'"')
         try:
-            ct = self.headers['content-type']
-            if ct.startswith('multipart/'):
-                cid = resolvers.MIMEResolver(ct, self.rfile)
-                xml = cid.GetSOAPPart()
-                ps = ParsedSoap(xml, resolver=cid.Resolve)
-            else:
-                length = int(self.headers['content-length'])
-                xml = self.rfile.read(length)
-                ps = ParsedSoap(xml)
+            xml, resolver = self.read_request()
+            if xml is None:
+                return
+            ps = ParsedSoap(xml, resolver=resolver)
         except ParseException, e:
             self.send_fault(FaultFromZSIException(e))
         except Exception, e:
@@ -345,14 +353,14 @@ class SOAPRequestHandler(BaseSOAPRequestHandler):
                                                self.headers, soapAction)
 
             try:
-                _Dispatch(ps, self.server, self.send_xml, self.send_fault,
-                    post=post, action=soapAction)
-            except Exception, e:
-                self.send_fault(FaultFromException(e, 0, sys.exc_info()[2]))
-
-            # Clean up after the call
-            if _contexts.has_key(thread_id):
-                del _contexts[thread_id]
+                try:
+                    _Dispatch(ps, self.server, self.send_xml, self.send_fault,
+                        post=post, action=soapAction)
+                except Exception, e:
+                    self.send_fault(FaultFromException(e, 0, sys.exc_info()[2]))
+            finally:
+                # Clean up after the call, worker threads are reused
+                _contexts.pop(thread_id, None)
 
     def do_GET(self):
         '''The GET command.
@@ -468,6 +476,90 @@ class ServiceContainer(HTTPServer):
         self._nodes.removeNode(url)
 
 
+class ThreadPoolMixIn:
+    '''Mix-in class handling requests in a fixed set of worker threads.
+    Accepted connections wait in a bounded queue, when it is full the
+    connection is closed rather than letting the backlog grow without
+    limit.
+
+    class variables:
+        workers -- number of worker threads
+        queue_size -- accepted connections waiting for a worker
+        request_timeout -- socket timeout in seconds for each request,
+            None blocks forever.
+        keep_alive -- let the SOAPRequestHandlers keep connections open,
+            an idle one only holds up its worker.
+    '''
+    workers = 10
+    queue_size = 50
+    request_timeout = 60
+    keep_alive = True
+    _workers = ()
+
+    def start_workers(self):
+        self._requests = Queue.Queue(self.queue_size)
+        self._workers = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self.process_request_worker)
+            t.setDaemon(True)
+            t.start()
+            self._workers.append(t)
+
+    def process_request_worker(self):
+        '''Worker thread loop, a None request stops the thread.
+        '''
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                request.settimeout(self.request_timeout)
+                self.finish_request(request, client_address)
+            except:
+                self.handle_error(request, client_address)
+            self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        '''Queue the request for the next idle worker.
+        '''
+        try:
+            self._requests.put_nowait((request, client_address))
+        except Queue.Full:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        for t in self._workers:
+            self._requests.put(None)
+        self._workers = []
+
+
+class ThreadPoolServiceContainer(ThreadPoolMixIn, ServiceContainer):
+    '''ServiceContainer dispatching requests to a pool of worker threads,
+    GetSOAPContext returns the context of the calling worker.
+    '''
+    def __init__(self, server_address, services=[],
+                 RequestHandlerClass=SOAPRequestHandler, workers=10,
+                 queue_size=50, timeout=60):
+        '''server_address --
+           RequestHandlerClass --
+           workers -- number of worker threads
+           queue_size -- accepted connections waiting for a worker
+           timeout -- socket timeout in seconds for each request, None
+               blocks forever.
+        '''
+        self.workers = workers
+        self.queue_size = queue_size
+        self.request_timeout = timeout
+        ServiceContainer.__init__(self, server_address, services,
+                                  RequestHandlerClass)
+        self.start_workers()
+
+    def server_close(self):
+        ThreadPoolMixIn.server_close(self)
+        ServiceContainer.server_close(self)
+
+
 class SimpleWSResource(ServiceSOAPBinding):
 
     def getNode(self, post):
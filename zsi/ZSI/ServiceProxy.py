@@ -7,7 +7,7 @@
 # WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
 # FOR A PARTICULAR PURPOSE.
 
-import weakref, re, os, sys
+import weakref, re, os, sys, cPickle
 from ConfigParser import SafeConfigParser as ConfigParser,\
     NoSectionError, NoOptionError
 from urlparse import urlparse
@@ -16,6 +16,7 @@ from vmw.ZSI import TC
 from vmw.ZSI.client import _Binding
 from vmw.ZSI.generate import commands,containers
 from vmw.ZSI.schema import GED, GTD
+from vmw.ZSI.wstools.ModelCache import ModelCache
 
 import wstools
 
@@ -39,12 +40,14 @@ class ServiceProxy:
            url -- override WSDL SOAP address location
            service -- service name or index
            port -- port name or index
-           cachedir -- where to store generated files
+           cachedir -- where to store generated files, the pickled
+               WSDL object model and the call-info table, a proxy for a
+               WSDL already generated there is built without reading it.
            asdict -- use dicts, else use generated pyclass
            lazy -- use lazy typecode evaluation
            pyclass -- use pyclass_type metaclass adds properties, "new_", "set_,
                "get_" methods for schema element and attribute declarations.
-           force -- regenerate all WSDL code, write over cache.
+           force -- regenerate all WSDL code and call-info, write over cache.
 
         NOTE: all other **kw will be passed to the underlying
         vmw.ZSI.client._Binding constructor.
@@ -56,35 +59,100 @@ class ServiceProxy:
         self._url = url
         self._kw = kw
 
-        # WSDL
-        self._wsdl = wstools.WSDLTools.WSDLReader().loadFromURL(wsdl)
-        self._service = self._wsdl.services[service or 0]
-        self.__doc__ = self._service.documentation
-        self._port = self._service.ports[port or 0]
-        self._name = self._service.name
         self._methods = {}
         self._cachedir = cachedir
         self._lazy = lazy
         self._pyclass = pyclass
         self._force = force
 
+        # WSDL, only needed if the call-info table of the service isn't
+        # saved next to its generated types.
+        self._wsdl = self._service = self._port = None
+        # force rebuilds only this service's entry, the table is shared by
+        # every service of the types module.
+        key = service or 0
+        table = self._load_callinfo(wsdl)
+        if force or not table.has_key(key):
+            reader = wstools.WSDLTools.WSDLReader(cache=ModelCache(cachedir))
+            self._wsdl = reader.loadFromURL(wsdl)
+            self._service = self._wsdl.services[key]
+            self._port = self._service.ports[port or 0]
+            table[key] = self._callinfo_from_wsdl(self._service)
+        self._name, self.__doc__, callinfos = table[key]
+
         # Set up rpc methods for service/port
-        port = self._port
-        binding = port.getBinding()
-        portType = binding.getPortType()
-        for port in self._service.ports:
+        for callinfo in callinfos:
+            method = MethodProxy(self, callinfo)
+            setattr(self, callinfo.methodName, method)
+            self._methods.setdefault(callinfo.methodName, []).append(method)
+
+        self._mod = self._load(wsdl)
+        if self._wsdl is not None:
+            self._save_callinfo(table)
+
+    def _callinfo_from_wsdl(self, service):
+        """Returns the (name, documentation, callinfos) entry of service
+        in the call-info table.
+        """
+        callinfos = []
+        for port in service.ports:
             for item in port.getPortType().operations:
                 try:
                     callinfo = wstools.WSDLTools.callInfoFromWSDL(port, item.name)
                 except:
                     # ignore non soap-1.1  bindings
                     continue
+                callinfos.append(callinfo)
+        return service.name, service.documentation, callinfos
 
-                method = MethodProxy(self, callinfo)
-                setattr(self, item.name, method)
-                self._methods.setdefault(item.name, []).append(method)
+    def _get_callinfo_file(self, types):
+        return '%s_callinfo.pickle' %types[:-len('_types.py')]
 
-        self._mod = self._load(wsdl)
+    def _load_callinfo(self, location):
+        """Returns the call-info table saved for location, a dict
+        mapping a service name or index to (name, documentation,
+        callinfos), empty if location wasn't generated yet.
+        """
+        types = self._get_types(location)
+        if types is None:
+            return {}
+        try:
+            f = open(self._get_callinfo_file(types), 'rb')
+            try:
+                return cPickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return {}
+
+    def _save_callinfo(self, table):
+        """Pickle the call-info table next to the generated types, a table
+        that can't be written is built from the WSDL next time.
+        """
+        name = self._get_callinfo_file(self._types)
+        try:
+            f = open(name, 'wb')
+            try:
+                cPickle.dump(table, f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+        except (EnvironmentError, cPickle.PickleError):
+            if os.path.exists(name): os.remove(name)
+
+    def _get_types(self, location):
+        """Returns the file of the types module generated for location,
+        None if there is none.
+        """
+        cp = ConfigParser()
+        try:
+            cp.readfp(open(os.path.join(self._cachedir, '.cache'), 'r'))
+        except IOError:
+            return None
+
+        section, option = 'TYPES', location.replace(':', '-')
+        if cp.has_section(section) and cp.has_option(section, option):
+            return cp.get(section, option)
+        return None
 
     def _load(self, location):
         """
@@ -126,6 +194,7 @@ class ServiceProxy:
         if os.path.abspath(cachedir) not in sys.path:
             sys.path.append(os.path.abspath(cachedir))
 
+        self._types = types
         mod = os.path.split(types)[-1].rstrip('.py')
         return __import__(mod)
 
@@ -9,10 +9,10 @@ from vmw.ZSI import _copyright, _children, _child_elements, \
     _resolve_prefix, _find_xsi_attr, _find_type, \
     _find_xmlns_prefix, _get_element_nsuri_name, _get_idstr, \
     _Node, EvaluateException, UNICODE_ENCODING, \
-    _valid_encoding, ParseException
+    _valid_encoding, ParseException, _Backtrace, _attrs
 
-from vmw.ZSI.wstools.Namespaces import SCHEMA, SOAP
-from vmw.ZSI.wstools.Utility import SplitQName
+from vmw.ZSI.wstools.Namespaces import SCHEMA, SOAP, XMLNS
+from vmw.ZSI.wstools.Utility import SplitQName, ElementProxy
 from vmw.ZSI.wstools.c14n import Canonicalize
 from vmw.ZSI.wstools.logging import getLogger as _GetLogger
 
@@ -113,7 +113,7 @@ class TypeCode:
             elt -- the DOM element being parsed
             ps -- the ParsedSoap object.
         '''
-        raise EvaluateException("Unimplemented evaluation", ps.Backtrace(elt))
+        raise EvaluateException("Unimplemented evaluation", _Backtrace(ps.Backtrace, elt))
 
     def serialize(self, elt, sw, pyobj, name=None, orig=None, **kw):
         '''
@@ -123,7 +123,7 @@ class TypeCode:
            pyobj -- python object to serialize
 
         '''
-        raise EvaluateException("Unimplemented evaluation", sw.Backtrace(elt))
+        raise EvaluateException("Unimplemented evaluation", _Backtrace(sw.Backtrace, elt))
 
     def text_to_data(self, text, elt, ps):
         '''convert text into typecode specific data.
@@ -132,7 +132,7 @@ class TypeCode:
             elt -- the DOM element being parsed
             ps -- the ParsedSoap object.
         '''
-        raise EvaluateException("Unimplemented evaluation", ps.Backtrace(elt))
+        raise EvaluateException("Unimplemented evaluation", _Backtrace(ps.Backtrace, elt))
 
     def serialize_as_nil(self, elt):
         '''
@@ -153,7 +153,7 @@ class TypeCode:
         if not href:
             if self.minOccurs is 0 or self.nilled(elt, ps): return None
             raise EvaluateException('Required' + tag + ' missing',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return ps.FindLocalHREF(href, elt, 0)
 
     def get_parse_and_errorlist(self):
@@ -187,17 +187,17 @@ class TypeCode:
             (None, name) not in parselist and (ns, name) not in parselist:
                 raise EvaluateException(
                 'Element mismatch (got %s wanted %s) (SOAP encoding namespace)' % \
-                        (name, errorlist), ps.Backtrace(elt))
+                        (name, errorlist), _Backtrace(ps.Backtrace, elt))
             return (ns, name)
 
         # Not a type, check name matches.
         if self.nspname and ns != self.nspname:
             raise EvaluateException('Element NS mismatch (got %s wanted %s)' % \
-                (ns, self.nspname), ps.Backtrace(elt))
+                (ns, self.nspname), _Backtrace(ps.Backtrace, elt))
 
         if self.pname and name != self.pname:
             raise EvaluateException('Element Name mismatch (got %s wanted %s)' % \
-                (name, self.pname), ps.Backtrace(elt))
+                (name, self.pname), _Backtrace(ps.Backtrace, elt))
         return self.checktype(elt, ps)
 
     def checktype(self, elt, ps):
@@ -213,18 +213,18 @@ class TypeCode:
 
         # Parse the QNAME.
         prefix,typeName = SplitQName(typeName)
-        nsdict = ps.GetElementNSdict(elt)
+        nsdict = ps.GetElementNSScope(elt)
         prefix = prefix or ''
 
         try:
             uri = nsdict[prefix]
         except KeyError, ex:
             raise EvaluateException('cannot resolve prefix(%s)'%prefix,
-                ps.Backtrace(elt))
+                _Backtrace(ps.Backtrace, elt))
 
         if uri is None:
             raise EvaluateException('Malformed type attribute (bad NS)',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
 
         #typeName = list[1]
         parselist,errorlist = self.get_parse_and_errorlist()
@@ -234,7 +234,7 @@ class TypeCode:
             return (uri,typeName)
         raise EvaluateException(
                 'Type mismatch (%s namespace) (got %s wanted %s)' % \
-                (uri, typeName, errorlist), ps.Backtrace(elt))
+                (uri, typeName, errorlist), _Backtrace(ps.Backtrace, elt))
 
     def name_match(self, elt):
         '''Simple boolean test to see if we match the element name.
@@ -253,7 +253,7 @@ class TypeCode:
         if _find_nil(elt) not in [ "true",  "1"]: return False
         if self.nillable is False:
             raise EvaluateException('Non-nillable element is NIL',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return True
 
     def simple_value(self, elt, ps, mixed=False):
@@ -264,15 +264,15 @@ class TypeCode:
             mixed -- ignore element content, optional text node
         '''
         if not _valid_encoding(elt):
-            raise EvaluateException('Invalid encoding', ps.Backtrace(elt))
+            raise EvaluateException('Invalid encoding', _Backtrace(ps.Backtrace, elt))
         c = _children(elt)
         if mixed is False:
             if len(c) == 0:
-                raise EvaluateException('Value missing', ps.Backtrace(elt))
+                raise EvaluateException('Value missing', _Backtrace(ps.Backtrace, elt))
             for c_elt in c:
                 if c_elt.nodeType == _Node.ELEMENT_NODE:
                     raise EvaluateException('Sub-elements in value',
-                        ps.Backtrace(c_elt))
+                        _Backtrace(ps.Backtrace, c_elt))
 
         # It *seems* to be consensus that ignoring comments and
         # concatenating the text nodes is the right thing to do.
@@ -407,6 +407,37 @@ class TypeCode:
         return len(self.attribute_typecode_dict) > 0
 
 
+_plain_checks = ('checkname', 'checktype', 'nilled', 'simple_value',
+                 'SimpleHREF')
+_plain_classes = {}
+
+def _is_plain(typecode, elt):
+    '''Can typecode take the text of elt as is: elt has no attributes
+    besides namespace declarations (so no xsi:type, href, nil or
+    encodingStyle), isn't named after a SOAP encoding type and has the
+    expected name.  Never true for typecodes overriding one of the checks
+    this skips.
+    '''
+    if elt.hasAttributes():
+        for attr in _attrs(elt):
+            if attr.namespaceURI != XMLNS.BASE: return False
+    klass = typecode.__class__
+    plain = _plain_classes.get(klass)
+    if plain is None:
+        plain = True
+        for name in _plain_checks:
+            if getattr(klass, name).im_func is not \
+               getattr(TypeCode, name).im_func:
+                plain = False
+        _plain_classes[klass] = plain
+    if not plain: return False
+    ns = elt.namespaceURI
+    if ns == SOAP.ENC: return False
+    if typecode.nspname and ns != typecode.nspname: return False
+    if typecode.pname and elt.localName != typecode.pname: return False
+    return True
+
+
 class SimpleType(TypeCode):
     '''SimpleType -- consist exclusively of a tag, attributes, and a value
     class attributes:
@@ -416,6 +447,13 @@ class SimpleType(TypeCode):
     logger = _GetLogger('vmw.ZSI.TC.SimpleType')
 
     def parse(self, elt, ps):
+        if _is_plain(self, elt):
+            c = elt.childNodes
+            if not c:
+                return self.text_to_data(self.empty_content, elt, ps)
+            if len(c) == 1 and c[0].nodeType == _Node.TEXT_NODE:
+                return self.text_to_data(c[0].data, elt, ps)
+
         self.checkname(elt, ps)
         if len(_children(elt)) == 0:
             href = _find_href(elt)
@@ -428,7 +466,7 @@ class SimpleType(TypeCode):
                 if self.nillable is True:
                     return Nilled
                 raise EvaluateException('Requiredstring missing',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
 
             if href[0] != '#':
                 return ps.ResolveHREF(href, self)
@@ -571,7 +609,7 @@ class Any(TypeCode):
                         return []
                     return None
                 raise EvaluateException('Required Any missing',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
             elt = ps.FindLocalHREF(href, elt)
             (ns,type) = self.checktype(elt, ps)
         if not type and elt.namespaceURI == SOAP.ENC:
@@ -590,7 +628,7 @@ class Any(TypeCode):
             parser = Any.parsemap.get((None,type))
         if not parser:
             raise EvaluateException('''Any can't parse element''',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return parser.parse(elt, ps)
 
     def get_formatted_content(self, pyobj):
@@ -788,13 +826,13 @@ class QName(String):
         '''convert text into typecode specific data.
         '''
         prefix,localName = SplitQName(text)
-        nsdict = ps.GetElementNSdict(elt)
+        nsdict = ps.GetElementNSScope(elt)
         prefix = prefix or ''
         try:
             namespaceURI = nsdict[prefix]
         except KeyError, ex:
             raise EvaluateException('cannot resolve prefix(%s)'%prefix,
-                ps.Backtrace(elt))
+                _Backtrace(ps.Backtrace, elt))
 
         v = (namespaceURI,localName)
         if self.pyclass is not None:
@@ -918,13 +956,13 @@ class Enumeration(String):
         val = String.parse(self, elt, ps)
         if val not in self.choices:
             raise EvaluateException('Value not in enumeration list',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return val
 
     def serialize(self, elt, sw, pyobj, name=None, orig=None, **kw):
         if pyobj not in self.choices:
             raise EvaluateException('Value not in enumeration list',
-                    sw.Backtrace(elt))
+                    _Backtrace(sw.Backtrace, elt))
         String.serialize(self, elt, sw, pyobj, name=name, orig=orig, **kw)
 
 
@@ -975,10 +1013,16 @@ class Integer(SimpleType):
                     v = long(text)
                 except:
                     raise EvaluateException('Unparseable integer',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
         return v
 
     def parse(self, elt, ps):
+        if _is_plain(self, elt):
+            c = elt.childNodes
+            if len(c) == 1 and c[0].nodeType == _Node.TEXT_NODE:
+                v = self.text_to_data(c[0].data, elt, ps)
+                return self.check_range(v, self.type[1], elt, ps)
+
         (ns,type) = self.checkname(elt, ps)
         if self.nilled(elt, ps): return Nilled
         elt = self.SimpleHREF(elt, ps, 'integer')
@@ -988,18 +1032,22 @@ class Integer(SimpleType):
            type = self.type[1]
         elif self.type[1] is not None and type != self.type[1]:
             raise EvaluateException('Integer type mismatch; ' \
-                'got %s wanted %s' % (type,self.type[1]), ps.Backtrace(elt))
+                'got %s wanted %s' % (type,self.type[1]), _Backtrace(ps.Backtrace, elt))
 
         v = self.simple_value(elt, ps)
         v = self.text_to_data(v, elt, ps)
+        return self.check_range(v, type, elt, ps)
 
+    def check_range(self, v, type, elt, ps):
+        '''Return v, or raise if it is out of the range of the type.
+        '''
         (rmin, rmax) = Integer.ranges.get(type, (_ignored, _ignored))
         if rmin != _ignored and v < rmin:
             raise EvaluateException('Underflow, less than ' + repr(rmin),
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         if rmax != _ignored and v > rmax:
             raise EvaluateException('Overflow, greater than ' + repr(rmax),
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return v
 
     def get_formatted_content(self, pyobj):
@@ -1108,7 +1156,7 @@ class Decimal(SimpleType):
             return float(v)
         except:
             raise EvaluateException('Unparseable floating point number',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
 
     def parse(self, elt, ps):
         (ns,type) = self.checkname(elt, ps)
@@ -1120,7 +1168,7 @@ class Decimal(SimpleType):
                 type = tag
             elif tag != (ns,type):
                 raise EvaluateException('Floating point type mismatch; ' \
-                        'got (%s,%s) wanted %s' % (ns,type,tag), ps.Backtrace(elt))
+                        'got (%s,%s) wanted %s' % (ns,type,tag), _Backtrace(ps.Backtrace, elt))
         # Special value?
         if self.nilled(elt, ps): return Nilled
         v = self.simple_value(elt, ps)
@@ -1136,17 +1184,17 @@ class Decimal(SimpleType):
 
         if str(fp).lower() in [ 'inf', '-inf', 'nan', '-nan' ]:
             raise EvaluateException('Floating point number parsed as "' + \
-                    str(fp) + '"', ps.Backtrace(elt))
+                    str(fp) + '"', _Backtrace(ps.Backtrace, elt))
         if fp == 0 and Decimal.zeropat.search(v):
             raise EvaluateException('Floating point number parsed as zero',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         (rtiny, rneg, rpos) = Decimal.ranges.get(type, (None, None, None))
         if rneg and fp < 0 and fp < rneg:
-            raise EvaluateException('Negative underflow', ps.Backtrace(elt))
+            raise EvaluateException('Negative underflow', _Backtrace(ps.Backtrace, elt))
         if rtiny and fp > 0 and fp < rtiny:
-            raise EvaluateException('Positive underflow', ps.Backtrace(elt))
+            raise EvaluateException('Positive underflow', _Backtrace(ps.Backtrace, elt))
         if rpos and fp > 0 and fp > rpos:
-            raise EvaluateException('Overflow', ps.Backtrace(elt))
+            raise EvaluateException('Overflow', _Backtrace(ps.Backtrace, elt))
         return fp
 
     def get_formatted_content(self, pyobj):
@@ -1190,7 +1238,7 @@ class Boolean(SimpleType):
                 v = long(v)
             except:
                 raise EvaluateException('Unparseable boolean',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
 
         if v:
             if self.pyclass is None:
@@ -1245,7 +1293,7 @@ class XML(TypeCode):
             if not href:
                 if self.minOccurs == 0: return None
                 raise EvaluateException('Embedded XML document missing',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
             if href[0] != '#':
                 return ps.ResolveHREF(href, self)
             elt = ps.FindLocalHREF(href, elt)
@@ -1256,10 +1304,10 @@ class XML(TypeCode):
             pass
         if len(c) < self.minOccurs:
             raise EvaluateException('Not enough XML children %d (minOccurs = %d)' % (len(c), self.minOccurs),
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         if self.maxOccurs != UNBOUNDED and len(c) > self.maxOccurs:
             raise EvaluateException('Too many XML children %d (maxOccurs = %d)' % (len(c), self.maxOccurs),
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         if self.copyit:
             c = map(lambda n: n.cloneNode(1), c)
         if self.maxOccurs == 1:
@@ -1296,6 +1344,12 @@ class XML(TypeCode):
             elt.createAppendTextNode(pyobj)
             return
 
+        ## no DOM to import into, append the canonical form, which
+        ## carries the namespace declarations in scope.
+        if not isinstance(elt, ElementProxy):
+            elt.createAppendXML(Canonicalize(pyobj))
+            return
+
         ## grab document and import node, and append it
         doc = elt.getDocument()
         node = doc.importNode(pyobj, deep=1)
@@ -1371,7 +1425,7 @@ class AnyType(TypeCode):
         nspname,pname = _get_element_nsuri_name(elt)
         if nspname != self.nspname or pname != self.pname:
             raise EvaluateException('<anyType> instance is (%s,%s) found (%s,%s)' %(
-                    self.nspname,self.pname,nspname,pname), ps.Backtrace(elt))
+                    self.nspname,self.pname,nspname,pname), _Backtrace(ps.Backtrace, elt))
 
         #locate xsi:type
         prefix, typeName = SplitQName(_find_type(elt))
@@ -1601,7 +1655,7 @@ class Union(SimpleType):
             break
         else:
             raise EvaluateException('No member matches data "%s" (while parsing %s)' % (text, str(self.type)),
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
 
         return pyobj
 
@@ -1695,7 +1749,7 @@ class List(SimpleType):
                 if self.nillable is True:
                     return Nilled
                 raise EvaluateException('Required string missing',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
             if href[0] != '#':
                 return ps.ResolveHREF(href, self)
             elt = ps.FindLocalHREF(href, elt)
@@ -1825,6 +1879,7 @@ from TCtimes import *
 from schema import GTD, GED, WrapImmutable
 from TCcompound import *
 from TCapache import *
+from TCcompiled import compile_typecode
 
 # aliases backwards compatiblity
 _get_type_definition, _get_global_element_declaration, Wrap  = GTD, GED, WrapImmutable
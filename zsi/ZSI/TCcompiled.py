@@ -0,0 +1,322 @@
+#! /usr/bin/env python
+# $Header$
+'''Compiled typecodes.
+
+compile_typecode walks a typecode graph once and installs a specialized
+parse closure on each typecode it knows how to handle, with the field
+tables, pyclass and converters bound as locals.  A closure only takes
+elements without attributes (no xsi:type, href, nil, ...) whose name
+matches, like the plain path of the parse methods; everything else is
+handed to the typecode's own parse method, so the result is always the
+same as the interpretive path.  Typecodes whose class overrides one of
+the checks skipped that way are left as they are.
+
+Likewise a serialize closure, with the fields, accessor and formatter
+bound, writes inline complexTypes and unique simple types of builtin
+values called without keyword arguments, anything else is handed to
+the typecode's own serialize method.
+
+    from vmw.ZSI import TC
+    TC.compile_typecode(ns0.RetrievePropertiesResponse_Dec())
+'''
+
+from vmw.ZSI import _copyright, _Node, _seqtypes, _stringtypes, \
+    EvaluateException, _Backtrace
+from vmw.ZSI.TC import TypeCode, SimpleType, Integer, _is_plain, \
+    _plain_checks
+from vmw.ZSI.TCcompound import ComplexType, Array, _get_type_or_substitute
+
+_ELEMENT_NODE = _Node.ELEMENT_NODE
+_TEXT_NODE = _Node.TEXT_NODE
+_TEXT_NODES = (_Node.TEXT_NODE, _Node.CDATA_SECTION_NODE)
+
+# bound on the element names remembered per complexType, wildcards
+# would otherwise let a message grow the tables without limit.
+_MAX_DISPATCH = 256
+
+# values which can't carry a typecode, attributes or be Nilled
+_PLAIN_TYPES = dict.fromkeys([str, unicode, int, long, float, bool])
+
+
+def compile_typecode(typecode):
+    '''Compile the parsers and serializers of typecode and of every
+    typecode reachable from it, returns typecode.
+    '''
+    _compile(typecode, {})
+    return typecode
+
+def _compile(typecode, seen):
+    # retrieve typecode if it is hidden
+    if callable(typecode): typecode = typecode()
+    if id(typecode) in seen or not isinstance(typecode, TypeCode):
+        return
+    seen[id(typecode)] = typecode
+
+    if isinstance(typecode, ComplexType):
+        for what in typecode._get_ofwhat_index()[0]:
+            _compile(what, seen)
+    elif isinstance(typecode, Array):
+        _compile(typecode.ofwhat, seen)
+
+    _install(typecode, 'parse', _parsers)
+    _install(typecode, 'serialize', _serializers)
+
+def _install(typecode, name, factories):
+    '''Set the name method of typecode to the closure made by the
+    factory of its class method, if there is one.
+    '''
+    if typecode.__dict__.has_key(name):
+        return
+    method = getattr(getattr(typecode.__class__, name), 'im_func', None)
+    for func,factory in factories:
+        if method is func:
+            closure = factory(typecode)
+            if closure is not None:
+                setattr(typecode, name, closure)
+            return
+
+def _overrides(typecode, base, names):
+    '''True if the class of typecode overrides one of the names methods
+    of base.
+    '''
+    klass = typecode.__class__
+    for name in names:
+        if getattr(klass, name).im_func is not getattr(base, name).im_func:
+            return True
+    return False
+
+def _text_value(elt):
+    '''Concatenated text content of elt, None if it contains elements.
+    '''
+    c = elt.childNodes
+    if len(c) == 1 and c[0].nodeType == _TEXT_NODE:
+        return c[0].data
+    text = []
+    for n in c:
+        t = n.nodeType
+        if t in _TEXT_NODES:
+            text.append(n.data)
+        elif t == _ELEMENT_NODE:
+            return None
+    return ''.join(text)
+
+def _simple_parser(typecode):
+    '''SimpleType.parse
+    '''
+    if _overrides(typecode, TypeCode, _plain_checks):
+        return None
+    parse, text_to_data = typecode.parse, typecode.text_to_data
+
+    def simple_parse(elt, ps):
+        if not _is_plain(typecode, elt):
+            return parse(elt, ps)
+        if not elt.childNodes:
+            return text_to_data(typecode.empty_content, elt, ps)
+        text = _text_value(elt)
+        if text is None:
+            return parse(elt, ps)
+        return text_to_data(text, elt, ps)
+    return simple_parse
+
+def _integer_parser(typecode):
+    '''Integer.parse
+    '''
+    if typecode.type is None or \
+       _overrides(typecode, TypeCode, _plain_checks) or \
+       _overrides(typecode, Integer, ('check_range',)):
+        return None
+    parse, text_to_data = typecode.parse, typecode.text_to_data
+    check_range, type = typecode.check_range, typecode.type[1]
+
+    def integer_parse(elt, ps):
+        if not _is_plain(typecode, elt) or not elt.childNodes:
+            return parse(elt, ps)
+        text = _text_value(elt)
+        if text is None:
+            return parse(elt, ps)
+        return check_range(text_to_data(text, elt, ps), type, elt, ps)
+    return integer_parse
+
+def _complex_parser(typecode):
+    '''ComplexType.parse, only for content models dispatched by name
+    or wildcard.
+    '''
+    whats, names, localnames, wildcard, heads, defaults = \
+        typecode._get_ofwhat_index()
+    if heads or defaults or typecode.inorder is True or \
+       typecode.mixed is True or _overrides(typecode, TypeCode, _plain_checks):
+        return None
+
+    parse = typecode.parse
+    ofwhat = typecode.ofwhat
+    holder = ComplexType._DictHolder
+    fields = [ (what, what.aname, what.maxOccurs > 1) for what in whats ]
+
+    # (namespaceURI,localName) --> field, filled in as names are seen
+    dispatch = {}
+    def lookup(key):
+        m = names.get(key)
+        i = localnames.get(key[1])
+        if i is not None and (m is None or i < m): m = i
+        if wildcard is not None and (m is None or wildcard < m):
+            m = wildcard
+        field = None
+        if m is not None: field = fields[m]
+        if len(dispatch) < _MAX_DISPATCH: dispatch[key] = field
+        return field
+
+    def complex_parse(elt, ps):
+        if typecode.ofwhat is not ofwhat or not _is_plain(typecode, elt):
+            return parse(elt, ps)
+
+        pyclass = typecode.pyclass
+        if pyclass:
+            try:
+                pyobj = pyclass()
+            except Exception:
+                return parse(elt, ps)
+        else:
+            pyobj = holder()
+
+        for c_elt in elt.childNodes:
+            if c_elt.nodeType != _ELEMENT_NODE: continue
+            key = (c_elt.namespaceURI, c_elt.localName)
+            if key in dispatch:
+                field = dispatch[key]
+            else:
+                field = lookup(key)
+            if field is None: continue
+
+            what, aname, repeats = field
+            value = what.parse(c_elt, ps)
+            if repeats:
+                attr = getattr(pyobj, aname, None)
+                if attr is not None:
+                    attr.append(value)
+                else:
+                    setattr(pyobj, aname, [value])
+            else:
+                setattr(pyobj, aname, value)
+
+        if isinstance(pyobj, holder):
+            return pyobj.__dict__
+        return pyobj
+    return complex_parse
+
+_parsers = [
+    (ComplexType.parse.im_func, _complex_parser),
+    (Integer.parse.im_func, _integer_parser),
+    (SimpleType.parse.im_func, _simple_parser),
+]
+
+def _simple_serializer(typecode):
+    '''SimpleType.serialize
+    '''
+    if _overrides(typecode, SimpleType,
+                  ('get_name', 'set_attributes', 'serialize_text_node')):
+        return None
+    serialize = typecode.serialize
+    format = typecode.get_formatted_content
+
+    def simple_serialize(elt, sw, pyobj, name=None, orig=None, **kw):
+        if name is not None or orig is not None or kw or \
+           type(pyobj) not in _PLAIN_TYPES or typecode.unique is not True or \
+           typecode.pname is None:
+            return serialize(elt, sw, pyobj, name=name, orig=orig, **kw)
+
+        el = elt.createAppendElement(typecode.nspname, typecode.pname)
+        if typecode.typed is True:
+            typecode.set_attribute_xsi_type(el)
+        text = format(pyobj)
+        if type(text) not in _stringtypes:
+            raise TypeError, 'pyobj must be a formatted string'
+        el.createAppendTextNode(text)
+        return el
+    return simple_serialize
+
+def _complex_serializer(typecode):
+    '''ComplexType.serialize of an inline complexType, without mixed
+    content.
+    '''
+    if typecode.mixed is True or \
+       _overrides(typecode, ComplexType, ('get_name', 'cb')):
+        return None
+
+    serialize, pyclass = typecode.serialize, typecode.pyclass
+    set_attributes = typecode.set_attributes
+    ofwhat = typecode.ofwhat
+    fields = [ (what, what.aname, what.minOccurs == 0, what.maxOccurs > 1)
+               for what in typecode._get_ofwhat_index()[0] ]
+    if pyclass and type(pyclass) is type:
+        accessor = None
+    elif pyclass:
+        accessor = lambda pyobj: pyobj.__dict__.get
+    else:
+        accessor = lambda pyobj: pyobj.get
+
+    def complex_serialize(elt, sw, pyobj, inline=False, name=None, **kw):
+        if name is not None or kw or pyobj is None or \
+           typecode.inline is not True or typecode.ofwhat is not ofwhat or \
+           typecode.pyclass is not pyclass or typecode.pname is None or \
+           (pyclass is None and type(pyobj) is not dict):
+            return serialize(elt, sw, pyobj, inline=inline, name=name, **kw)
+
+        if typecode.mutable is False and sw.Known(pyobj):
+            return
+
+        elem = elt.createAppendElement(typecode.nspname, typecode.pname)
+        set_attributes(elem, pyobj)
+        if typecode.typed is True:
+            typecode.set_attribute_xsi_type(elem)
+
+        if accessor is None:
+            get = lambda aname: getattr(pyobj, aname, None)
+        else:
+            get = accessor(pyobj)
+
+        for what, aname, optional, repeats in fields:
+            v = get(aname)
+            if v is None:
+                if optional:
+                    continue
+                if what.nillable is not True:
+                    raise EvaluateException('Got None for nillable(%s), minOccurs(%d) element (%s,%s), %s' %
+                            (what.nillable, what.minOccurs, what.nspname, what.pname, elem),
+                            _Backtrace(sw.Backtrace, elt))
+
+            if repeats and v is not None:
+                if type(v) not in _seqtypes:
+                    raise EvaluateException('pyobj (%s,%s), aname "%s": maxOccurs %s, expecting a %s' %(
+                         typecode.nspname,typecode.pname,aname,what.maxOccurs,_seqtypes),
+                         _Backtrace(sw.Backtrace, elt))
+                occurs = 0
+                for v2 in v:
+                    occurs += 1
+                    if occurs > what.maxOccurs:
+                        raise EvaluateException('occurances (%d) exceeded maxOccurs(%d) for <%s>' %(
+                                occurs, what.maxOccurs, what.pname),
+                                _Backtrace(sw.Backtrace, elt))
+                    if type(v2) in _PLAIN_TYPES:
+                        what.serialize(elem, sw, v2)
+                    else:
+                        _get_type_or_substitute(what, v2, sw, elt).serialize(
+                            elem, sw, v2)
+                if occurs < what.minOccurs:
+                    raise EvaluateException(\
+                        'occurances(%d) less than minOccurs(%d) for <%s>' %
+                        (occurs, what.minOccurs, what.pname), _Backtrace(sw.Backtrace, elt))
+                continue
+
+            if type(v) in _PLAIN_TYPES:
+                what.serialize(elem, sw, v)
+            else:
+                _get_type_or_substitute(what, v, sw, elt).serialize(elem, sw, v)
+    return complex_serialize
+
+_serializers = [
+    (ComplexType.serialize.im_func, _complex_serializer),
+    (SimpleType.serialize.im_func, _simple_serializer),
+]
+
+
+if __name__ == '__main__': print _copyright
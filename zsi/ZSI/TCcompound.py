@@ -6,7 +6,7 @@
 from vmw.ZSI import _copyright, _children, _child_elements, \
     _inttypes, _stringtypes, _seqtypes, _find_arraytype, _find_href, \
     _find_type, _find_xmlns_prefix, _get_idstr, EvaluateException, \
-    ParseException
+    ParseException, _Backtrace
 
 from TC import _get_element_nsuri_name, \
      _get_xsitype, TypeCode, Any, AnyElement, AnyType, \
@@ -80,6 +80,8 @@ def _get_type_or_substitute(typecode, pyobj, sw, elt):
     # since typecode is created for a single existing pyobj
     # some facets are irrelevant.
     sub = _copy(sub)
+    # a compiled serializer writes the names of the typecode it was made for
+    sub.__dict__.pop('serialize', None)
     sub.nspname = typecode.nspname
     sub.pname = typecode.pname
     sub.aname = typecode.aname
@@ -140,7 +142,7 @@ class ComplexType(TypeCode):
                 raise EvaluateException(\
                     'ComplexType for %s has wrong type(%s), looking for %s' %
                         (self.pname, self.checktype(elt,ps), self.type),
-                                        ps.Backtrace(elt))
+                                        _Backtrace(ps.Backtrace, elt))
             else:
                 #TODO: mabye change MRO to handle this
                 debug and self.logger.debug('delegate to substitute type')
@@ -151,7 +153,7 @@ class ComplexType(TypeCode):
         if href:
             if _children(elt):
                 raise EvaluateException('Struct has content and HREF',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
             elt = ps.FindLocalHREF(href, elt)
         c = _child_elements(elt)
         count = len(c)
@@ -179,74 +181,98 @@ class ComplexType(TypeCode):
         if self.mixed is True:
             setattr(pyobj, self.mixed_aname, self.simple_value(elt,ps, mixed=True))
 
-        # Clone list of kids (we null it out as we process)
-        c, crange = c[:], range(len(c))
-        # Loop over all items we're expecting
-
-        for j,c_elt in [ (j, c[j]) for j in crange if c[j] ]:
-
-            for i,what in [ (i, self.ofwhat[i]) for i in range(len(self.ofwhat)) ]:
-
-                # retrieve typecode if it is hidden
-                if callable(what): what = what()
-
-                # Loop over all available kids
-                # if debug:
-                #     self.logger.debug("what: (%s,%s)", what.nspname, what.pname)
-
-                # Parse value, and mark this one done.
-                # if debug:
-                #     self.logger.debug("child node: (%s,%s)", c_elt.namespaceURI, c_elt.tagName)
-                match = False
-                if what.name_match(c_elt):
-                    match = True
-                    value = what.parse(c_elt, ps)
-                elif isinstance(what,AnyElement):
-                    match = True
-                    value = what.parse(c_elt, ps)
-                else:
-                    # substitutionGroup head must be a global element declaration
-                    # if successful delegate to matching GED
-                    subwhat = _get_substitute_element(what, c_elt, ps)
-                    if subwhat:
-                        match = True
-                        value = subwhat.parse(c_elt, ps)
-
+        whats, names, localnames, wildcard, heads, defaults = \
+            self._get_ofwhat_index()
+        inorder = self.inorder is True
+
+        # Dispatch each kid to the first typecode in ofwhat that takes it:
+        # by element name, wildcard, or as a substitutionGroup member.
+        for j,c_elt in enumerate(c):
+            m = names.get((c_elt.namespaceURI, c_elt.localName))
+            i = localnames.get(c_elt.localName)
+            if i is not None and (m is None or i < m): m = i
+            if wildcard is not None and (m is None or wildcard < m):
+                m = wildcard
+
+            # substitutionGroup head must be a global element declaration
+            # if successful delegate to matching GED
+            subwhat = None
+            for i,what in heads:
+                if m is not None and i >= m: break
+                subwhat = _get_substitute_element(what, c_elt, ps)
+                if subwhat:
                     if debug:
                         self.logger.debug("substitutionGroup: %s", subwhat)
-
-                if match:
-                    if what.maxOccurs > 1:
-                        attr = getattr(pyobj, what.aname, None)
-                        if attr is not None:
-                            attr.append(value)
-                        else:
-                            setattr(pyobj, what.aname, [value])
-                        c[j] = None
-                        continue
-                    else:
-                        setattr(pyobj, what.aname, value)
-                    c[j] = None
+                    m = i
                     break
 
+            # No match; if it was supposed to be here, that's an error.
+            if inorder and j < len(whats) and (m is None or j < m):
+                raise EvaluateException('Out of order complexType',
+                        _Backtrace(ps.Backtrace, c_elt))
+
+            for i,what in defaults:
+                if m is not None and i >= m: break
+                setattr(pyobj, what.aname, what.default)
+
+            if m is None:
                 if debug:
-                    self.logger.debug("no element (%s,%s)", what.nspname, what.pname)
+                    self.logger.debug("no element (%s,%s)",
+                        c_elt.namespaceURI, c_elt.localName)
+                continue
 
-                # No match; if it was supposed to be here, that's an error.
-                if self.inorder is True and i == j:
-                    raise EvaluateException('Out of order complexType',
-                            ps.Backtrace(c_elt))
+            what = whats[m]
+            value = (subwhat or what).parse(c_elt, ps)
+            if what.maxOccurs > 1:
+                attr = getattr(pyobj, what.aname, None)
+                if attr is not None:
+                    attr.append(value)
                 else:
-                    if hasattr(what, 'default'):
-                        setattr(pyobj, what.aname, what.default)
-                    # elif what.minOccurs > 0 and not hasattr(pyobj, what.aname):
-                    #     raise EvaluateException('Element "' + what.aname + '" missing from complexType', ps.Backtrace(elt))
+                    setattr(pyobj, what.aname, [value])
+            else:
+                setattr(pyobj, what.aname, value)
 
         if isinstance(pyobj, ComplexType._DictHolder):
             return pyobj.__dict__
 
         return pyobj
 
+    def _get_ofwhat_index(self):
+        '''Returns the dispatch tables for parse, built from ofwhat on
+        first use and rebuilt whenever ofwhat is replaced:
+            whats -- ofwhat with hidden typecodes revealed
+            names -- (namespaceURI,localName) --> index of first match
+            localnames -- localName --> index of first unqualified match
+            wildcard -- index of first AnyElement, or None
+            heads -- list of (index, GED) possible substitutionGroup heads
+            defaults -- list of (index, typecode) with a default value
+        '''
+        index = self.__dict__.get('_ofwhat_index')
+        if index is not None and index[0] is self.ofwhat:
+            return index[1]
+
+        whats, names, localnames, wildcard, heads, defaults = \
+            [], {}, {}, None, [], []
+        for i,what in enumerate(self.ofwhat):
+            # retrieve typecode if it is hidden
+            if callable(what): what = what()
+            whats.append(what)
+            if isinstance(what, AnyElement):
+                if wildcard is None: wildcard = i
+            elif what.pname is not None:
+                if what.nspname in (None, ''):
+                    localnames.setdefault(what.pname, i)
+                else:
+                    names.setdefault((what.nspname, what.pname), i)
+            if isinstance(what, ElementDeclaration):
+                heads.append((i, what))
+            if hasattr(what, 'default'):
+                defaults.append((i, what))
+
+        index = (whats, names, localnames, wildcard, heads, defaults)
+        self._ofwhat_index = (self.ofwhat, index)
+        return index
+
     def serialize(self, elt, sw, pyobj, inline=False, name=None, **kw):
         if inline or self.inline:
             self.cb(elt, sw, pyobj, name=name, **kw)
@@ -297,7 +323,7 @@ class ComplexType(TypeCode):
                        elem.createAppendTextNode(textContent)
                    else:
                        raise EvaluateException('mixed test content in element (%s,%s) must be a string type' %(
-                           self.nspname,self.pname), sw.Backtrace(elt))
+                           self.nspname,self.pname), _Backtrace(sw.Backtrace, elt))
                else:
                    if debug:
                        self.logger.debug("mixed NO text content in %s",
@@ -311,7 +337,7 @@ class ComplexType(TypeCode):
             pass
         elif not self.inline and self.unique:
             raise EvaluateException('Not inline, but unique makes no sense. No href/id.',
-                sw.Backtrace(elt))
+                _Backtrace(sw.Backtrace, elt))
         elif n is not None:
             self.set_attribute_id(elem, objid)
 
@@ -365,14 +391,14 @@ class ComplexType(TypeCode):
                 if type(v) not in _seqtypes:
                     raise EvaluateException('pyobj (%s,%s), aname "%s": maxOccurs %s, expecting a %s' %(
                          self.nspname,self.pname,what.aname,whatTC.maxOccurs,_seqtypes),
-                         sw.Backtrace(elt))
+                         _Backtrace(sw.Backtrace, elt))
 
                 for v2 in v:
                     occurs += 1
                     if occurs > whatTC.maxOccurs:
                         raise EvaluateException('occurances (%d) exceeded maxOccurs(%d) for <%s>' %(
                                 occurs, whatTC.maxOccurs, what.pname),
-                                sw.Backtrace(elt))
+                                _Backtrace(sw.Backtrace, elt))
 
                     what = _get_type_or_substitute(whatTC, v2, sw, elt)
                     if debug and what is not whatTC:
@@ -389,7 +415,7 @@ class ComplexType(TypeCode):
                 if occurs < whatTC.minOccurs:
                     raise EvaluateException(\
                         'occurances(%d) less than minOccurs(%d) for <%s>' %
-                        (occurs, whatTC.minOccurs, what.pname), sw.Backtrace(elt))
+                        (occurs, whatTC.minOccurs, what.pname), _Backtrace(sw.Backtrace, elt))
 
                 continue
 
@@ -411,7 +437,7 @@ class ComplexType(TypeCode):
 
             raise EvaluateException('Got None for nillable(%s), minOccurs(%d) element (%s,%s), %s' %
                     (what.nillable, what.minOccurs, what.nspname, what.pname, elem),
-                    sw.Backtrace(elt))
+                    _Backtrace(sw.Backtrace, elt))
 
 
     def setDerivedTypeContents(self, extensions=None, restrictions=None):
@@ -539,7 +565,7 @@ class Array(TypeCode):
         if not o: return 0
         if not _offset_pat.match(o):
             raise EvaluateException('Bad offset "' + o + '"',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
         return int(o[1:-1])
 
     def parse_position(self, elt, ps):
@@ -547,10 +573,10 @@ class Array(TypeCode):
         if not o: return None
         if o.find(',') > -1:
             raise EvaluateException('Sorry, no multi-dimensional arrays',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         if not _position_pat.match(o):
             raise EvaluateException('Bad array position "' + o + '"',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return int(o[1:-1])
 
     def parse(self, elt, ps):
@@ -558,11 +584,11 @@ class Array(TypeCode):
         if href:
             if _children(elt):
                 raise EvaluateException('Array has content and HREF',
-                        ps.Backtrace(elt))
+                        _Backtrace(ps.Backtrace, elt))
             elt = ps.FindLocalHREF(href, elt)
         if self.nilled(elt, ps): return Nilled
         if not _find_arraytype(elt) and self.undeclared is False:
-            raise EvaluateException('Array expected', ps.Backtrace(elt))
+            raise EvaluateException('Array expected', _Backtrace(ps.Backtrace, elt))
         t = _find_type(elt)
         if t:
             pass # XXX should check the type, but parsing that is hairy.
@@ -4,7 +4,7 @@
 '''
 import types
 from vmw.ZSI import _copyright, _inttypes, _floattypes, _seqtypes, \
-        EvaluateException
+        EvaluateException, _Backtrace
 from vmw.ZSI.TC import TypeCode, Integer, Decimal
 from vmw.ZSI.wstools.Namespaces import SCHEMA
 
@@ -123,13 +123,13 @@ class IEnumeration(Integer):
         if val not in self.choices:
             raise EvaluateException('Value "' + str(val) + \
                         '" not in enumeration list',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return val
 
     def serialize(self, elt, sw, pyobj, name=None, orig=None, **kw):
         if pyobj not in self.choices:
             raise EvaluateException('Value not in int enumeration list',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         Integer.serialize(self, elt, sw, pyobj, name=name, orig=orig, **kw)
 
 
@@ -171,13 +171,13 @@ class FPEnumeration(FPfloat):
         if val not in self.choices:
             raise EvaluateException('Value "' + str(val) + \
                         '" not in enumeration list',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         return val
 
     def serialize(self, elt, sw, pyobj, name=None, orig=None, **kw):
         if pyobj not in self.choices:
             raise EvaluateException('Value not in int enumeration list',
-                    ps.Backtrace(elt))
+                    _Backtrace(ps.Backtrace, elt))
         Decimal.serialize(self, elt, sw, pyobj, name=name, orig=orig, **kw)
 
 
@@ -3,7 +3,8 @@
 '''Typecodes for dates and times.
 '''
 
-from vmw.ZSI import _copyright, _floattypes, _inttypes, _get_idstr, EvaluateException
+from vmw.ZSI import _copyright, _floattypes, _inttypes, _get_idstr, \
+        EvaluateException, _Backtrace
 from vmw.ZSI.TC import TypeCode, SimpleType
 from vmw.ZSI.wstools.Namespaces import SCHEMA
 import operator, re, time as _time
@@ -155,7 +156,7 @@ class Duration(SimpleType):
             return None
         m = Duration.lex_pattern.match(text)
         if m is None:
-            raise EvaluateException('Illegal duration', ps.Backtrace(elt))
+            raise EvaluateException('Illegal duration', _Backtrace(ps.Backtrace, elt))
         d = m.groupdict()
         if d['T'] and (d['h'] is None and d['m'] is None and d['s'] is None):
             raise EvaluateException('Duration has T without time')
@@ -200,7 +201,7 @@ class Gregorian(SimpleType):
 
         m = self.lex_pattern.match(text)
         if not m:
-            raise EvaluateException('Bad Gregorian: %s' %text, ps.Backtrace(elt))
+            raise EvaluateException('Bad Gregorian: %s' %text, _Backtrace(ps.Backtrace, elt))
         try:
             retval = _dict_to_tuple(m.groupdict())
         except ValueError, e:
@@ -267,24 +267,65 @@ def _valid_encoding(elt):
             return 1
     return 0
 
-def _backtrace(elt, dom):
+def _backtrace(elt, dom, detached={}):
     '''Return a "backtrace" from the given element to the DOM root,
-    in XPath syntax.
+    in XPath syntax.  detached maps elements taken out of their parent
+    to the step they had in it.
     '''
     s = ''
     while elt != dom:
         name, parent = elt.nodeName, elt.parentNode
         if parent is None: break
-        matches = [ c for c in _child_elements(parent)
-                        if c.nodeName == name ]
-        if len(matches) == 1:
-            s = '/' + name + s
-        else:
-            i = matches.index(elt) + 1
-            s = ('/%s[%d]' % (name, i)) + s
+        step = detached.get(elt)
+        if step is None:
+            matches = [ c for c in _child_elements(parent)
+                            if c.nodeName == name ]
+            if len(matches) == 1 or elt not in matches:
+                step = '/' + name
+            else:
+                step = '/%s[%d]' % (name, matches.index(elt) + 1)
+        s = step + s
         elt = parent
     return s
 
+def _in_header(elt):
+    '''Is elt the SOAP Header, or inside it?
+    '''
+    while elt is not None and elt.nodeType == _Node.ELEMENT_NODE:
+        if elt.localName == "Header" and elt.namespaceURI == _SOAP.ENV:
+            return 1
+        elt = elt.parentNode
+    return 0
+
+class _Backtrace(object):
+    '''Element trace of an exception, computed by backtrace(*args) when
+    the exception is formatted, since many are caught and never shown.
+    backtrace and args, which keep the whole tree alive, are dropped once
+    it is computed.
+    '''
+    __slots__ = ('backtrace', 'args', 'trace')
+
+    def __init__(self, backtrace, *args):
+        self.backtrace, self.args, self.trace = backtrace, args, None
+
+    def __str__(self):
+        if self.backtrace is not None:
+            self.trace = self.backtrace(*self.args)
+            self.backtrace = self.args = None
+        return self.trace
+
+    def __repr__(self):
+        return repr(str(self))
+
+def _get_trace(self):
+    trace = self._trace
+    if isinstance(trace, _Backtrace):
+        trace = self._trace = str(trace)
+    return trace
+
+def _set_trace(self, trace):
+    self._trace = trace
+
 def _get_idstr(pyobj):
     '''Python 2.3.x generates a FutureWarning for negative IDs, so
     we use a different prefix character to ensure uniqueness, and
@@ -330,7 +371,9 @@ class ParseException(ZSIException):
         Exception.__init__(self)
         self.str, self.inheader, self.trace = str, inheader, None
         if elt and dom:
-            self.trace = _backtrace(elt, dom)
+            self.trace = _Backtrace(_backtrace, elt, dom)
+
+    trace = property(_get_trace, _set_trace)
 
     def __str__(self):
         if self.trace:
@@ -349,6 +392,8 @@ class EvaluateException(ZSIException):
         Exception.__init__(self)
         self.str, self.trace = str, trace
 
+    trace = property(_get_trace, _set_trace)
+
     def __str__(self):
         if self.trace:
             return self.str + '\n[Element trace: ' + self.trace + ']'
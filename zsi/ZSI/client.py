@@ -11,8 +11,9 @@ from vmw.ZSI.auth import AUTH
 from vmw.ZSI.TC import AnyElement, AnyType, String, TypeCode, _get_global_element_declaration,\
     _get_type_definition
 from vmw.ZSI.TCcompound import Struct
-import base64, httplib, Cookie, types, time, urlparse
+import base64, httplib, Cookie, types, time, urlparse, select, socket, threading
 from vmw.ZSI.address import Address
+from vmw.ZSI.writer import StreamElementProxy
 from vmw.ZSI.wstools.logging import getLogger as _GetLogger
 _b64_encode = base64.encodestring
 
@@ -84,18 +85,117 @@ class _NamedParamCaller:
                    **kw)
 
 
+class ConnectionPool:
+    '''Thread-safe store of idle persistent (HTTP/1.1) connections, keyed
+    by transport class, host:port and transport arguments.  Bindings take
+    a connection before sending a request and give it back once the
+    response has been read.
+    Class data:
+        maxsize -- idle connections kept per key
+        timeout -- seconds an idle connection is kept
+    '''
+    maxsize = 8
+    timeout = 60
+
+    def __init__(self, maxsize=None, timeout=None):
+        if maxsize is not None: self.maxsize = maxsize
+        if timeout is not None: self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def getKey(self, transport, netloc, transdict):
+        '''Return the pool key, None if the connection can't be pooled
+        because transdict holds unhashable values.
+        '''
+        items = transdict.items()
+        items.sort()
+        key = (transport, netloc, tuple(items))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        '''Return a live idle connection for key, or None.
+        '''
+        while 1:
+            self._lock.acquire()
+            try:
+                idle = self._idle.get(key)
+                if not idle: return None
+                conn,released = idle.pop()
+            finally:
+                self._lock.release()
+            if time.time() - released < self.timeout and self._alive(conn):
+                return conn
+            conn.close()
+
+    def put(self, key, conn):
+        '''Give back a connection whose response has been read, it is
+        closed if the server asked to or the pool is full.
+        '''
+        if conn.sock is None:
+            return
+        now, expired = time.time(), []
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            while idle and now - idle[0][1] >= self.timeout:
+                expired.append(idle.pop(0)[0])
+            if len(idle) < self.maxsize:
+                idle.append((conn, now))
+                conn = None
+        finally:
+            self._lock.release()
+        for c in expired: c.close()
+        if conn is not None: conn.close()
+
+    def clear(self):
+        '''Close all idle connections.
+        '''
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for l in idle.values():
+            for conn,released in l: conn.close()
+
+    def _alive(self, conn):
+        '''An idle connection is readable only if the server closed it
+        (or sent something unexpected), either way it can't be reused.
+        '''
+        if conn.sock is None:
+            return False
+        try:
+            return not select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+
+
 class _Binding:
     '''Object that represents a binding (connection) to a SOAP server.
     Once the binding is created, various ways of sending and
     receiving SOAP messages are available.
+    Class data:
+        streaming -- parse SOAP replies from the socket as they arrive,
+            instead of reading them whole first.
+        chunked -- send SOAP requests with chunked transfer-encoding as
+            they are written, instead of writing them whole first.
     '''
+    streaming = False
+    chunked = False
     defaultHttpTransport = httplib.HTTPConnection
     defaultHttpsTransport = httplib.HTTPSConnection
+    defaultWriterClass = StreamElementProxy
+    connectionPool = ConnectionPool()
     logger = _GetLogger('vmw.ZSI.client.Binding')
 
     def __init__(self, nsdict=None, transport=None, url=None, tracefile=None,
                  readerclass=None, writerclass=None, soapaction='',
-                 wsAddressURI=None, sig_handler=None, transdict=None, **kw):
+                 wsAddressURI=None, sig_handler=None, transdict=None,
+                 streaming=None, chunked=None, **kw):
         '''Initialize.
         Keyword arguments include:
             transport -- default use HTTPConnection.
@@ -107,14 +207,23 @@ class _Binding:
             tracefile -- file to dump packet traces
             cert_file, key_file -- SSL data (q.v.)
             readerclass -- DOM reader class
-            writerclass -- DOM writer class, implements MessageInterface
+            writerclass -- DOM writer class, implements MessageInterface.
+                Default is StreamElementProxy, or ElementProxy when
+                messages are signed.
             wsAddressURI -- namespaceURI of WS-Address to use.  By default
             it's not used.
             sig_handler -- XML Signature handler, must sign and verify.
+            streaming -- feed the reply to the reader in pieces as it is
+                received, the raw reply is not kept and ReceiveRaw
+                raises RuntimeError.  Ignored when tracing.
+            chunked -- write the request to the connection in chunks as
+                it is serialized, attachments are read from their files
+                as they are sent.  Ignored when tracing.
             endPointReference -- optional Endpoint Reference.
         '''
         self.data = None
         self.ps = None
+        self._streamed = False
         self.user_headers = []
         self.nsdict = nsdict or {}
         self.transport = transport
@@ -126,10 +235,14 @@ class _Binding:
         self.soapaction = soapaction
         self.wsAddressURI = wsAddressURI
         self.sig_handler = sig_handler
+        if streaming is not None: self.streaming = streaming
+        if chunked is not None: self.chunked = chunked
         self.address = None
         self.endPointReference = kw.get('endPointReference', None)
         self.cookies = Cookie.SimpleCookie()
         self.http_callbacks = {}
+        self.h = None
+        self._pool_key, self._reused, self._body_started = None, False, False
 
         if kw.has_key('auth'):
             self.SetAuth(*kw['auth'])
@@ -225,8 +338,13 @@ class _Binding:
         d.update(self.nsdict)
         d.update(nsdict)
 
-        sw = SoapWriter(nsdict=d, header=True, outputclass=self.writerclass,
-                 encodingStyle=kw.get('encodingStyle'),)
+        writerclass = self.writerclass
+        if writerclass is None and self.sig_handler is None:
+            writerclass = self.defaultWriterClass
+
+        sw = SoapWriter(nsdict=d, header=True, outputclass=writerclass,
+                 encodingStyle=kw.get('encodingStyle'),
+                 canonical=self.sig_handler is not None)
 
         requesttypecode = kw.get('requesttypecode')
         if kw.has_key('_args'): #NamedParamBinding
@@ -286,14 +404,62 @@ class _Binding:
         if issubclass(transport, httplib.HTTPConnection) is False:
             raise TypeError, 'transport must be a HTTPConnection'
 
-        soapdata = str(sw)
-        self.h = transport(netloc, None, **self.transdict)
-        self.h.connect()
+        # a SoapWriter is written to the connection in chunks
+        soapdata = sw
+        if not self.chunked or self.trace:
+            soapdata = str(sw)
+        self._connect(transport, netloc)
         self.boundary = sw.getMIMEBoundary()
         self.startCID = sw.getStartCID()
-        self.SendSOAPData(soapdata, url, soapaction, **kw)
+        try:
+            self.SendSOAPData(soapdata, url, soapaction, **kw)
+        except socket.timeout:
+            raise
+        except (socket.error, httplib.HTTPException):
+            # stale pooled connection, server closed it while idle.  A
+            # chunked body can't be sent again once it was started.
+            if not self._reused or self._body_started: raise
+            self._reconnect()
+            self.SendSOAPData(soapdata, url, soapaction, **kw)
+
+    def _connect(self, transport, netloc):
+        '''Set self.h to a connected transport instance, an idle one from
+        the connectionPool when available.
+        '''
+        pool = self.connectionPool
+        self.h, self._pool_key, self._reused = None, None, False
+        self._body_started = False
+        if pool is not None:
+            self._pool_key = pool.getKey(transport, netloc, self.transdict)
+            if self._pool_key is not None:
+                self.h = pool.get(self._pool_key)
+        if self.h is not None:
+            self._reused = True
+            return
+        self.h = transport(netloc, None, **self.transdict)
+        self.h.connect()
+
+    def _reconnect(self):
+        '''Replace a stale connection with a new one.
+        '''
+        self.h.close()
+        self.h = self.h.__class__(self.h.host, self.h.port, **self.transdict)
+        self.h.connect()
+        self._reused = False
+
+    def _release(self):
+        '''Give the connection back to the pool, the response was read.
+        '''
+        if self._pool_key is not None and self.connectionPool is not None:
+            self.connectionPool.put(self._pool_key, self.h)
+            self.h = None
+        self._pool_key, self._reused = None, False
 
     def SendSOAPData(self, soapdata, url, soapaction, headers={}, **kw):
+        '''Send soapdata, a string or a SoapWriter which is written
+        with chunked transfer-encoding.
+        '''
+        chunked = isinstance(soapdata, SoapWriter)
         # Tracing?
         if self.trace:
             print >>self.trace, "_" * 33, time.ctime(time.time()), "REQUEST:"
@@ -302,7 +468,10 @@ class _Binding:
         url = url or self.url
         request_uri = _get_postvalue_from_absoluteURI(url)
         self.h.putrequest("POST", request_uri)
-        self.h.putheader("Content-Length", "%d" % len(soapdata))
+        if chunked:
+            self.h.putheader("Transfer-Encoding", "chunked")
+        else:
+            self.h.putheader("Content-Length", "%d" % len(soapdata))
         if len(self.boundary) == 0:
             #no attachment
             self.h.putheader("Content-Type", 'text/xml; charset="%s"' %UNICODE_ENCODING)
@@ -331,10 +500,18 @@ class _Binding:
         for header,value in self.user_headers:
             self.h.putheader(header, value)
         self.h.endheaders()
-        self.h.send(soapdata)
+        if chunked:
+            self._body_started = True
+            soapdata.writeMessage(self._sendChunk)
+            self.h.send('0\r\n\r\n')
+        else:
+            self.h.send(soapdata)
 
         # Clear prior receive state.
-        self.data, self.ps = None, None
+        self.data, self.ps, self._streamed = None, None, False
+
+    def _sendChunk(self, data):
+        self.h.send('%x\r\n%s\r\n' %(len(data), data))
 
     def SendSOAPDataHTTPDigestAuth(self, response, soapdata, url, request_uri, soapaction, **kw):
         '''Resend the initial request w/http digest authorization headers.
@@ -375,12 +552,27 @@ class _Binding:
     def ReceiveRaw(self, **kw):
         '''Read a server reply, unconverted to any format and return it.
         '''
-        if self.data: return self.data
+        if self.data is not None: return self.data
+        if self._streamed:
+            raise RuntimeError, 'reply was parsed as it was received, its raw data is not kept'
+        self._receive()
+        self._release()
+        return self.data
+
+    def _receive(self, stream=False):
+        '''Read the status and headers of the server reply, and its body
+        unless stream is true, returns the response.  Interim (100) and
+        digest challenge (401) replies are always read whole.
+        '''
         trace = self.trace
         while 1:
+            # the request was sent, it isn't sent again when there is no
+            # reply since the server may have acted on it.
             response = self.h.getresponse()
             self.reply_code, self.reply_msg, self.reply_headers, self.data = \
-                response.status, response.reason, response.msg, response.read()
+                response.status, response.reason, response.msg, None
+            if not stream or response.status in (100, 401):
+                self.data = response.read()
             if trace:
                 print >>trace, "_" * 33, time.ctime(time.time()), "RESPONSE:"
                 for i in (self.reply_code, self.reply_msg,):
@@ -407,7 +599,7 @@ class _Binding:
             # Horrible internals hack to patch things up.
             self.h._HTTPConnection__state = httplib._CS_REQ_SENT
             self.h._HTTPConnection__response = None
-        return self.data
+        return response
 
     def IsSOAP(self):
         if self.ps: return 1
@@ -419,14 +611,34 @@ class _Binding:
         '''Get back a SOAP message.
         '''
         if self.ps: return self.ps
+        readerclass = readerclass or self.readerclass
+        if self.streaming and self.data is None and not self._streamed \
+            and not self.trace:
+            response = self._receive(stream=True)
+            if response.msg.type == 'text/xml' and response.length != 0:
+                self._streamed = True
+                try:
+                    self.ps = ParsedSoap(response, readerclass=readerclass,
+                                encodingStyle=kw.get('encodingStyle'))
+                except:
+                    # the rest of the reply is unread, drop the connection
+                    self.h.close()
+                    self._release()
+                    raise
+                self._release()
+                if self.sig_handler is not None:
+                    self.sig_handler.verify(self.ps)
+                return self.ps
+            self.data = response.read()
+            self._release()
+
         if not self.IsSOAP():
             raise TypeError(
                 'Response is "%s", not "text/xml"' % self.reply_headers.type)
         if len(self.data) == 0:
             raise TypeError('Received empty response')
 
-        self.ps = ParsedSoap(self.data,
-                        readerclass=readerclass or self.readerclass,
+        self.ps = ParsedSoap(self.data, readerclass=readerclass,
                         encodingStyle=kw.get('encodingStyle'))
 
         if self.sig_handler is not None:
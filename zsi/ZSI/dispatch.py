@@ -3,7 +3,7 @@
 '''Simple CGI dispatching.
 '''
 
-import types, os, sys
+import types, os, sys, cStringIO as StringIO
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from vmw.ZSI import *
 from vmw.ZSI import _child_elements, _copyright, _seqtypes, _find_arraytype, _find_type, resolvers
@@ -185,9 +185,27 @@ def _CGISendFault(f, **kw):
 
 
 class SOAPRequestHandler(BaseHTTPRequestHandler):
-    '''SOAP handler.
+    '''SOAP handler, speaks HTTP/1.1 and keeps connections open between
+    requests when the server has keep_alive set, a server handling one
+    connection at a time would serve nobody else meanwhile.  Otherwise it
+    answers in HTTP/1.0 and closes the connection after each request.
+
+    class variables:
+        timeout -- socket timeout in seconds, None waits forever.
+        keep_alive_timeout -- seconds a kept connection may sit idle (or
+            a request stall) before it is closed, when timeout is None.
     '''
     server_version = 'ZSI/1.1 ' + BaseHTTPRequestHandler.server_version
+    protocol_version = 'HTTP/1.1'
+    timeout = None
+    keep_alive_timeout = 30
+
+    def setup(self):
+        if not getattr(self.server, 'keep_alive', False):
+            self.protocol_version = 'HTTP/1.0'
+        elif self.timeout is None:
+            self.timeout = self.keep_alive_timeout
+        BaseHTTPRequestHandler.setup(self)
 
     def send_xml(self, text, code=200):
         '''Send some XML.
@@ -196,7 +214,9 @@ class SOAPRequestHandler(BaseHTTPRequestHandler):
 
         if text:
             self.send_header('Content-type', 'text/xml; charset="%s"' %UNICODE_ENCODING)
-            self.send_header('Content-Length', str(len(text)))
+        self.send_header('Content-Length', str(len(text)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
 
         self.end_headers()
 
@@ -210,18 +230,61 @@ class SOAPRequestHandler(BaseHTTPRequestHandler):
         '''
         self.send_xml(f.AsSOAP(), code)
 
+    def read_request(self):
+        '''Read the request body, returns (xml, resolver), or (None, None)
+        when a 411 was sent for a request without a body length.  The
+        connection is only kept open once the body, as framed by
+        Content-Length or chunked transfer-encoding, has been consumed; any
+        failure on the way leaves it marked for close.
+        '''
+        keep_alive, self.close_connection = self.close_connection, 1
+        ct = self.headers['content-type']
+        length = self.headers.getheader('content-length')
+        body = None
+        if self.headers.getheader('transfer-encoding', '').lower() == 'chunked':
+            body = self.read_chunked()
+        elif length is not None:
+            body = self.rfile.read(int(length))
+
+        if ct.startswith('multipart/'):
+            f = self.rfile
+            if body is not None:
+                f = StringIO.StringIO(body)
+            cid = resolvers.MIMEResolver(ct, f)
+            xml, resolver = cid.GetSOAPPart(), cid.Resolve
+            if body is None:
+                return xml, resolver
+        elif body is None:
+            self.send_error(411)
+            return None, None
+        else:
+            xml, resolver = body, None
+        self.close_connection = keep_alive
+        return xml, resolver
+
+    def read_chunked(self):
+        '''Read a body sent with chunked transfer-encoding, trailers are
+        skipped.
+        '''
+        chunks = []
+        while 1:
+            size = int(self.rfile.readline().split(';', 1)[0], 16)
+            if size == 0:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        while self.rfile.readline() not in ('\r\n', '\n', ''):
+            pass
+        return ''.join(chunks)
+
     def do_POST(self):
         '''The POST command.
         '''
         try:
-            ct = self.headers['content-type']
-            if ct.startswith('multipart/'):
-                cid = resolvers.MIMEResolver(ct, self.rfile)
-                xml = cid.GetSOAPPart()
-                ps = ParsedSoap(xml, resolver=cid.Resolve)
-            else:
-                length = int(self.headers['content-length'])
-                ps = ParsedSoap(self.rfile.read(length))
+            xml, resolver = self.read_request()
+            if xml is None:
+                return
+            ps = ParsedSoap(xml, resolver=resolver)
         except ParseException, e:
             self.send_fault(FaultFromZSIException(e))
             return
@@ -6,8 +6,9 @@
 from xml.dom import expatbuilder
 from vmw.ZSI import _copyright, _children, _attrs, _child_elements, _stringtypes, \
         _backtrace, EvaluateException, ParseException, _valid_encoding, \
-        _Node, _find_attr, _resolve_prefix
+        _Node, _find_attr, _find_href, _resolve_prefix, _in_header, _Backtrace
 from vmw.ZSI.TC import AnyElement
+from vmw.ZSI.reader import NamespaceScope, DOCUMENT_SCOPE
 import types
 
 from vmw.ZSI.wstools.Namespaces import SOAP, XMLNS
@@ -18,10 +19,84 @@ _find_mu = lambda E: E.getAttributeNS(SOAP.ENV, "mustUnderstand")
 _find_root = lambda E: E.getAttributeNS(SOAP.ENC, "root")
 _find_id = lambda E: _find_attr(E, 'id')
 
+class _DOMBuilder(expatbuilder.ExpatBuilderNS):
+    '''minidom builder rejecting processing instructions and DTDs, which
+    a SOAP message must not contain, as soon as expat reports them.
+    '''
+
+    def pi_handler(self, target, data):
+        raise ParseException('Found processing instruction "<?' + \
+                target + '...>"', _in_header(self.curNode),
+                self.curNode, self.document)
+
+    def start_doctype_decl_handler(self, *args):
+        raise ParseException('Found DTD', 0)
+
+def _parseString(data):
+    return _DOMBuilder().parseString(data)
+
+def _parse(stream):
+    return _DOMBuilder().parseFile(stream)
+
 class DefaultReader:
     """ExpatReaderClass"""
-    fromString = staticmethod(expatbuilder.parseString)
-    fromStream = staticmethod(expatbuilder.parse)
+    rejectsPIs = True
+    fromString = staticmethod(_parseString)
+    fromStream = staticmethod(_parse)
+
+def _path_step(what, name, elt, ps):
+    '''Returns (typecode, match) for the child element name of the
+    ComplexType what, match tests whether an element is one of them.
+    '''
+    index = getattr(what, '_get_ofwhat_index', None)
+    if index is None:
+        raise EvaluateException('No element content for "%s"' %name,
+                _Backtrace(ps.Backtrace, elt))
+    whats, names, localnames = index()[:3]
+    for i,w in enumerate(whats):
+        if getattr(w, 'pname', None) == name: break
+    else:
+        raise EvaluateException('No element "%s" in the content model' %name,
+                _Backtrace(ps.Backtrace, elt))
+
+    def match(c_elt):
+        m = names.get((c_elt.namespaceURI, c_elt.localName))
+        l = localnames.get(c_elt.localName)
+        if l is not None and (m is None or l < m): m = l
+        return m == i
+    return whats[i], match
+
+def _detach_children(elt, match):
+    '''Remove the child elements of elt accepted by match and return
+    (items, positions, counts), they keep their parentNode.  positions[i]
+    is the index of items[i] among the elements of its name, counts the
+    number of elements of each name.  Sibling links of DOM nodes are
+    rebuilt so the rest of the tree doesn't reference the removed elements.
+    '''
+    items, positions, counts, rest = [], [], {}, []
+    for c in _children(elt):
+        if c.nodeType != _Node.ELEMENT_NODE:
+            rest.append(c)
+            continue
+        n = counts[c.nodeName] = counts.get(c.nodeName, 0) + 1
+        if match(c):
+            items.append(c)
+            positions.append(n)
+        else:
+            rest.append(c)
+    if not items:
+        return items, positions, counts
+    elt.childNodes[:] = rest
+    if hasattr(items[0], 'nextSibling'):
+        previous = None
+        for c in rest:
+            c.previousSibling = previous
+            if previous is not None: previous.nextSibling = c
+            previous = c
+        if previous is not None: previous.nextSibling = None
+        for c in items:
+            c.previousSibling = c.nextSibling = None
+    return items, positions, counts
 
 class ParsedSoap:
     '''A Parsed SOAP object.
@@ -29,8 +104,12 @@ class ParsedSoap:
         Instance data:
             reader -- the DOM reader
             dom -- the DOM object
-            ns_cache -- dictionary (by id(node)) of namespace dictionaries
-            id_cache -- dictionary (by XML ID attr) of elements
+            ns_cache -- dictionary (by node) of NamespaceScopes, for
+                nodes that can't carry their own
+            id_cache -- dictionary (by XML ID attr) of elements, filled
+                in one sweep by the first FindLocalHREF
+            detached -- dictionary (by node) of the backtrace steps of
+                elements iterparse failed to parse
             envelope -- the node holding the SOAP Envelope
             header -- the node holding the SOAP Header (or None)
             body -- the node holding the SOAP Body
@@ -46,7 +125,11 @@ class ParsedSoap:
         Keyword arguments:
             trailers -- allow trailer elments (default is zero)
             resolver -- function (bound method) to resolve URI's
-            readerclass -- factory class to create a reader
+            readerclass -- factory class to create a reader, DefaultReader
+                builds a minidom tree, vmw.ZSI.reader.ExpatReader a compact
+                read-only node tree.  Both reject processing instructions
+                and DTDs while parsing (rejectsPIs), the tree of any other
+                reader is searched for them afterwards.
             keepdom -- do not release the DOM
             envelope -- look for a SOAP envelope.
         """
@@ -68,14 +151,13 @@ class ParsedSoap:
             #    str(e.__class__) + "): " + str(e), 0)
             raise
 
-        self.ns_cache = {
-            id(self.dom): {
-                'xml': XMLNS.XML,
-                'xmlns': XMLNS.BASE,
-                '': ''
-            }
-        }
+        if not getattr(self.reader, 'rejectsPIs', False):
+            self._check_for_pi_nodes(_children(self.dom))
+
+        self.ns_cache = { self.dom: DOCUMENT_SCOPE }
         self.trailers, self.resolver, self.id_cache = trailers, resolver, {}
+        self._header_ids = self._duplicate_ids = None
+        self.detached = {}
 
         # Exactly one child element
         c = [ E for E in _children(self.dom)
@@ -116,7 +198,6 @@ class ParsedSoap:
         if elt.localName == "Header" \
         and elt.namespaceURI == SOAP.ENV:
             self._check_for_legal_children("Header", elt)
-            self._check_for_pi_nodes(_children(elt), 1)
             self.header = c.pop(0)
             self.header_elements = _child_elements(self.header)
         else:
@@ -137,7 +218,6 @@ class ParsedSoap:
                         elt.localName + \
                         '" element, not Body', 0, elt, self.dom)
         self._check_for_legal_children("Body", elt, 0)
-        self._check_for_pi_nodes(_children(elt), 0)
         self.body = elt
         if not _valid_encoding(self.body):
             raise ParseException("Body has invalid encoding", 0)
@@ -190,7 +270,6 @@ class ParsedSoap:
         rootid = id(self.body_root)
         self.data_elements = [ E for E in _child_elements(self.body)
                                 if id(E) != rootid ]
-        self._check_for_pi_nodes(self.data_elements, 0)
 
     def __del__(self):
         try:
@@ -216,8 +295,9 @@ class ParsedSoap:
                 raise ParseException('Unqualified element "' + \
                         n.nodeName + '" in ' + name, inheader, elt, self.dom)
 
-    def _check_for_pi_nodes(self, list, inheader):
-        '''Raise an exception if any of the list descendants are PI nodes.
+    def _check_for_pi_nodes(self, list):
+        '''Raise an exception if any of the list descendants are PI nodes
+        or DTDs.
         '''
         list = list[:]
         while list:
@@ -225,18 +305,17 @@ class ParsedSoap:
             t = elt.nodeType
             if t == _Node.PROCESSING_INSTRUCTION_NODE:
                 raise ParseException('Found processing instruction "<?' + \
-                        elt.nodeName + '...>"',
-                        inheader, elt.parentNode, self.dom)
-            elif t == _Node.DOCUMENT_TYPE_NODE:
-                raise ParseException('Found DTD', inheader,
+                        elt.nodeName + '...>"', _in_header(elt.parentNode),
                         elt.parentNode, self.dom)
+            elif t == _Node.DOCUMENT_TYPE_NODE:
+                raise ParseException('Found DTD', 0)
             list += _children(elt)
 
     def Backtrace(self, elt):
         '''Return a human-readable "backtrace" from the document root to
         the specified element.
         '''
-        return _backtrace(elt, self.dom)
+        return _backtrace(elt, self.dom, self.detached)
 
     def FindLocalHREF(self, href, elt, headers=1):
         '''Find a local HREF in the data elements.
@@ -244,25 +323,40 @@ class ParsedSoap:
         if href[0] != '#':
             raise EvaluateException(
                 'Absolute HREF ("%s") not implemented' % href,
-                self.Backtrace(elt))
+                _Backtrace(self.Backtrace, elt))
         frag = href[1:]
-        # Already found?
+        if self._header_ids is None:
+            self._index_ids()
         e = self.id_cache.get(frag)
-        if e: return e
-        # Do a breadth-first search, in the data first.  Most likely
-        # to find multi-ref targets shallow in the data area.
-        list = self.data_elements[:] + [self.body_root]
-        if headers: list.extend(self.header_elements)
-        while list:
-            e = list.pop()
-            if e.nodeType == _Node.ELEMENT_NODE:
-                nodeid = _find_id(e)
-                if nodeid:
-                    self.id_cache[nodeid] = e
-                    if nodeid == frag: return e
-            list += _children(e)
-        raise EvaluateException("""Can't find node for HREF '%s'""" % href,
-                self.Backtrace(elt))
+        if e is None or (not headers and self._header_ids.has_key(frag)):
+            raise EvaluateException("""Can't find node for HREF '%s'""" % href,
+                    _Backtrace(self.Backtrace, elt))
+        if self._duplicate_ids.has_key(frag):
+            raise EvaluateException('Duplicate id for HREF "%s"' % href,
+                    _Backtrace(self.Backtrace, elt))
+        return e
+
+    def _index_ids(self):
+        '''Fill id_cache with every element carrying an XML ID attr in the
+        data elements, body root and headers, remembering the ids found
+        in the headers and the ids found more than once.
+        '''
+        ids, header_ids, duplicates = self.id_cache, {}, {}
+        body = getattr(self, 'data_elements', []) + [self.body_root]
+        for list,inheader in ((body, False),
+                              (getattr(self, 'header_elements', []), True)):
+            list = list[:]
+            while list:
+                e = list.pop()
+                if e.hasAttributes():
+                    nodeid = _find_id(e)
+                    if nodeid:
+                        if ids.has_key(nodeid): duplicates[nodeid] = 1
+                        ids[nodeid] = e
+                        if inheader: header_ids[nodeid] = 1
+                list += [ n for n in _children(e)
+                          if n.nodeType == _Node.ELEMENT_NODE ]
+        self._header_ids, self._duplicate_ids = header_ids, duplicates
 
     def ResolveHREF(self, uri, tc, **keywords):
         r = getattr(tc, 'resolver', self.resolver)
@@ -288,20 +382,45 @@ class ParsedSoap:
 
     def GetElementNSdict(self, elt):
         '''Get a dictionary of all the namespace attributes for the indicated
-        element.  The dictionaries are cached, and we recurse up the tree
-        as necessary.
+        element.  The dictionary is a copy the caller may modify, use
+        GetElementNSScope to only resolve prefixes.
+        '''
+        return self.GetElementNSScope(elt).copy()
+
+    def GetElementNSScope(self, elt):
+        '''Get the read-only NamespaceScope of the indicated element.  The
+        ExpatReader records the scopes while parsing, for other readers
+        they are built going up the tree as far as the nearest known one,
+        and kept on the nodes (or in ns_cache if they don't take it).
         '''
-        d = self.ns_cache.get(id(elt))
-        if not d:
-            if elt != self.dom: d = self.GetElementNSdict(elt.parentNode)
+        cache = self.ns_cache
+        nodes = []
+        while elt is not None:
+            scope = getattr(elt, 'nsscope', None)
+            if scope is None: scope = cache.get(elt)
+            if scope is not None: break
+            nodes.append(elt)
+            elt = elt.parentNode
+        else:
+            scope = DOCUMENT_SCOPE
+
+        for elt in reversed(nodes):
+            declared = None
             for a in _attrs(elt):
                 if a.namespaceURI == XMLNS.BASE:
+                    if declared is None: declared = {}
+                    # xmlns="" undeclares, same as no default namespace
                     if a.localName == "xmlns":
-                        d[''] = a.nodeValue
+                        declared[''] = a.nodeValue or ''
                     else:
-                        d[a.localName] = a.nodeValue
-            self.ns_cache[id(elt)] = d
-        return d.copy()
+                        declared[a.localName] = a.nodeValue
+            if declared:
+                scope = NamespaceScope(declared, scope)
+            try:
+                elt.nsscope = scope
+            except (AttributeError, TypeError):
+                cache[elt] = scope
+        return scope
 
     def GetDomAndReader(self):
         '''Returns a tuple containing the dom and reader objects. (dom, reader)
@@ -325,6 +444,55 @@ class ParsedSoap:
         if type(how) == types.ClassType: how = how.typecode
         return how.parse(self.body_root, self)
 
+    def iterparse(self, how, path):
+        '''Parse the elements found along path under the serialization
+        root, yielding them one at a time.  Each element is taken out of
+        the tree before it is parsed, so once the caller drops the value
+        nothing keeps it alive (unless it carries an id, the ids of the
+        message are indexed first so HREFs between items resolve).
+
+        The path is resolved against the declared content models: an
+        xsi:type on an element along it doesn't change the model of the
+        next step, and elements only allowed by a wildcard (<any>) can't
+        be named.  HREFs of the elements along the path are followed.
+        Parameters:
+            how -- typecode of the serialization root, a ComplexType
+            path -- element names from the root down to the repeated
+                element, e.g. ('returnval',)
+        '''
+        if type(how) == types.ClassType: how = how.typecode
+        how.checkname(self.body_root, self)
+        elts, what = [self.body_root], how
+        for i,name in enumerate(path):
+            what, match = _path_step(what, name, self.body_root, self)
+            if i < len(path) - 1:
+                children = []
+                for E in elts:
+                    for c in _child_elements(E):
+                        if not match(c): continue
+                        href = _find_href(c)
+                        if href: c = self.FindLocalHREF(href, c)
+                        children.append(c)
+                elts = children
+                continue
+            if self._header_ids is None:
+                self._index_ids()
+            for E in elts:
+                items, positions, counts = _detach_children(E, match)
+                for j in xrange(len(items)):
+                    c_elt, items[j] = items[j], None
+                    try:
+                        pyobj = what.parse(c_elt, self)
+                    except:
+                        # keep the step of c_elt for the trace of the error
+                        name = c_elt.nodeName
+                        if counts[name] > 1:
+                            name = '%s[%d]' % (name, positions[j])
+                        self.detached[c_elt] = '/' + name
+                        raise
+                    c_elt = None
+                    yield pyobj
+
     def WhatMustIUnderstand(self):
         '''Return a list of (uri,localname) tuples for all elements in the
         header that have mustUnderstand set.
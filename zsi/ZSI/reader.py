@@ -0,0 +1,476 @@
+#! /usr/bin/env python
+# $Header$
+'''Compact SOAP message reader.
+
+Builds a light, read-only node tree straight from expat events in a
+single pass.  The nodes implement the subset of the DOM interface used
+by ParsedSoap and the typecodes (childNodes, parentNode, attributes,
+getAttributeNS, ...), at a fraction of the cost of a minidom tree.
+Each element also carries the NamespaceScope in effect on it, which
+ParsedSoap.GetElementNSScope returns as is.
+
+    from vmw.ZSI.reader import ExpatReader
+    ps = ParsedSoap(xml, readerclass=ExpatReader)
+'''
+
+from xml.dom import Node as _Node
+from xml.parsers import expat
+import threading
+
+from vmw.ZSI import _copyright, _in_header, ParseException
+from vmw.ZSI.wstools.Namespaces import SCHEMA, XMLNS
+
+
+class NamespaceScope(object):
+    '''Immutable namespace scope, the prefixes declared on one element
+    and the scope enclosing it.  Elements declaring nothing share the
+    scope of their parent, so a lookup walks one link per declaring
+    ancestor at most.  Reads like a dictionary of prefix --> URI, the
+    default namespace under '', copy returns a flattened dictionary.
+    '''
+    __slots__ = ('parent', 'declared')
+
+    def __init__(self, declared, parent=None):
+        self.parent = parent
+        self.declared = declared
+
+    def get(self, prefix, default=None):
+        scope = self
+        while scope is not None:
+            d = scope.declared
+            if prefix in d: return d[prefix]
+            scope = scope.parent
+        return default
+
+    def __getitem__(self, prefix):
+        v = self.get(prefix, _missing)
+        if v is _missing:
+            raise KeyError, prefix
+        return v
+
+    def __contains__(self, prefix):
+        return self.get(prefix, _missing) is not _missing
+    has_key = __contains__
+
+    def copy(self):
+        chain, scope = [], self
+        while scope is not None:
+            chain.append(scope.declared)
+            scope = scope.parent
+        d = {}
+        for declared in reversed(chain):
+            d.update(declared)
+        return d
+
+    def keys(self):
+        return self.copy().keys()
+
+    def items(self):
+        return self.copy().items()
+
+    def values(self):
+        return self.copy().values()
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    def __len__(self):
+        return len(self.copy())
+
+    def __eq__(self, other):
+        if isinstance(other, NamespaceScope):
+            other = other.copy()
+        return self.copy() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<%s.NamespaceScope %r>' %(__name__, self.copy())
+
+_missing = object()
+
+# scope of the document node, the prefixes bound by definition
+DOCUMENT_SCOPE = NamespaceScope({'xml': XMLNS.XML, 'xmlns': XMLNS.BASE, '': ''})
+
+
+class _NamedNodeMap(object):
+    '''Read-only view of an element's attribute nodes.
+    '''
+    __slots__ = ('_attrs',)
+
+    def __init__(self, attrs):
+        self._attrs = attrs
+
+    def __len__(self):
+        return len(self._attrs)
+
+    def __getitem__(self, key):
+        node = self.get(key)
+        if node is None:
+            raise KeyError, key
+        return node
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        if type(key) is tuple:
+            return self.getNamedItemNS(*key) or default
+        return self.getNamedItem(key) or default
+
+    def getNamedItem(self, name):
+        for a in self._attrs:
+            if a.nodeName == name: return a
+        return None
+
+    def getNamedItemNS(self, namespaceURI, localName):
+        for a in self._attrs:
+            if a.localName == localName and a.namespaceURI == namespaceURI:
+                return a
+        return None
+
+    def item(self, index):
+        try:
+            return self._attrs[index]
+        except IndexError:
+            return None
+
+    def keys(self):
+        return [ a.nodeName for a in self._attrs ]
+
+    def keysNS(self):
+        return [ (a.namespaceURI, a.localName) for a in self._attrs ]
+
+    def values(self):
+        return list(self._attrs)
+
+    def items(self):
+        return [ (a.nodeName, a.value) for a in self._attrs ]
+
+    def itemsNS(self):
+        return [ ((a.namespaceURI, a.localName), a.value) for a in self._attrs ]
+
+    length = property(__len__)
+
+_empty_attributes = _NamedNodeMap(())
+
+
+class _Attr(object):
+    '''Attribute node.
+    '''
+    __slots__ = ('namespaceURI', 'localName', 'prefix', 'nodeName', 'value')
+    nodeType = _Node.ATTRIBUTE_NODE
+    specified = True
+    childNodes = ()
+    parentNode = None
+    attributes = None
+
+    def __init__(self, namespaceURI, localName, prefix, nodeName, value):
+        self.namespaceURI = namespaceURI
+        self.localName = localName
+        self.prefix = prefix
+        self.nodeName = nodeName
+        self.value = value
+
+    name = property(lambda self: self.nodeName)
+    nodeValue = property(lambda self: self.value)
+
+    def __repr__(self):
+        return '<%s.Attr %s=%r>' %(__name__, self.nodeName, self.value)
+
+
+class _Text(object):
+    '''Character data; CDATA sections are folded into text nodes.
+    '''
+    __slots__ = ('parentNode', 'data')
+    nodeType = _Node.TEXT_NODE
+    nodeName = '#text'
+    childNodes = ()
+    attributes = None
+    namespaceURI = localName = prefix = None
+
+    def __init__(self, parentNode, data):
+        self.parentNode = parentNode
+        self.data = data
+
+    nodeValue = property(lambda self: self.data)
+
+    def cloneNode(self, deep=0):
+        return _Text(None, self.data)
+
+    def __repr__(self):
+        return '<%s.Text %r>' %(__name__, self.data[:20])
+
+
+class _Element(object):
+    '''Element node.  childNodes is an empty tuple until the first child
+    is appended, and the attribute nodes are kept in a tuple.
+    '''
+    __slots__ = ('parentNode', 'childNodes', 'namespaceURI', 'localName',
+                 'prefix', 'nodeName', '_attrs', 'nsscope')
+    nodeType = _Node.ELEMENT_NODE
+    nodeValue = None
+
+    def __init__(self, parentNode, namespaceURI, localName, prefix,
+                 nodeName, attrs=(), nsscope=DOCUMENT_SCOPE):
+        self.parentNode = parentNode
+        self.childNodes = ()
+        self.namespaceURI = namespaceURI
+        self.localName = localName
+        self.prefix = prefix
+        self.nodeName = nodeName
+        self._attrs = attrs
+        self.nsscope = nsscope
+
+    tagName = property(lambda self: self.nodeName)
+
+    def _get_attributes(self):
+        if self._attrs:
+            return _NamedNodeMap(self._attrs)
+        return _empty_attributes
+    attributes = property(_get_attributes)
+
+    def _get_ownerDocument(self):
+        node = self
+        while node.parentNode is not None:
+            node = node.parentNode
+        return node
+    ownerDocument = property(_get_ownerDocument)
+
+    firstChild = property(lambda self: (self.childNodes or (None,))[0])
+    lastChild = property(lambda self: (self.childNodes or (None,))[-1])
+
+    def hasAttributes(self):
+        return len(self._attrs) > 0
+
+    def hasChildNodes(self):
+        return len(self.childNodes) > 0
+
+    def getAttribute(self, name):
+        for a in self._attrs:
+            if a.nodeName == name: return a.value
+        return ''
+
+    def getAttributeNode(self, name):
+        for a in self._attrs:
+            if a.nodeName == name: return a
+        return None
+
+    def hasAttribute(self, name):
+        return self.getAttributeNode(name) is not None
+
+    def getAttributeNS(self, namespaceURI, localName):
+        for a in self._attrs:
+            if a.localName == localName and a.namespaceURI == namespaceURI:
+                return a.value
+        return ''
+
+    def getAttributeNodeNS(self, namespaceURI, localName):
+        for a in self._attrs:
+            if a.localName == localName and a.namespaceURI == namespaceURI:
+                return a
+        return None
+
+    def hasAttributeNS(self, namespaceURI, localName):
+        return self.getAttributeNodeNS(namespaceURI, localName) is not None
+
+    def cloneNode(self, deep=0):
+        clone = _Element(None, self.namespaceURI, self.localName,
+                         self.prefix, self.nodeName, self._attrs,
+                         self.nsscope)
+        if deep and self.childNodes:
+            clone.childNodes = [ c.cloneNode(deep) for c in self.childNodes ]
+            for c in clone.childNodes: c.parentNode = clone
+        return clone
+
+    def __repr__(self):
+        return '<%s.Element %s>' %(__name__, self.nodeName)
+
+
+class _Document(object):
+    '''Document node, root of the tree.
+    '''
+    __slots__ = ('childNodes',)
+    nodeType = _Node.DOCUMENT_NODE
+    nodeName = '#document'
+    nodeValue = None
+    parentNode = None
+    attributes = None
+    namespaceURI = localName = prefix = None
+    nsscope = DOCUMENT_SCOPE
+
+    def __init__(self):
+        self.childNodes = []
+
+    def _get_documentElement(self):
+        for c in self.childNodes:
+            if c.nodeType == _Node.ELEMENT_NODE: return c
+        return None
+    documentElement = property(_get_documentElement)
+
+    def __repr__(self):
+        return '<%s.Document>' %__name__
+
+
+class _Builder:
+    '''Drives an expat parser, appending nodes to the tree as the
+    events arrive.  Data may be fed in pieces.  Processing instructions
+    and DTDs, which a SOAP message must not contain, raise ParseException
+    as soon as they are seen.
+        strings -- intern table of names, namespace URIs and values
+        names -- expat name --> (uri, local, prefix, qname) cache
+        values -- (namespaceURI, localName) of the attributes whose
+            values are interned
+    '''
+
+    def __init__(self, strings=None, names=None, values=()):
+        if strings is None: strings = {}
+        if names is None: names = {}
+        self.document = self.current = _Document()
+        self._text = []
+        self._nsattrs = []
+        self._nsdecls = {}
+        self._strings = strings
+        self._names = names
+        self._values = values
+        self._parser = p = expat.ParserCreate(namespace_separator=' ',
+                                              intern=strings)
+        p.namespace_prefixes = True
+        p.ordered_attributes = True
+        p.buffer_text = True
+        p.StartElementHandler = self.start_element
+        p.EndElementHandler = self.end_element
+        p.CharacterDataHandler = self._text.append
+        p.StartNamespaceDeclHandler = self.start_namespace_decl
+        p.ProcessingInstructionHandler = self.processing_instruction
+        p.StartDoctypeDeclHandler = self.start_doctype_decl
+
+    def feed(self, data, isfinal=False):
+        self._parser.Parse(data, isfinal)
+
+    def _split_name(self, name):
+        '''"uri local prefix" triplet --> (uri, local, prefix, qname)
+        '''
+        s = self._strings.setdefault
+        parts = [ s(p, p) for p in name.split(' ') ]
+        if len(parts) == 3:
+            uri, local, prefix = parts
+            v = (uri, local, prefix, '%s:%s' %(prefix, local))
+        elif len(parts) == 2:
+            v = (parts[0], parts[1], None, parts[1])
+        else:
+            v = (None, name, None, name)
+        self._names[name] = v
+        return v
+
+    def _flush_text(self):
+        parent = self.current
+        node = _Text(parent, ''.join(self._text))
+        del self._text[:]
+        c = parent.childNodes
+        if c:
+            c.append(node)
+        else:
+            parent.childNodes = [node]
+
+    def start_namespace_decl(self, prefix, uri):
+        uri = self._strings.setdefault(uri or '', uri or '')
+        self._nsdecls[prefix or ''] = uri
+        if prefix:
+            attr = _Attr(XMLNS.BASE, prefix, 'xmlns', 'xmlns:' + prefix, uri)
+        else:
+            attr = _Attr(XMLNS.BASE, 'xmlns', None, 'xmlns', uri)
+        self._nsattrs.append(attr)
+
+    def start_element(self, name, attributes):
+        if self._text: self._flush_text()
+        names = self._names
+        uri, local, prefix, qname = names.get(name) or self._split_name(name)
+
+        attrs = ()
+        if attributes or self._nsattrs:
+            attrs = self._nsattrs
+            self._nsattrs = []
+            values = self._values
+            for i in xrange(0, len(attributes), 2):
+                auri, alocal, aprefix, aqname = names.get(attributes[i]) or \
+                    self._split_name(attributes[i])
+                value = attributes[i+1]
+                if values and (auri, alocal) in values:
+                    value = self._strings.setdefault(value, value)
+                attrs.append(_Attr(auri, alocal, aprefix, aqname, value))
+            attrs = tuple(attrs)
+
+        parent = self.current
+        nsscope = parent.nsscope
+        if self._nsdecls:
+            nsscope = NamespaceScope(self._nsdecls, nsscope)
+            self._nsdecls = {}
+        node = _Element(parent, uri, local, prefix, qname, attrs, nsscope)
+        c = parent.childNodes
+        if c:
+            c.append(node)
+        else:
+            parent.childNodes = [node]
+        self.current = node
+
+    def end_element(self, name):
+        if self._text: self._flush_text()
+        self.current = self.current.parentNode
+
+    def processing_instruction(self, target, data):
+        raise ParseException('Found processing instruction "<?' + \
+                target + '...>"', _in_header(self.current),
+                self.current, self.document)
+
+    def start_doctype_decl(self, *args):
+        raise ParseException('Found DTD', 0)
+
+
+class ExpatReader:
+    '''Reader class for ParsedSoap, builds the compact node tree.  Names,
+    namespace URIs and the values of the internValues attributes are
+    interned in a table shared by all messages parsed in a thread, so
+    the nodes of every tree refer to one copy of each.
+    Class data:
+        rejectsPIs -- processing instructions and DTDs are rejected while
+            parsing, ParsedSoap doesn't search the tree for them.
+        chunksize -- bytes read per call when parsing from a stream.
+        internValues -- (namespaceURI, localName) of the attributes whose
+            values are interned, xsi:type by default.  Add (None, 'type')
+            for the type of a ManagedObjectReference.
+        internSize -- bound on the table of a thread, a new one is started
+            when a message starts with more strings than that.
+    '''
+    rejectsPIs = True
+    chunksize = 1 << 16
+    internValues = dict.fromkeys([ (uri, 'type') for uri in SCHEMA.XSI_LIST ])
+    internSize = 1 << 16
+    _tables = threading.local()
+
+    def _builder(self):
+        tables = ExpatReader._tables
+        strings = getattr(tables, 'strings', None)
+        if strings is None or len(strings) > self.internSize:
+            tables.strings, tables.names = {}, {}
+        return _Builder(tables.strings, tables.names, self.internValues)
+
+    def fromString(self, data):
+        builder = self._builder()
+        builder.feed(data, True)
+        return builder.document
+
+    def fromStream(self, stream):
+        builder = self._builder()
+        read, chunksize = stream.read, self.chunksize
+        while 1:
+            data = read(chunksize)
+            if not data: break
+            builder.feed(data)
+        builder.feed('', True)
+        return builder.document
+
+
+if __name__ == '__main__': print _copyright
@@ -3,7 +3,8 @@
 """XML Schema support
 """
 
-from vmw.ZSI import _copyright, _seqtypes, _find_type, _get_element_nsuri_name, EvaluateException
+from vmw.ZSI import _copyright, _seqtypes, _find_type, _get_element_nsuri_name, \
+        EvaluateException, _Backtrace
 from vmw.ZSI.wstools.Namespaces import SCHEMA, SOAP
 from vmw.ZSI.wstools.Utility import SplitQName
 
@@ -40,17 +41,13 @@ def _is_substitute_element(head, sub):
     if not isinstance(head, ElementDeclaration) or not isinstance(sub, ElementDeclaration):
         return False
 
-    try:
-        group = sub.substitutionGroup
-    except (AttributeError, TypeError):
+    members = SchemaInstanceType.getSubstitutionGroup(head.nspname, head.pname)
+    if not members or not members.has_key((sub.schema, sub.literal)):
         return False
 
-    ged = GED(*group)
-
     # TODO: better way of representing element references.  Wrap them with
     # facets, and dereference when needed and delegate to..
-    print (head.nspname == ged.nspname and head.pname == ged.pname)
-    if head is ged or not (head.nspname == ged.nspname and head.pname == ged.pname):
+    if head is GED(*sub.substitutionGroup):
         return False
 
     return True
@@ -97,11 +94,13 @@ class SchemaInstanceType(type):
             global element declarations.
         element_typecode_cache -- dict of typecode instances
             representing global element declarations.
+        substitution_registry -- dict of substitutionGroup heads,
+            each a dict of the (namespaceURI,NCName) of its members.
     """
     types = {}
     elements = {}
     element_typecode_cache = {}
-    #substitution_registry = {}
+    substitution_registry = {}
 
     def __new__(cls,classname,bases,classdict):
         """If classdict has literal and schema register it as a
@@ -122,14 +121,11 @@ class SchemaInstanceType(type):
             # create global element declaration
             ged = SchemaInstanceType.elements[key] = type.__new__(cls,classname,bases,classdict)
 
-            # TODO: Maybe I want access to all registrants??
-            #
-            #if classdict.has_key('substitutionGroup'):
-            #    sub = classdict.has_key('substitutionGroup')
-            #    if not SchemaInstanceType.substitution_registry.has_key(sub):
-            #        SchemaInstanceType.substitution_registry[sub] = [ged]
-            #    else:
-            #        SchemaInstanceType.substitution_registry[sub].append(ged)
+            group = classdict.get('substitutionGroup')
+            if group is not None:
+                nsuri,ncname = group
+                SchemaInstanceType.substitution_registry.setdefault(
+                    (nsuri or None, ncname), {})[key] = ged
 
             return ged
 
@@ -189,6 +185,19 @@ class SchemaInstanceType(type):
         return typecode
     getElementDeclaration = classmethod(getElementDeclaration)
 
+    def getSubstitutionGroup(cls, namespaceURI, name):
+        """Returns the members of the substitutionGroup headed by the
+        element declaration (namespaceURI, name), a dict of member
+        (namespaceURI,NCName) to class definition, or None.  The empty
+        namespace and no namespace are the same head.
+
+        Parameters:
+           namespaceURI --
+           name --
+        """
+        return cls.substitution_registry.get((namespaceURI or None, name))
+    getSubstitutionGroup = classmethod(getSubstitutionGroup)
+
 
 class ElementDeclaration:
     """Typecodes subclass to represent a Global Element Declaration by
@@ -233,19 +242,13 @@ class ElementDeclaration:
         elt -- the DOM element being parsed
         ps -- ParsedSoap instance
         """
-        nsuri,ncname = _get_element_nsuri_name(elt)
-        typecode = GED(nsuri,ncname)
-        if typecode is None:
+        members = SchemaInstanceType.getSubstitutionGroup(self.nspname, self.pname)
+        if not members:
             return
 
-        try:
-            nsuri,ncname = typecode.substitutionGroup
-        except (AttributeError, TypeError):
-            return
-
-        if (ncname == self.pname) and (nsuri == self.nspname or
-           (not nsuri and not self.nspname)):
-             return typecode
+        key = _get_element_nsuri_name(elt)
+        if members.has_key(key):
+            return GED(*key)
 
         return
 
@@ -270,31 +273,44 @@ class TypeDefinition:
 
         DONT Return the element's type.
 
+        The substitute typecodes are cached by xsi:type, the registry
+        never replaces a type definition.
+
         Parameters:
             elt -- the DOM element being parsed
             ps -- the ParsedSoap object.
         """
+        typeName = _find_type(elt)
+        prefix,typeName = SplitQName(typeName)
+        uri = ps.GetElementNSScope(elt).get(prefix)
+        # copies of a typecode share the cache, their names may differ
+        key = (uri, typeName, self.nspname, self.pname)
+        substitutes = self.__dict__.get('_substitutes')
+        if substitutes is None:
+            substitutes = self._substitutes = {}
+        what = substitutes.get(key)
+        if what is not None:
+            return what
+
         pyclass = SchemaInstanceType.getTypeDefinition(*self.type)
         if pyclass is None:
             raise EvaluateException(
                     'No Type registed for xsi:type=(%s, %s)' %
-                    (self.type[0], self.type[1]), ps.Backtrace(elt))
+                    (self.type[0], self.type[1]), _Backtrace(ps.Backtrace, elt))
 
-        typeName = _find_type(elt)
-        prefix,typeName = SplitQName(typeName)
-        uri = ps.GetElementNSdict(elt).get(prefix)
         subclass = SchemaInstanceType.getTypeDefinition(uri, typeName)
         if subclass is None:
             raise EvaluateException(
                     'No registered xsi:type=(%s, %s), substitute for xsi:type=(%s, %s)' %
-                    (uri, typeName, self.type[0], self.type[1]), ps.Backtrace(elt))
+                    (uri, typeName, self.type[0], self.type[1]), _Backtrace(ps.Backtrace, elt))
 
         if not issubclass(subclass, pyclass) and subclass(None) and not issubclass(subclass, pyclass):
             raise TypeError(
                     'Substitute Type (%s, %s) is not derived from %s' %
-                    (self.type[0], self.type[1], pyclass), ps.Backtrace(elt))
+                    (self.type[0], self.type[1], pyclass), _Backtrace(ps.Backtrace, elt))
 
-        return subclass((self.nspname, self.pname))
+        what = substitutes[key] = subclass((self.nspname, self.pname))
+        return what
 
 
 
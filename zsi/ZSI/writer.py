@@ -9,6 +9,7 @@ from vmw.ZSI.wstools.Utility import MessageInterface, ElementProxy
 from vmw.ZSI.wstools.Namespaces import XMLNS, SOAP, SCHEMA
 from vmw.ZSI.wstools.c14n import Canonicalize
 from vmw.ZSI.wstools.MIMEAttachment import MIMEMessage
+from xml.dom import Node as _Node
 
 import types
 
@@ -22,18 +23,32 @@ _reserved_ns = {
         'xsi': SCHEMA.BASE + '-instance',
 }
 
+# envelope templates, (outputclass, encodingStyle, nsdict items) --> template
+_envelopes = {}
+# bound on the templates kept, nsdicts made per call would otherwise grow
+# the cache without limit.
+_MAX_ENVELOPES = 64
+
 class SoapWriter:
     '''SOAP output formatter.
        Instance Data:
-           memo -- memory for id/href
+           memo -- memory for id/href, dictionary of id strings
            envelope -- add Envelope?
            encodingStyle --
            header -- add SOAP Header?
            outputclass -- ElementProxy class.
+           multiref -- track object identity for id/href, False for
+               document/literal messages where nothing is multi-reference.
+           canonical -- write an ElementProxy message in canonical form
+               (c14n), for signing, else as is.
+       Class Data:
+           bufsize -- writeMessage passes on the message in pieces of
+               about this size.
     '''
+    bufsize = 1 << 16
 
     def __init__(self, envelope=True, encodingStyle=None, header=True,
-    nsdict={}, outputclass=None, **kw):
+    nsdict={}, outputclass=None, multiref=True, canonical=False, **kw):
         '''Initialize.
         '''
         outputclass = outputclass or ElementProxy
@@ -41,40 +56,99 @@ class SoapWriter:
             raise TypeError, 'outputclass must subclass MessageInterface'
 
         self.dom, self.memo, self.nsdict= \
-            outputclass(self), [], nsdict
+            outputclass(self), {}, nsdict
+        self.multiref = multiref
+        self.canonical = canonical
         self.envelope = envelope
         self.encodingStyle = encodingStyle
         self.header = header
         self.body = None
+        self._header = None
         self.callbacks = []
         self.closed = False
         self._attachments = []
         self._MIMEBoundary = ""
         self._startCID = ""
+        self._mime = None
 
     def __str__(self):
         self.close()
         if len(self._attachments) == 0:
             #we have no attachment let's return the SOAP message
-            return str(self.dom)
+            return self._getXML()
         else:
             #we have some files to attach let's create the MIME message
             #first part the SOAP message
-            msg = MIMEMessage()
-            msg.addXMLMessage(str(self.dom))
-            for file in self._attachments:
-                msg.attachFile(file)
-            msg.makeBoundary()
-            self._MIMEBoundary = msg.getBoundary()
-            self._startCID = msg.getStartCID()
-            return msg.toString()
+            if self._mime is None:
+                self._setMIMEMessage(self._getXML())
+            return self._mime.toString()
+
+    def writeMessage(self, write):
+        '''Write the message by calling write with pieces of about
+        bufsize bytes, attachments are copied from their files a block at
+        a time.  Nothing holds the whole message.
+        '''
+        self.close()
+        out = _Output(write, self.bufsize)
+        if len(self._attachments) == 0:
+            self._writeXML(out)
+        else:
+            if self._mime is None:
+                self._setMIMEMessage(self._writeXML)
+            self._mime.write(out)
+        out.flush()
+
+    def _setMIMEMessage(self, xml):
+        '''Create the MIME message of xml, the SOAP message or a
+        callable writing it, and the attachments.
+        '''
+        msg = self._mime = MIMEMessage()
+        msg.addXMLMessage(xml)
+        for file in self._attachments:
+            msg.attachFile(file)
+        msg.makeBoundary()
+        self._MIMEBoundary = msg.getBoundary()
+        self._startCID = msg.getStartCID()
+
+    def _getXML(self):
+        '''Return the message, an ElementProxy DOM is written as is
+        unless canonical.
+        '''
+        if self.canonical or not isinstance(self.dom, ElementProxy):
+            return str(self.dom)
+        out = []
+        _write_dom(self.dom._getNode(), out)
+        return ''.join(out)
+
+    def _writeXML(self, write):
+        '''Write the SOAP message by calling write with each piece, or
+        appending them to write if it is an _Output.
+        '''
+        out = write
+        if not isinstance(out, _Output):
+            out = _Output(write, self.bufsize)
+        if isinstance(self.dom, StreamElementProxy):
+            self.dom._getNode()._write(out)
+        elif not isinstance(self.dom, ElementProxy):
+            out.append(str(self.dom))
+        elif self.canonical:
+            Canonicalize(self.dom._getNode(), out)
+        else:
+            _write_dom(self.dom._getNode(), out)
+        if out is not write:
+            out.flush()
 
     def getMIMEBoundary(self):
-        #return the httpHeader if any
+        #return the httpHeader if any, the MIME message is created
+        #to write it later if need be.
+        if self._attachments and self._mime is None:
+            self._setMIMEMessage(self._writeXML)
         return self._MIMEBoundary
 
     def getStartCID(self):
         #return the CID of the xml part
+        if self._attachments and self._mime is None:
+            self._setMIMEMessage(self._writeXML)
         return self._startCID
 
 
@@ -118,13 +192,7 @@ class SoapWriter:
         self.body = None
         if self.envelope:
             soap_env = _reserved_ns['soapenv']
-            self.dom.createDocument(soap_env, 'Envelope')
-            for prefix, nsuri in _reserved_ns.items():
-                self.dom.setNamespaceAttribute(prefix, nsuri)
-            self.writeNSdict(self.nsdict)
-            if self.encodingStyle:
-                self.dom.setAttributeNS(soap_env, 'encodingStyle',
-                                        self.encodingStyle)
+            self._createEnvelope()
             if self.header:
                 self._header = self.dom.createAppendElement(soap_env, 'Header')
 
@@ -150,6 +218,33 @@ class SoapWriter:
 
         return self
 
+    def _createEnvelope(self):
+        '''Create the Envelope with the reserved and nsdict namespaces
+        declared and encodingStyle set.  When the outputclass supports
+        templates (getEnvelopeTemplate, createEnvelope) the envelope is
+        made from the template of the first one created with the same
+        settings.
+        '''
+        key = None
+        if hasattr(self.dom, 'createEnvelope'):
+            key = (self.dom.__class__, self.encodingStyle,
+                   tuple(sorted(self.nsdict.items())))
+            template = _envelopes.get(key)
+            if template is not None:
+                self.dom.createEnvelope(template)
+                return
+
+        soap_env = _reserved_ns['soapenv']
+        self.dom.createDocument(soap_env, 'Envelope')
+        for prefix, nsuri in _reserved_ns.items():
+            self.dom.setNamespaceAttribute(prefix, nsuri)
+        self.writeNSdict(self.nsdict)
+        if self.encodingStyle:
+            self.dom.setAttributeNS(soap_env, 'encodingStyle',
+                                    self.encodingStyle)
+        if key is not None and len(_envelopes) < _MAX_ENVELOPES:
+            _envelopes[key] = self.dom.getEnvelopeTemplate()
+
     def writeNSdict(self, nsdict):
         '''Write a namespace dictionary, taking care to not clobber the
         standard (or reserved by us) prefixes.
@@ -180,21 +275,19 @@ class SoapWriter:
 
     def Known(self, obj):
         '''Seen this object (known by its id()?  Return 1 if so,
-        otherwise add it to our memory and return 0.
+        otherwise add it to our memory and return 0.  Always 0 when
+        multiref is False.
         '''
+        if not self.multiref: return 0
         obj = _get_idstr(obj)
         if obj in self.memo: return 1
-        self.memo.append(obj)
+        self.memo[obj] = 1
         return 0
 
     def Forget(self, obj):
         '''Forget we've seen this object.
         '''
-        obj = _get_idstr(obj)
-        try:
-            self.memo.remove(obj)
-        except ValueError:
-            pass
+        self.memo.pop(_get_idstr(obj), None)
 
     def Backtrace(self, elt):
         '''Return a human-readable "backtrace" from the document root to
@@ -220,4 +313,426 @@ class SoapWriter:
         if not self.closed: self.close()
 
 
+def _escape_text(s):
+    '''Escape character data as c14n does.
+    '''
+    if type(s) is types.UnicodeType: s = s.encode('utf-8')
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+        .replace('\r', '&#xD;')
+
+def _escape_attr(s):
+    '''Escape an attribute value as c14n does.
+    '''
+    if type(s) not in _stringtypes: s = str(s)
+    elif type(s) is types.UnicodeType: s = s.encode('utf-8')
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;') \
+        .replace('\t', '&#x9;').replace('\n', '&#xA;').replace('\r', '&#xD;')
+
+class _Output:
+    '''Collects the pieces of a message, passing them on to write in
+    strings of at least size bytes.  Instances are called with a piece to
+    append it, like write.
+    '''
+
+    def __init__(self, write, size):
+        self._write, self._size = write, size
+        self._pieces, self._length = [], 0
+
+    def append(self, s):
+        self._pieces.append(s)
+        self._length += len(s)
+        if self._length >= self._size:
+            self.flush()
+    write = __call__ = append
+
+    def flush(self):
+        if not self._pieces:
+            return
+        data = ''.join(self._pieces)
+        if type(data) is types.UnicodeType: data = data.encode('utf-8')
+        self._pieces, self._length = [], 0
+        if data: self._write(data)
+
+
+def _write_dom(node, out):
+    '''Append the XML of a DOM document or element to out, escaped as
+    c14n does but with attributes and namespace declarations in DOM order
+    and none dropped.  Comments are left out like c14n does.
+    '''
+    nodeType = node.nodeType
+    if nodeType == _Node.ELEMENT_NODE:
+        name = node.nodeName
+        if type(name) is types.UnicodeType: name = name.encode('utf-8')
+        out.append('<' + name)
+        for attr in (node.attributes and node.attributes.values()) or ():
+            qname = attr.nodeName
+            if type(qname) is types.UnicodeType: qname = qname.encode('utf-8')
+            out.append(' %s="%s"' %(qname, _escape_attr(attr.value)))
+        if not node.childNodes:
+            out.append('/>')
+            return
+        out.append('>')
+        for c in node.childNodes:
+            _write_dom(c, out)
+        out.append('</%s>' %name)
+    elif nodeType in (_Node.TEXT_NODE, _Node.CDATA_SECTION_NODE):
+        out.append(_escape_text(node.data))
+    elif nodeType == _Node.DOCUMENT_NODE:
+        for c in node.childNodes:
+            _write_dom(c, out)
+    elif nodeType == _Node.PROCESSING_INSTRUCTION_NODE:
+        pi = '<?%s %s?>' %(node.target, node.data)
+        if type(pi) is types.UnicodeType: pi = pi.encode('utf-8')
+        out.append(pi)
+
+
+class _StreamElement(object):
+    '''Element of a StreamElementProxy message.  Attributes and namespace
+    declarations are kept rendered, children as a list of elements and
+    escaped text.  The in-scope namespaces (uri --> prefix, prefix -->
+    uri) are shared with the parent until the element declares one.
+    '''
+    __slots__ = ('_proxy', 'parentNode', 'nodeName', '_children', '_nsdecls',
+                 '_attrs', '_uris', '_prefixes')
+    nodeType = _Node.ELEMENT_NODE
+
+    def __init__(self, proxy, parentNode, nodeName, uris, prefixes):
+        self._proxy = proxy
+        self.parentNode = parentNode
+        self.nodeName = nodeName
+        self._children = self._nsdecls = self._attrs = ()
+        self._uris, self._prefixes = uris, prefixes
+
+    def _get_childNodes(self):
+        return [ c for c in self._children if type(c) is not str ]
+    childNodes = property(_get_childNodes)
+
+    def _getNode(self):
+        return self
+
+    def _append(self, child):
+        if self._children:
+            self._children.append(child)
+        else:
+            self._children = [child]
+
+    def _write(self, out):
+        append = out.append
+        append('<' + self.nodeName)
+        for prefix,decl in self._nsdecls: append(decl)
+        for qname,attr in self._attrs: append(attr)
+        if not self._children:
+            append('/>')
+            return
+        append('>')
+        for c in self._children:
+            if type(c) is str:
+                append(c)
+            else:
+                c._write(out)
+        append('</%s>' %self.nodeName)
+
+    def AddCallback(self, func, *arglist):
+        self._proxy.AddCallback(func, *arglist)
+
+    def Known(self, obj):
+        return self._proxy.Known(obj)
+
+    def Forget(self, obj):
+        return self._proxy.Forget(obj)
+
+    def getPrefix(self, namespaceURI):
+        '''Return the prefix bound to namespaceURI, declaring a new one
+        on this element if there is none in scope.
+        '''
+        if namespaceURI == XMLNS.XML:
+            return 'xml'
+        prefix = self._uris.get(namespaceURI)
+        if prefix is None:
+            prefix = self._proxy._getUniquePrefix(self._prefixes)
+            self.setNamespaceAttribute(prefix, namespaceURI)
+        return prefix
+
+    def resolvePrefix(self, prefix):
+        try:
+            return self._prefixes[prefix]
+        except KeyError:
+            raise KeyError, 'prefix "%s" is not defined' %prefix
+
+    def findNamespaceURI(self, qualifiedName):
+        prefix = ''
+        if ':' in qualifiedName:
+            prefix = qualifiedName.split(':', 1)[0]
+        return self.resolvePrefix(prefix)
+
+    def setNamespaceAttribute(self, prefix, namespaceURI):
+        '''declare xmlns:prefix=namespaceURI on this element, the
+        reserved xml and xmlns prefixes are ignored.
+        '''
+        if prefix in ('xml', 'xmlns') or \
+           self._prefixes.get(prefix) == namespaceURI:
+            return
+        if not self._nsdecls:
+            self._nsdecls = []
+            self._uris, self._prefixes = self._uris.copy(), self._prefixes.copy()
+        old = self._prefixes.get(prefix)
+        if old is not None:
+            if self._uris.get(old) == prefix:
+                del self._uris[old]
+            self._nsdecls = [ d for d in self._nsdecls if d[0] != prefix ]
+        self._uris[namespaceURI] = prefix
+        self._prefixes[prefix] = namespaceURI
+        self._nsdecls.append((prefix,
+            ' xmlns:%s="%s"' %(prefix, _escape_attr(namespaceURI))))
+
+    def setAttributeNS(self, namespaceURI, localName, value):
+        if namespaceURI == XMLNS.BASE:
+            self.setNamespaceAttribute(localName, value)
+            return
+        qname = localName
+        if namespaceURI:
+            qname = '%s:%s' %(self.getPrefix(namespaceURI), localName)
+        attr = (qname, ' %s="%s"' %(qname, _escape_attr(value)))
+        if not self._attrs:
+            self._attrs = [attr]
+            return
+        for i in range(len(self._attrs)):
+            if self._attrs[i][0] == qname:
+                self._attrs[i] = attr
+                return
+        self._attrs.append(attr)
+
+    def setAttributeType(self, namespaceURI, localName):
+        '''set xsi:type
+        '''
+        value = localName
+        if namespaceURI:
+            value = '%s:%s' %(self.getPrefix(namespaceURI), localName)
+        self.setAttributeNS(SCHEMA.XSI3, 'type', value)
+
+    def createAppendElement(self, namespaceURI, localName, prefix=None):
+        '''Create a new element (namespaceURI,localName), append it
+        to this element, and return it.  A namespace not yet in scope is
+        declared on this element.
+        '''
+        if type(localName) is types.UnicodeType:
+            localName = localName.encode('utf-8')
+        qname = localName
+        if namespaceURI:
+            qname = '%s:%s' %(self.getPrefix(namespaceURI), localName)
+        node = _StreamElement(self._proxy, self, qname,
+                              self._uris, self._prefixes)
+        self._append(node)
+        return node
+
+    def createAppendTextNode(self, pyobj):
+        self._append(_escape_text(pyobj))
+
+    def createAppendXML(self, xml):
+        '''append serialized XML, must be well-formed and carry its
+        namespace declarations.
+        '''
+        if type(xml) is types.UnicodeType: xml = xml.encode('utf-8')
+        self._append(xml)
+
+
+class _EnvelopeTemplate(object):
+    '''Envelope of the StreamElementProxy messages written with the same
+    settings: its namespaces and attributes, and pre-rendered its start
+    tag, the start tag followed by an empty Header, and its end tag.
+    '''
+    __slots__ = ('nodeName', 'nsdecls', 'attrs', 'uris', 'prefixes',
+                 'header', 'start', 'startHeader', 'end')
+
+    def __init__(self, node):
+        self.nodeName = node.nodeName
+        self.nsdecls, self.attrs = tuple(node._nsdecls), tuple(node._attrs)
+        self.uris, self.prefixes = node._uris.copy(), node._prefixes.copy()
+        self.header = '%s:Header' %self.uris[SOAP.ENV]
+        self.start = '<%s%s%s>' %(self.nodeName,
+                                  ''.join([ d for p,d in self.nsdecls ]),
+                                  ''.join([ a for q,a in self.attrs ]))
+        self.startHeader = '%s<%s/>' %(self.start, self.header)
+        self.end = '</%s>' %self.nodeName
+
+
+class _StreamEnvelope(_StreamElement):
+    '''Envelope of a StreamElementProxy message made from a template, it
+    is written as the strings rendered for the template, the Header too
+    while it is empty, until a namespace or attribute is added.
+    '''
+    __slots__ = ('_template',)
+
+    def __init__(self, proxy, template):
+        _StreamElement.__init__(self, proxy, None, template.nodeName,
+                                template.uris.copy(), template.prefixes.copy())
+        self._template = template
+
+    def _expand(self):
+        if self._template is None:
+            return
+        self._nsdecls = list(self._template.nsdecls)
+        self._attrs = list(self._template.attrs)
+        self._template = None
+
+    def _write(self, out):
+        template = self._template
+        if template is None:
+            _StreamElement._write(self, out)
+            return
+        append, children, i = out.append, self._children, 0
+        if children:
+            c = children[0]
+            if type(c) is not str and c.nodeName == template.header and \
+               not (c._children or c._nsdecls or c._attrs):
+                i = 1
+        append(i and template.startHeader or template.start)
+        for i in xrange(i, len(children)):
+            c = children[i]
+            if type(c) is str:
+                append(c)
+            else:
+                c._write(out)
+        append(template.end)
+
+    def setNamespaceAttribute(self, prefix, namespaceURI):
+        if prefix in ('xml', 'xmlns') or \
+           self._prefixes.get(prefix) == namespaceURI:
+            return
+        self._expand()
+        _StreamElement.setNamespaceAttribute(self, prefix, namespaceURI)
+
+    def setAttributeNS(self, namespaceURI, localName, value):
+        self._expand()
+        _StreamElement.setAttributeNS(self, namespaceURI, localName, value)
+
+
+class _StreamDocument(_StreamElement):
+    '''Document node of a StreamElementProxy message, namespaces of its
+    element are declared on the element itself.
+    '''
+    __slots__ = ()
+    nodeType = _Node.DOCUMENT_NODE
+
+    def __init__(self, proxy):
+        _StreamElement.__init__(self, proxy, None, '#document', {}, {})
+
+    def _write(self, out):
+        for c in self._children:
+            if type(c) is str:
+                out.append(c)
+            else:
+                c._write(out)
+
+    def setNamespaceAttribute(self, prefix, namespaceURI):
+        raise TypeError, 'cannot declare a namespace on a document'
+
+    def setAttributeNS(self, namespaceURI, localName, value):
+        raise TypeError, 'cannot set an attribute on a document'
+
+    def createAppendElement(self, namespaceURI, localName, prefix=None):
+        if type(localName) is types.UnicodeType:
+            localName = localName.encode('utf-8')
+        node = _StreamElement(self._proxy, self, localName, {}, {})
+        if namespaceURI:
+            prefix = prefix or self._proxy._getUniquePrefix(node._prefixes)
+            node.setNamespaceAttribute(prefix, namespaceURI)
+            node.nodeName = '%s:%s' %(prefix, localName)
+        self._append(node)
+        return node
+
+
+class StreamElementProxy(MessageInterface):
+    '''MessageInterface writing the message as a tree of light elements
+    holding escaped XML, instead of a DOM document.  str() joins the
+    pieces, nothing is re-walked by a canonicalizer.  Output is well-formed
+    but not canonical (attributes are not sorted), so use ElementProxy
+    to sign messages.
+    '''
+    reserved_ns = ElementProxy.reserved_ns
+
+    def __init__(self, sw):
+        MessageInterface.__init__(self, sw)
+        self.node = None
+        self._indx = 0
+
+    def __str__(self):
+        return self.toString()
+
+    def _getNode(self):
+        return self.node
+
+    def _getUniquePrefix(self, prefixes):
+        while 1:
+            self._indx += 1
+            prefix = 'ns%d' %self._indx
+            if prefix not in prefixes:
+                return prefix
+
+    def isFault(self):
+        return False
+
+    def isEmpty(self):
+        return not self.node
+
+    def canonicalize(self):
+        return self.toString()
+
+    def toString(self):
+        out = []
+        self.node._write(out)
+        return ''.join(out)
+
+    def createDocument(self, namespaceURI, localName, doctype=None):
+        '''If specified must be a SOAP envelope, else may contruct an empty document.
+        '''
+        if namespaceURI == SOAP.ENV:
+            self.node = _StreamElement(self, None, 'soapenv:' + localName,
+                                       {}, {})
+            for prefix,nsuri in self.reserved_ns.items():
+                self.node.setNamespaceAttribute(prefix, nsuri)
+        elif namespaceURI is localName is None:
+            self.node = _StreamDocument(self)
+        else:
+            raise KeyError, 'only support creation of document in %s' %SOAP.ENV
+
+    def getEnvelopeTemplate(self):
+        '''Returns a template of the envelope, for createEnvelope.
+        '''
+        return _EnvelopeTemplate(self.node)
+
+    def createEnvelope(self, template):
+        '''Create a document whose envelope is a copy of template, written
+        as rendered.
+        '''
+        self.node = _StreamEnvelope(self, template)
+
+    def createAppendElement(self, namespaceURI, localName, prefix=None):
+        return self.node.createAppendElement(namespaceURI, localName, prefix)
+
+    def createAppendTextNode(self, pyobj):
+        return self.node.createAppendTextNode(pyobj)
+
+    def createAppendXML(self, xml):
+        return self.node.createAppendXML(xml)
+
+    def getPrefix(self, namespaceURI):
+        return self.node.getPrefix(namespaceURI)
+
+    def findNamespaceURI(self, qualifiedName):
+        return self.node.findNamespaceURI(qualifiedName)
+
+    def resolvePrefix(self, prefix):
+        return self.node.resolvePrefix(prefix)
+
+    def setAttributeNS(self, namespaceURI, localName, value):
+        self.node.setAttributeNS(namespaceURI, localName, value)
+
+    def setAttributeType(self, namespaceURI, localName):
+        self.node.setAttributeType(namespaceURI, localName)
+
+    def setNamespaceAttribute(self, prefix, namespaceURI):
+        self.node.setNamespaceAttribute(prefix, namespaceURI)
+
+
 if __name__ == '__main__': print _copyright
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import unittest, sys, threading, socket, BaseHTTPServer, SocketServer
+from cStringIO import StringIO
+from ZSI import *
+from ZSI.client import Binding, ConnectionPool
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI.wstools.Utility import ElementProxy
+from ZSI.wstools import MIMEAttachment
+from ZSI.wstools.MIMEAttachment import MIMEMessage
+
+
+class ChunkedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.clients.append(self.client_address)
+        if self.headers.get('transfer-encoding') == 'chunked':
+            data = self._read_chunks()
+        else:
+            data = self.rfile.read(int(self.headers['content-length']))
+        self.server.requests.append(data)
+        self.send_response(200)
+        self.send_header('Content-Type', self.server.mimetype)
+        if self.server.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(data), 5):
+                chunk = data[i:i+5]
+                self.wfile.write('%x\r\n%s\r\n' %(len(chunk), chunk))
+            self.wfile.write('0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def _read_chunks(self):
+        chunks = []
+        while 1:
+            size = int(self.rfile.readline().split(';')[0], 16)
+            self.server.chunks.append(size)
+            if size == 0: break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        self.rfile.readline()
+        return ''.join(chunks)
+
+    def log_message(self, *args):
+        pass
+
+
+class ChunkedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    chunked = True
+    mimetype = 'text/xml; charset="utf-8"'
+
+
+class ClientStreamingTestCase(unittest.TestCase):
+    "Replies parsed from the socket as they arrive"
+
+    def setUp(self):
+        self.server = ChunkedServer(('127.0.0.1', 0), ChunkedHandler)
+        self.server.clients, self.server.requests = [], []
+        self.server.chunks = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' %self.server.server_address[1]
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _binding(self, **kw):
+        b = Binding(url=self.url, streaming=True, **kw)
+        b.connectionPool = self.pool
+        return b
+
+    def check_streaming(self):
+        value = 'stream' * 2000
+        for chunked in (True, False):
+            self.server.chunked = chunked
+            for readerclass in (DefaultReader, ExpatReader):
+                b = self._binding(readerclass=readerclass)
+                self.failUnlessEqual(
+                    b.RPC(None, 'echo', {'value': value}, TC.Any()),
+                    {'value': value})
+                self.failUnless(b.data is None)
+                self.failUnlessRaises(RuntimeError, b.ReceiveRaw)
+        # the connection went back to the pool each time
+        self.failUnlessEqual(len(dict.fromkeys(self.server.clients)), 1)
+
+    def check_chunked(self):
+        value = 'chunk' * 20000
+        for writerclass in (None, ElementProxy):
+            b = self._binding(chunked=True, writerclass=writerclass)
+            self.failUnlessEqual(
+                b.RPC(None, 'echo', {'value': value}, TC.Any()),
+                {'value': value})
+        self.failUnlessEqual(self.server.chunks.count(0), 2)
+        self.failUnless(max(self.server.chunks) < 2 * SoapWriter.bufsize)
+
+    def check_write_attachments(self):
+        sw = SoapWriter()
+        sw.serialize({'value': 'x'}, TC.Any('test'))
+        data = ''.join(map(chr, range(256))) * 1000
+        sw.addAttachment(StringIO(data))
+        sw.bufsize = 1000
+        boundary = sw.getMIMEBoundary()
+        pieces = []
+        sw.writeMessage(pieces.append)
+        self.failUnless(max(map(len, pieces)) < 1000 + MIMEMessage.blocksize)
+        message = ''.join(pieces)
+        self.failUnlessEqual(message, str(sw))
+        self.failUnless(message.find(data) != -1)
+        self.failUnlessEqual(message.count('--' + boundary), 3)
+
+    def check_boundary(self):
+        # the boundary isn't in the XML written on demand
+        make_boundary = MIMEAttachment._make_boundary
+        MIMEAttachment._make_boundary = lambda: '=====b=='
+        try:
+            sw = SoapWriter()
+            sw.serialize({'value': '--=====b=='}, TC.Any('test'))
+            sw.addAttachment(StringIO('data'))
+            boundary = sw.getMIMEBoundary()
+        finally:
+            MIMEAttachment._make_boundary = make_boundary
+        self.failUnlessEqual(boundary, '=====b==.0')
+        pieces = []
+        sw.writeMessage(pieces.append)
+        self.failUnlessEqual(''.join(pieces).count('--' + boundary), 3)
+
+    def check_not_resent(self):
+        b = self._binding(chunked=True)
+        self.failUnlessEqual(b.RPC(None, 'echo', {'value': 1}, TC.Any()),
+                             {'value': 1})
+        # the pooled connection fails once the body started
+        conn = self.pool._idle.values()[0][0][0]
+        sent = []
+        def send(data):
+            sent.append(data)
+            if len(sent) > 1: raise socket.error('broken')
+        conn.send = send
+        b = self._binding(chunked=True)
+        self.failUnlessRaises(socket.error, b.RPC, None, 'echo',
+                              {'value': 2}, TC.Any())
+        self.failUnlessEqual(len(self.server.clients), 1)
+
+    def check_not_soap(self):
+        self.server.mimetype = 'text/plain'
+        b = self._binding()
+        self.failUnlessRaises(TypeError, b.RPC, None, 'echo', {'value': 1},
+                              TC.Any())
+        self.failUnless(b.ReceiveRaw().find('echo') != -1)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ClientStreamingTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import unittest, sys, threading, select, httplib, BaseHTTPServer, SocketServer
+from ZSI import *
+from ZSI.client import Binding, ConnectionPool
+
+
+class EchoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.clients.append(self.client_address)
+        data = self.rfile.read(int(self.headers['content-length']))
+        if self.server.noreply:
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        # drop the connection without telling the client
+        self.close_connection = self.server.drop
+
+    def log_message(self, *args):
+        pass
+
+
+class EchoServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    drop = False
+    noreply = False
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    "Persistent connections shared through the client ConnectionPool"
+
+    def setUp(self):
+        self.server = EchoServer(('127.0.0.1', 0), EchoHandler)
+        self.server.clients = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' %self.server.server_address[1]
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _call(self, value):
+        b = Binding(url=self.url)
+        b.connectionPool = self.pool
+        return b.RPC(None, 'echo', {'value': value}, TC.Any())
+
+    def check_reuse(self):
+        for i in range(5):
+            self.failUnlessEqual(self._call(i), {'value': i})
+        self.failUnlessEqual(len(self.server.clients), 5)
+        self.failUnlessEqual(len(dict.fromkeys(self.server.clients)), 1)
+
+    def check_maxsize(self):
+        self.pool.maxsize = 0
+        for i in range(3):
+            self.failUnlessEqual(self._call(i), {'value': i})
+        self.failUnlessEqual(len(dict.fromkeys(self.server.clients)), 3)
+
+    def _wait_closed(self):
+        # until the server closed the idle connection
+        for l in self.pool._idle.values():
+            for conn,released in l:
+                select.select([conn.sock], [], [], 5)
+
+    def check_stale(self):
+        self.server.drop = True
+        for i in range(3):
+            self.failUnlessEqual(self._call(i), {'value': i})
+            self._wait_closed()
+        self.failUnlessEqual(len(dict.fromkeys(self.server.clients)), 3)
+
+    def check_not_resent(self):
+        self.failUnlessEqual(self._call(0), {'value': 0})
+        # the server read the request on the pooled connection and closed
+        # it without replying, the request isn't sent again.
+        self.server.noreply = True
+        self.failUnlessRaises(httplib.HTTPException, self._call, 1)
+        self.failUnlessEqual(len(self.server.clients), 2)
+
+    def check_unhashable(self):
+        self.failUnless(self.pool.getKey(None, 'host', {'a': []}) is None)
+        self.failIf(self.pool.getKey(None, 'host', {'a': 1}) is None)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ConnectionPoolTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
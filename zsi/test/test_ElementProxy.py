@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import unittest, sys
+from ZSI import *
+from ZSI.wstools.Utility import ElementProxy
+from ZSI.wstools.Namespaces import SOAP, XMLNS
+from ZSI.wstools.c14n import Canonicalize
+from xml.dom import minidom
+
+
+class ElementProxyTestCase(unittest.TestCase):
+    "Namespace prefixes of elements written by ElementProxy"
+
+    def _envelope(self):
+        proxy = ElementProxy(None)
+        proxy.createDocument(SOAP.ENV, 'Envelope')
+        return proxy
+
+    def check_scope(self):
+        env = self._envelope()
+        body = env.createAppendElement(SOAP.ENV, 'Body')
+        a = body.createAppendElement('urn:a', 'a')
+        self.failUnlessEqual(a._getNode().prefix, 'ns1')
+        # declared on body, in scope for a and its children
+        b = a.createAppendElement('urn:a', 'b')
+        self.failUnlessEqual(b._getNode().prefix, 'ns1')
+        self.failUnlessEqual(b.getPrefix(XMLNS.XML), 'xml')
+        # declared on the parent after the child was created
+        a.setNamespaceAttribute('late', 'urn:late')
+        self.failUnlessEqual(b.getPrefix('urn:late'), 'late')
+        # a new prefix does not clash with those in scope
+        self.failUnlessEqual(b.getPrefix('urn:c'), 'ns2')
+        self.failUnless(b._getNode().hasAttributeNS(XMLNS.BASE, 'ns2'))
+        self.failUnlessEqual(b.getPrefix('urn:c'), 'ns2')
+
+    def check_shadow(self):
+        env = self._envelope()
+        body = env.createAppendElement(SOAP.ENV, 'Body')
+        body.setNamespaceAttribute('p', 'urn:a')
+        a = body.createAppendElement('urn:a', 'a')
+        a.setNamespaceAttribute('p', 'urn:b')
+        self.failUnlessEqual(a.getPrefix('urn:b'), 'p')
+        self.failIfEqual(a.getPrefix('urn:a'), 'p')
+        self.failUnlessEqual(body.getPrefix('urn:a'), 'p')
+        a.setAttributeNS(XMLNS.BASE, 'xmlns', 'urn:d')
+        self.failUnlessEqual(a.getPrefix('urn:d'), None)
+
+    def check_wrapped(self):
+        env = self._envelope()
+        body = env.createAppendElement(SOAP.ENV, 'Body')
+        a = body.createAppendElement('urn:a', 'a')
+        # a proxy of an existing node reads the namespaces from the DOM
+        proxy = ElementProxy(None, a._getNode())
+        self.failUnlessEqual(proxy.getPrefix('urn:a'), 'ns1')
+        self.failUnlessEqual(proxy.getPrefix(SOAP.ENV), 'soapenv')
+        self.failUnlessEqual(proxy.getPrefix('urn:b'), 'ns2')
+        self.failUnlessEqual(proxy.getPrefix('urn:b'), 'ns2')
+
+    def check_plain(self):
+        pyobj = {'s': '<&>\t"', 'i': 1, 'e': ''}
+        tc = TC.Any('test')
+        for envelope in (True, False):
+            xml = {}
+            for canonical in (True, False):
+                sw = SoapWriter(envelope=envelope, canonical=canonical)
+                sw.serialize(pyobj, tc)
+                xml[canonical] = str(sw)
+            self.failUnlessEqual(xml[True], Canonicalize(sw.dom._getNode()))
+            self.failIfEqual(xml[False], xml[True])
+            self.failUnlessEqual(Canonicalize(minidom.parseString(xml[False])),
+                                 Canonicalize(minidom.parseString(xml[True])))
+            self.failUnlessEqual(
+                ParsedSoap(xml[False], envelope=envelope).Parse(tc), pyobj)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ElementProxyTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+import unittest, sys, threading, tests_good, tests_bad
+from ZSI import *
+from xml.dom import expatbuilder
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI.wstools.Namespaces import SOAP, XMLNS
+from xml.dom import Node
+from test_t1 import datatest
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+
+class MORReader(ExpatReader):
+    internValues = ExpatReader.internValues.copy()
+    internValues[(None, 'type')] = None
+
+
+class MinidomReader:
+    fromString = staticmethod(expatbuilder.parseString)
+    fromStream = staticmethod(expatbuilder.parse)
+
+
+class ExpatReaderTestCase(unittest.TestCase):
+    "Compare the compact reader against the minidom reader"
+
+    def _messages(self, module):
+        l = [ (k,v) for k,v in module.__dict__.items() if k.startswith('test') ]
+        l.sort()
+        return l
+
+    def check_good(self):
+        for key,val in self._messages(tests_good):
+            dps = ParsedSoap(val, readerclass=DefaultReader)
+            eps = ParsedSoap(val, readerclass=ExpatReader)
+            self.failUnlessEqual(dps.Parse(TC.Any()), eps.Parse(TC.Any()), key)
+            self.failUnlessEqual(
+                map(lambda e: (e.namespaceURI, e.localName), dps.header_elements),
+                map(lambda e: (e.namespaceURI, e.localName), eps.header_elements))
+
+    def check_bad(self):
+        for key,val in self._messages(tests_bad):
+            self.failUnlessRaises(ParseException, ParsedSoap, val,
+                                  readerclass=ExpatReader)
+
+    def check_data_elements(self):
+        dps = ParsedSoap(datatest, readerclass=DefaultReader)
+        eps = ParsedSoap(datatest, readerclass=ExpatReader)
+        self.failUnlessEqual(len(dps.data_elements), len(eps.data_elements))
+        for i in range(len(dps.data_elements)):
+            d, e = dps.data_elements[i], eps.data_elements[i]
+            self.failUnlessEqual(dps.Backtrace(d), eps.Backtrace(e))
+            self.failUnlessEqual(dps.GetElementNSdict(d), eps.GetElementNSdict(e))
+
+        tests = [
+            (0, TC.Integer(('test-uri', 'Price'))),
+            (1, TC.Ibyte()),
+            (2, TC.String('Name')),
+            (4, TC.String('n3')),
+            (5, TC.Base64String('n64')),
+            (8, TC.Struct(None, [TC.String('t'), TC.Integer('i')])),
+            (9, TC.HexBinaryString()),
+            (10, TC.Integer(None, nillable=True)),
+            (11, TC.Any()),
+            (12, TC.URI()),
+            (14, TC.Array('SOAP-ENC:int', TC.Integer())),
+            (15, TC.Array(('test-uri','x'), TC.Any())),
+        ]
+        for i,tc in tests:
+            self.failUnlessEqual(tc.parse(dps.data_elements[i], dps),
+                                 tc.parse(eps.data_elements[i], eps))
+
+        # CDATA content
+        d = TC.XML('n2').parse(dps.data_elements[3], dps)
+        e = TC.XML('n2').parse(eps.data_elements[3], eps)
+        self.failUnlessEqual(TC.String().simple_value(d, dps),
+                             TC.String().simple_value(e, eps))
+
+    def check_stream(self):
+        ExpatReader.chunksize, chunksize = 7, ExpatReader.chunksize
+        try:
+            ps = ParsedSoap(StringIO.StringIO(datatest), readerclass=ExpatReader)
+        finally:
+            ExpatReader.chunksize = chunksize
+        self.failUnlessEqual(TC.String('Name').parse(ps.data_elements[2], ps),
+                             u"This is the name")
+
+    def check_namespace_scope(self):
+        xml = '''<e:Envelope xmlns:e="%s" xmlns="urn:a"><e:Body>
+<a xmlns:p="urn:p"><b><c xmlns="" xmlns:p="urn:q"/></b></a>
+</e:Body></e:Envelope>''' %SOAP.ENV
+        for readerclass in (DefaultReader, ExpatReader):
+            ps = ParsedSoap(xml, readerclass=readerclass)
+            a = ps.body_root
+            b = a.childNodes[0]
+            c = b.childNodes[0]
+            scope = ps.GetElementNSScope(c)
+            self.failUnlessEqual((scope[''], scope['p'], scope['e']),
+                                 ('', 'urn:q', SOAP.ENV))
+            self.failUnlessRaises(KeyError, scope.__getitem__, 'x')
+            self.failUnless(ps.GetElementNSScope(b) is ps.GetElementNSScope(a))
+            self.failUnlessEqual(ps.GetElementNSScope(b).get('p'), 'urn:p')
+            self.failUnlessEqual(ps.GetElementNSdict(b),
+                                 {'': 'urn:a', 'p': 'urn:p', 'e': SOAP.ENV,
+                                  'xml': XMLNS.XML, 'xmlns': XMLNS.BASE})
+            # the dictionary is the caller's to modify
+            ps.GetElementNSdict(b)['p'] = 'urn:x'
+            self.failUnlessEqual(ps.GetElementNSScope(b)['p'], 'urn:p')
+            self.failUnlessEqual(TC.QName().text_to_data('p:n', c, ps),
+                                 ('urn:q', 'n'))
+
+    def check_pi_dtd(self):
+        envelope = '<e:Envelope xmlns:e="%s">%%s<e:Body>%%s</e:Body></e:Envelope>' \
+            %SOAP.ENV
+        header = '<e:Header><h:a xmlns:h="urn:h">%s</h:a></e:Header>'
+        messages = [
+            ('<!DOCTYPE e:Envelope [<!ENTITY x "y">]>' + envelope %('', ''), 0),
+            ('<?xml-stylesheet href="s.xsl"?>' + envelope %('', ''), 0),
+            (envelope %('', '<a xmlns="urn:a"><?pi?></a>'), 0),
+            (envelope %(header %'<?pi?>', ''), 1),
+        ]
+        for readerclass in (DefaultReader, ExpatReader, MinidomReader):
+            for xml,inheader in messages:
+                try:
+                    ParsedSoap(xml, readerclass=readerclass)
+                except ParseException, ex:
+                    self.failUnlessEqual(ex.inheader, inheader, xml)
+                else:
+                    self.fail('accepted %s' %xml)
+                self.failUnlessRaises(ParseException, ParsedSoap,
+                    StringIO.StringIO(xml), readerclass=readerclass)
+
+    def check_intern(self):
+        xml = '''<e:Envelope xmlns:e="%s"><e:Body><n:r xmlns:n="urn:n">
+<obj type="VirtualMachine">vm-%d</obj><obj type="VirtualMachine">vm-%d</obj>
+</n:r></e:Body></e:Envelope>'''
+        objs = []
+        for i in range(2):
+            ps = ParsedSoap(xml %(SOAP.ENV, 2*i, 2*i+1), readerclass=MORReader)
+            for E in ps.body_root.childNodes:
+                if E.nodeType != Node.ELEMENT_NODE: continue
+                self.failUnlessEqual(TC.String('obj').parse(E, ps),
+                                     'vm-%d' %len(objs))
+                objs.append(E)
+        self.failUnlessEqual(len(objs), 4)
+        for E in objs[1:]:
+            self.failUnless(E.localName is objs[0].localName)
+            self.failUnless(E.getAttributeNode('type').value is
+                            objs[0].getAttributeNode('type').value)
+        self.failUnless(ps.body_root.namespaceURI is
+                        ps.body_root.getAttributeNode('xmlns:n').value)
+
+        # unqualified type attributes aren't interned by default
+        ps = ParsedSoap(xml %(SOAP.ENV, 4, 5), readerclass=ExpatReader)
+        values = [ E.getAttributeNode('type').value
+                   for E in ps.body_root.childNodes
+                   if E.nodeType == Node.ELEMENT_NODE ]
+        self.failIf(values[0] is values[1])
+
+    def check_intern_per_thread(self):
+        xml = '''<e:Envelope xmlns:e="%s"><e:Body><n:%s xmlns:n="urn:n"/>
+</e:Body></e:Envelope>'''
+        ParsedSoap(xml %(SOAP.ENV, 'main'), readerclass=ExpatReader)
+        tables = []
+        def parse():
+            ParsedSoap(xml %(SOAP.ENV, 'parsedInAnotherThread'),
+                       readerclass=ExpatReader)
+            tables.append(ExpatReader._tables.strings)
+        t = threading.Thread(target=parse)
+        t.start()
+        t.join()
+        strings = ExpatReader._tables.strings
+        self.failIf(tables[0] is strings)
+        self.failUnless(tables[0].has_key('parsedInAnotherThread'))
+        self.failIf(strings.has_key('parsedInAnotherThread'))
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ExpatReaderTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
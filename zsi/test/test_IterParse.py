@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+import unittest, sys, gc, weakref
+from ZSI import *
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI.wstools.Namespaces import SOAP
+
+
+class Item:
+    def __init__(self, name=None, count=None):
+        self.name, self.count = name, count
+
+class Response:
+    pass
+
+item = TC.Struct(Item, [TC.String('name'), TC.Integer('count')], 'item',
+                 inline=True)
+response = TC.ComplexType(Response,
+                        [TC.String('key'),
+                         TC.Struct(Item, item.ofwhat, 'returnval', inline=True,
+                                   minOccurs=0, maxOccurs=TC.UNBOUNDED),
+                         TC.Integer('total')],
+                        ('urn:test', 'RetrieveResponse'))
+
+class Wrapper:
+    pass
+
+wrapper = TC.ComplexType(Wrapper,
+                        [TC.ComplexType(Response, response.ofwhat, 'list',
+                                        inline=True),
+                         TC.AnyElement(aname='any', minOccurs=0)],
+                        ('urn:test', 'Wrapper'))
+
+HREF = '''<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body>
+<ns1:Wrapper xmlns:ns1="urn:test"><list href="#l1"/></ns1:Wrapper>
+<multiRef id="l1" root="0"><key>k</key>
+<returnval><name>a</name><count>1</count></returnval>
+<returnval><name>b</name><count>2</count></returnval>
+<total>2</total></multiRef>
+</soapenv:Body></soapenv:Envelope>'''
+
+
+class IterParseTestCase(unittest.TestCase):
+    "Iterating over the repeated elements of a response"
+
+    def _message(self, count):
+        pyobj = Response()
+        pyobj.key, pyobj.total = 'k', count
+        pyobj.returnval = [ Item('i%d' %i, i) for i in range(count) ]
+        sw = SoapWriter()
+        sw.serialize(pyobj, response)
+        return str(sw)
+
+    def check_iterparse(self):
+        xml = self._message(50)
+        for readerclass in (DefaultReader, ExpatReader):
+            ps = ParsedSoap(xml, readerclass=readerclass)
+            got = [ (i.name, i.count) for i in ps.iterparse(response, ('returnval',)) ]
+            self.failUnlessEqual(got, [ ('i%d' %i, i) for i in range(50) ])
+            # what is left of the root parses without the items
+            pyobj = ps.Parse(response)
+            self.failUnlessEqual((pyobj.key, pyobj.total), ('k', 50))
+            self.failIf(getattr(pyobj, 'returnval', None))
+
+    def check_release(self):
+        # the compact nodes can't be weakly referenced, minidom will do
+        ps = ParsedSoap(self._message(3), readerclass=DefaultReader)
+        elts = [ weakref.ref(E) for E in ps.body_root.childNodes
+                    if E.localName == 'returnval' ]
+        self.failUnlessEqual(len(elts), 3)
+        items = ps.iterparse(response, ('returnval',))
+        items.next()
+        # minidom nodes reference each other, the collector frees them
+        gc.collect()
+        self.failUnlessEqual([ r() is None for r in elts ],
+                             [True, False, False])
+        list(items)
+        gc.collect()
+        self.failUnlessEqual([ r() is None for r in elts ], [True] * 3)
+        self.failUnlessEqual(len(ps.body_root.childNodes), 2)
+
+    def check_bad_path(self):
+        ps = ParsedSoap(self._message(1))
+        self.failUnlessRaises(EvaluateException, list,
+                              ps.iterparse(response, ('nothing',)))
+        self.failUnlessRaises(EvaluateException, list,
+                              ps.iterparse(response, ('key', 'name')))
+
+    def check_error_trace(self):
+        xml = self._message(3).replace('<count>1</count>', '<count>x</count>')
+        for readerclass in (DefaultReader, ExpatReader):
+            ps = ParsedSoap(xml, readerclass=readerclass)
+            items = ps.iterparse(response, ('returnval',))
+            self.failUnlessEqual(items.next().name, 'i0')
+            try:
+                items.next()
+            except EvaluateException, ex:
+                self.failUnless(str(ex).find(
+                    '/ns1:RetrieveResponse/returnval[2]/count') != -1, str(ex))
+            else:
+                self.fail('no EvaluateException')
+
+    def check_href(self):
+        for readerclass in (DefaultReader, ExpatReader):
+            ps = ParsedSoap(HREF, readerclass=readerclass)
+            got = [ (i.name, i.count)
+                    for i in ps.iterparse(wrapper, ('list', 'returnval')) ]
+            self.failUnlessEqual(got, [ ('a', 1), ('b', 2) ])
+
+    def check_sibling_href(self):
+        xml = '''<soapenv:Envelope xmlns:soapenv="%s"><soapenv:Body>
+<ns1:RetrieveResponse xmlns:ns1="urn:test"><key>k</key>
+<returnval><name id="n1">shared</name><count>1</count></returnval>
+<returnval><name href="#n1"/><count>2</count></returnval>
+<total>2</total></ns1:RetrieveResponse>
+</soapenv:Body></soapenv:Envelope>''' %SOAP.ENV
+        for readerclass in (DefaultReader, ExpatReader):
+            ps = ParsedSoap(xml, readerclass=readerclass)
+            got = [ (i.name, i.count)
+                    for i in ps.iterparse(response, ('returnval',)) ]
+            self.failUnlessEqual(got, [ ('shared', 1), ('shared', 2) ])
+
+    def check_limits(self):
+        ps = ParsedSoap(HREF)
+        # wildcard content can't be named along the path
+        self.failUnlessRaises(EvaluateException, list,
+                              ps.iterparse(wrapper, ('any',)))
+        self.failUnlessRaises(EvaluateException, list,
+                              ps.iterparse(wrapper, ('key',)))
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(IterParseTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import unittest, sys
+from ZSI import *
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI import _Backtrace
+
+MESSAGE = '''<SOAP-ENV:Envelope
+ xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+ xmlns:SOAP-ENC="http://schemas.xmlsoap.org/soap/encoding/">
+ <SOAP-ENV:Header><t:h xmlns:t="urn:t" id="h1">header</t:h></SOAP-ENV:Header>
+ <SOAP-ENV:Body>
+  <root><a href="#n1"/><b href="#i2"/></root>
+  <item id="i1"><nested id="n1">x</nested></item>
+  <item id="i2">y</item>
+  <item id="dup">1</item>
+  <item id="dup">2</item>
+ </SOAP-ENV:Body>
+</SOAP-ENV:Envelope>'''
+
+
+class LocalHREFTestCase(unittest.TestCase):
+    "FindLocalHREF through the id index"
+
+    def _parsed(self):
+        for reader in (DefaultReader, ExpatReader):
+            yield ParsedSoap(MESSAGE, readerclass=reader)
+
+    def check_found(self):
+        for ps in self._parsed():
+            elt = ps.body_root
+            for href,name in (('#i2', 'item'), ('#n1', 'nested'),
+                              ('#i1', 'item'), ('#h1', 'h')):
+                self.failUnlessEqual(ps.FindLocalHREF(href, elt).localName,
+                                     name)
+            self.failUnlessEqual(
+                ps.Parse(TC.Struct(None, [TC.String('a'), TC.String('b')],
+                                   'root')),
+                {'a': 'x', 'b': 'y'})
+
+    def check_not_found(self):
+        for ps in self._parsed():
+            elt = ps.body_root
+            self.failUnlessRaises(EvaluateException, ps.FindLocalHREF,
+                                  '#h1', elt, headers=0)
+            self.failUnlessRaises(EvaluateException, ps.FindLocalHREF,
+                                  '#missing', elt)
+            self.failUnlessRaises(EvaluateException, ps.FindLocalHREF,
+                                  '#dup', elt)
+
+    def check_lazy_trace(self):
+        for ps in self._parsed():
+            calls, backtrace = [], ps.Backtrace
+            ps.Backtrace = lambda elt: calls.append(elt) or backtrace(elt)
+            try:
+                ps.FindLocalHREF('#missing', ps.body_root)
+            except EvaluateException, ex:
+                self.failUnlessEqual(calls, [])
+                self.failUnlessEqual(ex.trace,
+                    '/SOAP-ENV:Envelope/SOAP-ENV:Body/root')
+                self.failUnless(str(ex).endswith(
+                    '[Element trace: /SOAP-ENV:Envelope/SOAP-ENV:Body/root]'))
+                self.failUnlessEqual(calls, [ps.body_root])
+            else:
+                self.fail('found #missing')
+
+    def check_trace_released(self):
+        for ps in self._parsed():
+            trace = _Backtrace(ps.Backtrace, ps.body_root)
+            self.failUnlessEqual(str(trace),
+                '/SOAP-ENV:Envelope/SOAP-ENV:Body/root')
+            # the tree isn't referenced once the trace is known
+            self.failUnless(trace.backtrace is trace.args is None)
+            self.failUnlessEqual(str(trace),
+                '/SOAP-ENV:Envelope/SOAP-ENV:Body/root')
+
+    def check_many(self):
+        n = 2000
+        items = ''.join([ '<item id="i%d">%d</item>' %(i, i) for i in range(n) ])
+        refs = ''.join([ '<e href="#i%d"/>' %i for i in range(n) ])
+        xml = MESSAGE.replace('<root><a href="#n1"/><b href="#i2"/></root>',
+            '<root SOAP-ENC:arrayType="xsd:int[%d]">%s</root>%s' %(n, refs, items))
+        xml = xml.replace('<item id="i1"><nested id="n1">x</nested></item>', '')
+        xml = xml.replace('<item id="i2">y</item>', '')
+        ps = ParsedSoap(xml, readerclass=ExpatReader)
+        self.failUnlessEqual(ps.Parse(TC.Array('xsd:int', TC.Integer(), 'root')),
+                             range(n))
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(LocalHREFTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
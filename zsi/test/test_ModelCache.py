@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+import unittest, sys, os, shutil, tempfile, threading
+from ZSI.wstools.WSDLTools import WSDLReader, SoapOperationBinding
+from ZSI.wstools.XMLSchema import SchemaReader
+from ZSI.wstools.ModelCache import ModelCache
+from ZSI.wstools.Utility import DOM
+
+
+WSDL = '''<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="urn:test" targetNamespace="urn:test">
+  <import namespace="urn:test" location="messages.wsdl"/>
+  <types>
+    <xsd:schema targetNamespace="urn:test" elementFormDefault="qualified">
+      <xsd:element name="echo">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="value" type="xsd:string"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+    </xsd:schema>
+  </types>
+  <portType name="EchoPortType">
+    <operation name="echo">
+      <input message="tns:echoRequest"/><output message="tns:echoResponse"/>
+    </operation>
+  </portType>
+  <binding name="EchoBinding" type="tns:EchoPortType">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="echo">
+      <soap:operation soapAction="urn:test#echo"/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="EchoService">
+    <port name="EchoPort" binding="tns:EchoBinding">
+      <soap:address location="http://localhost/echo"/>
+    </port>
+  </service>
+</definitions>'''
+
+MESSAGES = '''<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:tns="urn:test" targetNamespace="urn:test">
+  <message name="echoRequest"><part name="parameters" element="tns:%s"/></message>
+  <message name="echoResponse"><part name="parameters" element="tns:echo"/></message>
+</definitions>'''
+
+SCHEMA = '''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    targetNamespace="urn:test">
+  <xsd:include schemaLocation="types.xsd"/>
+  <xsd:element name="item" type="xsd:string"/>
+</xsd:schema>'''
+
+TYPES = '''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    targetNamespace="urn:test">
+  <xsd:complexType name="%s"><xsd:sequence/></xsd:complexType>
+</xsd:schema>'''
+
+
+class CountingWSDLReader(WSDLReader):
+    built = 0
+    def _loadFromURL(self, url):
+        self.built += 1
+        return WSDLReader._loadFromURL(self, url)
+
+
+class ModelCacheTestCase(unittest.TestCase):
+    "Object models reloaded from a ModelCache"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ModelCache(os.path.join(self.dir, 'cache'))
+        self._write('service.wsdl', WSDL)
+        self._write('messages.wsdl', MESSAGES %'echo')
+        self._write('schema.xsd', SCHEMA)
+        self._write('types.xsd', TYPES %'one')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        f = open(os.path.join(self.dir, name), 'w')
+        f.write(data)
+        f.close()
+
+    def _wsdl(self):
+        reader = CountingWSDLReader(cache=self.cache)
+        wsdl = reader.loadFromURL(os.path.join(self.dir, 'service.wsdl'))
+        return reader.built, wsdl
+
+    def check_wsdl(self):
+        built, wsdl = self._wsdl()
+        self.failUnlessEqual(built, 1)
+        built, cached = self._wsdl()
+        self.failUnlessEqual(built, 0)
+        self.failIf(cached is wsdl)
+        port = cached.services[0].ports[0]
+        operation = port.getBinding().operations[0]
+        self.failUnlessEqual(
+            operation.findBinding(SoapOperationBinding).soapAction,
+            'urn:test#echo')
+        self.failUnlessEqual(cached.messages['echoRequest'].parts[0].element,
+                             ('urn:test', 'echo'))
+        schema = cached.types['urn:test']
+        self.failUnlessEqual(schema.elements[0].getAttribute('name'), 'echo')
+        # sibling links of the DOM are rebuilt
+        node = cached.document.documentElement.firstChild
+        while node.nextSibling is not None:
+            self.failUnless(node.nextSibling.previousSibling is node)
+            node = node.nextSibling
+        self.failUnless(node is cached.document.documentElement.lastChild)
+
+    def check_import_changed(self):
+        self._wsdl()
+        self._write('messages.wsdl', MESSAGES %'item')
+        built, wsdl = self._wsdl()
+        self.failUnlessEqual(built, 1)
+        self.failUnlessEqual(wsdl.messages['echoRequest'].parts[0].element,
+                             ('urn:test', 'item'))
+        self.failUnlessEqual(self._wsdl()[0], 0)
+
+    def check_schema(self):
+        url = os.path.join(self.dir, 'schema.xsd')
+        schema = SchemaReader(cache=self.cache).loadFromURL(url)
+        self.failUnlessEqual(schema.types.keys(), ['one'])
+        self._write('types.xsd', TYPES %'two')
+        schema = SchemaReader(cache=self.cache).loadFromURL(url)
+        self.failUnlessEqual(schema.types.keys(), ['two'])
+
+    def check_unchanged_not_read(self):
+        for name in ('service.wsdl', 'messages.wsdl'):
+            os.utime(os.path.join(self.dir, name), (1e9, 1e9))
+        self._wsdl()
+        reads = []
+        readURL = DOM.readURL
+        DOM.readURL = lambda url: reads.append(url) or readURL(url)
+        try:
+            self.failUnlessEqual(self._wsdl()[0], 0)
+            self.failUnlessEqual(reads, [])
+            os.utime(os.path.join(self.dir, 'messages.wsdl'), (2e9, 2e9))
+            self.failUnlessEqual(self._wsdl()[0], 0)
+            self.failUnlessEqual(len(reads), 1)
+        finally:
+            del DOM.readURL
+
+    def check_maxage(self):
+        url = 'http://localhost/nothing.xsd'
+        documents = [(url, 'digest', None)]
+        self.cache._write(url, documents, {'a': 1})
+        self.failUnlessEqual(self.cache._read(url), None)
+        self.cache.maxage = 60
+        self.failUnlessEqual(self.cache._read(url), {'a': 1})
+
+    def check_too_deep(self):
+        url = os.path.join(self.dir, 'schema.xsd')
+        model = []
+        for i in range(sys.getrecursionlimit() * 2):
+            model = [model]
+        self.failUnless(self.cache.load(url, lambda url: model) is model)
+        self.failIf(os.path.exists(self.cache.getFile(url)))
+
+    def check_other_thread(self):
+        # documents loaded by another thread meanwhile aren't recorded
+        url = os.path.join(self.dir, 'types.xsd')
+        other = os.path.join(self.dir, 'messages.wsdl')
+        def loader(url):
+            t = threading.Thread(target=DOM.loadFromURL, args=(other,))
+            t.start()
+            t.join()
+            return DOM.loadFromURL(url)
+        model, documents = self.cache._build(url, loader)
+        self.failUnlessEqual([ d[0] for d in documents ], [url])
+
+    def check_corrupt(self):
+        self._wsdl()
+        url = os.path.join(self.dir, 'service.wsdl')
+        f = open(self.cache.getFile(url), 'wb')
+        f.write('garbage')
+        f.close()
+        self.failUnlessEqual(self._wsdl()[0], 1)
+        self.failUnlessEqual(self._wsdl()[0], 0)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ModelCacheTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
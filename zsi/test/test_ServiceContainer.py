@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+import unittest, sys, threading, httplib
+from ZSI import *
+from ZSI.client import Binding
+from ZSI.ServiceContainer import ServiceContainer, ThreadPoolServiceContainer, \
+    ServiceSOAPBinding, SOAPRequestHandler, GetSOAPContext
+
+
+class Reply:
+    def __init__(self, value=None):
+        self.value = value
+
+Reply.typecode = TC.Struct(Reply, [TC.Any('value')], 'reply')
+
+
+class Service(ServiceSOAPBinding):
+    soapAction = {'wait': 'wait', 'wake': 'wake', 'context': 'context',
+                  'empty': 'empty', 'fail': 'fail'}
+
+    def __init__(self, post):
+        ServiceSOAPBinding.__init__(self, post)
+        self.event = threading.Event()
+
+    def wait(self, ps):
+        self.event.wait(10)
+        return None, Reply(self.event.isSet())
+
+    def wake(self, ps):
+        self.event.set()
+        return None, Reply(True)
+
+    def context(self, ps):
+        ctx = GetSOAPContext()
+        return None, Reply('%s %s' %(ctx.soapaction, ctx.parsedsoap is ps))
+
+    def empty(self, ps):
+        return None, None
+
+    def fail(self, ps):
+        raise ValueError('fail')
+
+
+class QuietHandler(SOAPRequestHandler):
+    def setup(self):
+        SOAPRequestHandler.setup(self)
+        self.server.connection_timeout = self.connection.gettimeout()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadPoolTestCase(unittest.TestCase):
+    "ThreadPoolServiceContainer handles requests concurrently"
+
+    def setUp(self):
+        self.service = Service('/test')
+        self.server = ThreadPoolServiceContainer(('127.0.0.1', 0),
+            [self.service], QuietHandler, workers=2, timeout=10)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/test' %self.server.server_address[1]
+
+    def tearDown(self):
+        # close kept-alive connections so the workers can finish
+        Binding.connectionPool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _call(self, action, **kw):
+        b = Binding(url=self.url, soapaction=action, **kw)
+        return b.RPC(None, action, {}, TC.Any())['value']
+
+    def check_concurrent(self):
+        result = []
+        t = threading.Thread(target=lambda: result.append(self._call('wait')))
+        t.start()
+        self.failUnlessEqual(self._call('wake'), True)
+        t.join()
+        self.failUnlessEqual(result, [True])
+
+    def check_context(self):
+        for i in range(4):
+            self.failUnlessEqual(self._call('context'), 'context True')
+
+    def check_keep_alive(self):
+        sw = SoapWriter()
+        sw.serialize({}, TC.Any('request'))
+        request = str(sw)
+        conn = httplib.HTTPConnection(*self.server.server_address)
+        try:
+            for action,status in [('empty', 200), ('fail', 500),
+                                  ('context', 200)]:
+                conn.request('POST', '/test', request,
+                             {'SOAPAction': action,
+                              'Content-Type': 'text/xml'})
+                response = conn.getresponse()
+                self.failUnlessEqual(response.status, status)
+                self.failUnlessEqual(len(response.read()),
+                    int(response.getheader('content-length')))
+                self.failIf(response.will_close)
+            self.failIf(self.server.connection_timeout is None)
+            # a chunked request is read to its end
+            conn.putrequest('POST', '/test')
+            conn.putheader('Content-Type', 'text/xml')
+            conn.putheader('SOAPAction', 'context')
+            conn.putheader('Transfer-Encoding', 'chunked')
+            conn.endheaders()
+            for i in range(0, len(request), 100):
+                chunk = request[i:i+100]
+                conn.send('%x\r\n%s\r\n' %(len(chunk), chunk))
+            conn.send('0\r\n\r\n')
+            response = conn.getresponse()
+            self.failUnlessEqual(response.status, 200)
+            self.failUnless(response.read().find('context True') != -1)
+            self.failIf(response.will_close)
+            # a request without a body length can't be followed by another
+            conn.putrequest('POST', '/test')
+            conn.putheader('Content-Type', 'text/xml')
+            conn.endheaders()
+            response = conn.getresponse()
+            self.failUnlessEqual(response.status, 411)
+            response.read()
+            self.failUnless(response.will_close)
+        finally:
+            conn.close()
+
+    def check_chunked_client(self):
+        self.failUnlessEqual(self._call('context', chunked=True),
+                             'context True')
+
+    def check_single_threaded(self):
+        # a server handling one connection at a time doesn't keep it
+        server = ServiceContainer(('127.0.0.1', 0), [Service('/test')],
+                                  QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        try:
+            sw = SoapWriter()
+            sw.serialize({}, TC.Any('request'))
+            conn = httplib.HTTPConnection(*server.server_address)
+            conn.request('POST', '/test', str(sw),
+                         {'SOAPAction': 'context', 'Content-Type': 'text/xml'})
+            response = conn.getresponse()
+            self.failUnlessEqual(response.status, 200)
+            self.failUnless(response.read().find('context True') != -1)
+            self.failUnless(response.will_close)
+            # nor changes its socket timeout
+            self.failUnless(server.connection_timeout is None)
+            conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def check_workers(self):
+        workers = self.server._workers
+        self.failUnlessEqual(len(workers), 2)
+        self.server.shutdown()
+        self.server.server_close()
+        for t in workers:
+            t.join(5)
+            self.failIf(t.isAlive())
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ThreadPoolTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
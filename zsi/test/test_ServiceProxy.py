@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import unittest, sys, os, shutil, tempfile
+from ZSI.ServiceProxy import ServiceProxy
+
+WSDL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    'wsdl2py', 'wsdl', 'DateService.wsdl')
+
+
+class ServiceProxyTestCase(unittest.TestCase):
+    "ServiceProxy warm start from the saved call-info table"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _callinfo(self, proxy):
+        items = []
+        for name,methods in proxy._methods.items():
+            for method in methods:
+                ci = method.callinfo
+                items.append((name, ci.soapAction, ci.encodingStyle, ci.style,
+                    ci.use, ci.location, ci.namespace,
+                    [(p.name, p.type, p.element_type) for p in ci.inparams],
+                    [(p.name, p.type, p.element_type) for p in ci.outparams]))
+        items.sort()
+        return items
+
+    def check_warm_start(self):
+        cold = ServiceProxy(WSDL, cachedir=self.dir)
+        self.failIf(cold._wsdl is None)
+        self.failUnless(os.path.isfile(
+            os.path.join(self.dir, 'DateService_callinfo.pickle')))
+
+        warm = ServiceProxy(WSDL, cachedir=self.dir)
+        self.failUnless(warm._wsdl is None)
+        self.failUnlessEqual(self._callinfo(warm), self._callinfo(cold))
+        self.failUnlessEqual((warm._name, warm.__doc__),
+                             (cold._name, cold.__doc__))
+        self.failUnlessEqual(warm.getDate.callinfo.methodName, 'getDate')
+
+        forced = ServiceProxy(WSDL, cachedir=self.dir, force=True)
+        self.failIf(forced._wsdl is None)
+
+    def check_other_service(self):
+        ServiceProxy(WSDL, cachedir=self.dir)
+        proxy = ServiceProxy(WSDL, cachedir=self.dir, service='simple Date Service')
+        self.failIf(proxy._wsdl is None)
+        proxy = ServiceProxy(WSDL, cachedir=self.dir, service='simple Date Service')
+        self.failUnless(proxy._wsdl is None)
+
+    def check_force_keeps_other_services(self):
+        ServiceProxy(WSDL, cachedir=self.dir, service='simple Date Service')
+        forced = ServiceProxy(WSDL, cachedir=self.dir, force=True)
+        self.failIf(forced._wsdl is None)
+        proxy = ServiceProxy(WSDL, cachedir=self.dir, service='simple Date Service')
+        self.failUnless(proxy._wsdl is None)
+        proxy = ServiceProxy(WSDL, cachedir=self.dir)
+        self.failUnless(proxy._wsdl is None)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ServiceProxyTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
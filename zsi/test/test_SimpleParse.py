@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import unittest, sys
+from ZSI import *
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI.wstools.Namespaces import SOAP
+from xml.dom import Node
+
+MESSAGE = '''<e:Envelope xmlns:e="%s"><e:Body><r xmlns="urn:r">%%s</r></e:Body></e:Envelope>''' \
+    %SOAP.ENV
+
+
+class SimpleParseTestCase(unittest.TestCase):
+    "Plain elements parse the same with and without attributes"
+
+    def _compare(self, tc, content):
+        '''Parse content as is and with a namespace declaration, taking
+        the fast path when it applies, and with an attribute, which takes
+        the checked path.
+        '''
+        declared = content.replace('<v', '<v xmlns:z="urn:z"')
+        declared = declared.replace('<w', '<w xmlns:z="urn:z"')
+        checked = declared.replace('<v ', '<v z:a="1" ')
+        checked = checked.replace('<w ', '<w z:a="1" ')
+        results = []
+        for reader in (DefaultReader, ExpatReader):
+            for xml in (content, declared, checked):
+                ps = ParsedSoap(MESSAGE %xml, readerclass=reader)
+                elt = [ E for E in ps.body_root.childNodes
+                        if E.nodeType == Node.ELEMENT_NODE ][0]
+                try:
+                    results.append(('value', tc.parse(elt, ps)))
+                except EvaluateException, ex:
+                    results.append(('error', ex.str))
+        for r in results[1:]:
+            self.failUnlessEqual(r, results[0], content)
+        return results[0]
+
+    def check_string(self):
+        tc = TC.String(('urn:r', 'v'))
+        self.failUnlessEqual(self._compare(tc, '<v>text</v>'), ('value', 'text'))
+        self.failUnlessEqual(self._compare(tc, '<v/>'), ('value', ''))
+        self.failUnlessEqual(self._compare(tc, '<v>a<![CDATA[<b>]]></v>'),
+                             ('value', 'a<b>'))
+        self.failUnlessEqual(self._compare(tc, '<w>text</w>')[0], 'error')
+        self.failUnlessEqual(self._compare(TC.String('v', strip=True),
+                                           '<v> x </v>'), ('value', 'x'))
+
+    def check_integer(self):
+        self.failUnlessEqual(self._compare(TC.Integer('v'), '<v>42</v>'),
+                             ('value', 42))
+        self.failUnlessEqual(self._compare(TC.Iint('v'), '<v>-7</v>'),
+                             ('value', -7))
+        self.failUnlessEqual(self._compare(TC.Ibyte('v'), '<v>200</v>'),
+                             ('error', 'Overflow, greater than 127'))
+        self.failUnlessEqual(self._compare(TC.IunsignedInt('v'), '<v>-1</v>'),
+                             ('error', 'Underflow, less than 0'))
+        self.failUnlessEqual(self._compare(TC.Integer('v'), '<v>x</v>'),
+                             ('error', 'Unparseable integer'))
+        self.failUnlessEqual(self._compare(TC.Ilong('v'), '<v>%d</v>' %(1L<<40)),
+                             ('value', 1L<<40))
+        self.failUnlessEqual(self._compare(TC.Integer('v'), '<v/>')[0], 'error')
+        self.failUnlessEqual(self._compare(TC.Integer('w'), '<v>1</v>')[0], 'error')
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SimpleParseTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
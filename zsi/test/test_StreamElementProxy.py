@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest, sys
+from ZSI import *
+from ZSI import writer
+from ZSI.writer import StreamElementProxy
+from ZSI.wstools.Namespaces import SOAP
+from ZSI.wstools.Utility import ElementProxy
+from xml.dom import minidom
+
+
+class Item:
+    def __init__(self, name=None, count=None):
+        self.name, self.count = name, count
+
+item = TC.Struct(Item, [TC.String('name'), TC.Integer('count')], 'item',
+                 inline=True)
+items = TC.ComplexType(None, [TC.String('key'),
+                              TC.Struct(Item, [TC.String('name'),
+                                               TC.Integer('count')],
+                                        ('urn:test', 'item'),
+                                        maxOccurs=TC.UNBOUNDED),
+                              TC.QName('qname'),
+                              TC.XML('doc', wrapped=False)],
+                       ('urn:test', 'items'))
+
+DOC = minidom.parseString('<a:doc xmlns:a="urn:a"><a:b c="&amp;"/></a:doc>')
+
+
+class StreamElementProxyTestCase(unittest.TestCase):
+    "Compare messages written by StreamElementProxy and ElementProxy"
+
+    def _write(self, outputclass, pyobj, tc, **kw):
+        sw = SoapWriter(outputclass=outputclass, **kw)
+        sw.serialize(pyobj, tc)
+        return str(sw)
+
+    def _compare(self, pyobj, tc, **kw):
+        expect = self._write(ElementProxy, pyobj, tc, **kw)
+        got = self._write(StreamElementProxy, pyobj, tc, **kw)
+        envelope = kw.get('envelope', True)
+        self.failUnlessEqual(
+            ParsedSoap(got, envelope=envelope).Parse(tc),
+            ParsedSoap(expect, envelope=envelope).Parse(tc))
+        return got
+
+    def check_any(self):
+        pyobj = {'s': u'<é&€>\r\n', 'i': 7, 'l': [1, 'a', 2.5],
+                 'd': {'x': 'y', 'z': ''}, 'b': True}
+        self._compare(pyobj, TC.Any('test'))
+        self._compare(pyobj, TC.Any('test'), envelope=False)
+
+    def check_multiref(self):
+        pyobj = Item('a', 1)
+        kw = {'mutable': False, 'unique': False}
+        tc = TC.Struct(None, [TC.Struct(Item, item.ofwhat, 'one', **kw),
+                              TC.Struct(Item, item.ofwhat, 'two', **kw)], 'test')
+        got = self._write(StreamElementProxy, {'one': pyobj, 'two': pyobj}, tc)
+        self.failUnless(got.find(' href="#') != -1)
+        pyobj = ParsedSoap(got).Parse(tc)
+        self.failUnlessEqual((pyobj['one'].name, pyobj['two'].count), ('a', 1))
+
+    def check_no_multiref(self):
+        pyobj = Item('a', 1)
+        sw = SoapWriter()
+        self.failUnlessEqual((sw.Known(pyobj), sw.Known(pyobj)), (0, 1))
+        sw.Forget(pyobj)
+        self.failUnlessEqual(sw.Known(pyobj), 0)
+        sw = SoapWriter(multiref=False)
+        self.failUnlessEqual((sw.Known(pyobj), sw.Known(pyobj)), (0, 0))
+
+        tc = TC.Struct(None, [TC.Struct(Item, item.ofwhat, 'one'),
+                              TC.Struct(Item, item.ofwhat, 'two')], 'test')
+        got = self._write(StreamElementProxy, {'one': pyobj, 'two': pyobj},
+                          tc, multiref=False)
+        self.failUnlessEqual(got.find(' href="#'), -1)
+        pyobj = ParsedSoap(got).Parse(tc)
+        self.failUnlessEqual((pyobj['one'].name, pyobj['two'].count), ('a', 1))
+
+    def check_namespaces(self):
+        pyobj = {'key': u'k"\t<', 'qname': ('urn:q', 'name'),
+                 'item': [Item('a', 1), Item('b', 2)], 'doc': DOC.documentElement}
+        for envelope in (True, False):
+            got = self._write(StreamElementProxy, pyobj, items,
+                              envelope=envelope, nsdict={'t': 'urn:test'})
+            ps = ParsedSoap(got, envelope=envelope)
+            pyobj2 = ps.Parse(items)
+            self.failUnlessEqual(pyobj2['key'], 'k"\t<')
+            self.failUnlessEqual(pyobj2['qname'], ('urn:q', 'name'))
+            self.failUnlessEqual([ (i.name, i.count) for i in pyobj2['item'] ],
+                                 [('a', 1), ('b', 2)])
+            self.failUnlessEqual(got.find('<t:items') != -1, envelope)
+
+    def check_header(self):
+        sw = SoapWriter(outputclass=StreamElementProxy)
+        header = Item('h', 1)
+        header.typecode = TC.Struct(Item, item.ofwhat, ('urn:test', 'header'))
+        sw.serialize({'a': 1}, TC.Any('body'), header_pyobjs=[header])
+        ps = ParsedSoap(str(sw))
+        self.failUnlessEqual(len(ps.header_elements), 1)
+        pyobj = header.typecode.parse(ps.header_elements[0], ps)
+        self.failUnlessEqual((pyobj.name, pyobj.count), ('h', 1))
+
+    def check_envelope_template(self):
+        kw = {'nsdict': {'t': 'urn:template'}, 'encodingStyle': SOAP.ENC}
+        for outputclass in (ElementProxy, StreamElementProxy):
+            self._compare({'a': 1}, TC.Any('test'), **kw)
+            self.failUnless(writer._envelopes.has_key(
+                (outputclass, SOAP.ENC, (('t', 'urn:template'),))))
+            first = self._write(outputclass, {'a': 1}, TC.Any('test'), **kw)
+            # declarations on the envelope don't change the template
+            sw = SoapWriter(outputclass=outputclass, **kw)
+            sw.serialize({'a': 1}, TC.Any('test'))
+            sw.dom.setNamespaceAttribute('x', 'urn:x')
+            sw.serialize_header({'h': 1}, TC.Any(('urn:x', 'h')))
+            got = str(sw)
+            self.failUnless(got.find('xmlns:x="urn:x"') != -1)
+            self.failUnless(got.find('<x:h') != -1)
+            self.failUnlessEqual(ParsedSoap(got).Parse(TC.Any()), {'a': 1})
+            self.failUnlessEqual(
+                self._write(outputclass, {'a': 1}, TC.Any('test'), **kw), first)
+            self.failUnless(first.find('xmlns:t="urn:template"') != -1)
+            self.failUnless(first.find(' soapenv:encodingStyle=') != -1)
+
+    def check_envelope_strings(self):
+        kw = {'nsdict': {'s': 'urn:strings'}}
+        self._write(StreamElementProxy, {'a': 1}, TC.Any('test'), **kw)
+        template = writer._envelopes[
+            (StreamElementProxy, None, (('s', 'urn:strings'),))]
+        got = self._write(StreamElementProxy, {'a': 1}, TC.Any('test'), **kw)
+        self.failUnless(got.startswith(template.startHeader + '<soapenv:Body'))
+        self.failUnless(got.endswith('</soapenv:Body>' + template.end))
+        got = self._write(StreamElementProxy, {'a': 1}, TC.Any('test'),
+                          header=False, **kw)
+        self.failUnless(got.startswith(template.start + '<soapenv:Body'))
+        self.failUnlessEqual(ParsedSoap(got).Parse(TC.Any()), {'a': 1})
+        # a Header with content is written as is
+        sw = SoapWriter(outputclass=StreamElementProxy, **kw)
+        sw.serialize({'a': 1}, TC.Any('test'))
+        sw.serialize_header({'h': 1}, TC.Any(('urn:x', 'h')))
+        got = str(sw)
+        self.failUnless(got.startswith(template.start + '<soapenv:Header '))
+        self.failUnlessEqual(ParsedSoap(got).Parse(TC.Any()), {'a': 1})
+
+    def check_backtrace(self):
+        sw = SoapWriter(outputclass=StreamElementProxy)
+        sw.serialize({'a': [1, 2]}, TC.Any('test'))
+        elt = sw.body.childNodes[0].childNodes[0]
+        self.failUnlessEqual(sw.Backtrace(elt),
+                             '/soapenv:Body/test/a')
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(StreamElementProxyTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
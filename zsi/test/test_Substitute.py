@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import unittest, sys
+import ZSI
+from ZSI import EvaluateException
+from ZSI.schema import GED, TypeDefinition, ElementDeclaration, \
+    _is_substitute_element
+from ZSI.parse import ParsedSoap
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+from ZSI.wstools.Namespaces import SOAP, SCHEMA
+
+NS = 'urn:test:substitute'
+
+class Base_Def(ZSI.TCcompound.ComplexType, TypeDefinition):
+    schema = NS
+    type = (schema, 'Base')
+    def __init__(self, pname, **kw):
+        ofwhat = [ZSI.TC.String(pname='name', aname='_name')]
+        ZSI.TCcompound.ComplexType.__init__(self, None, ofwhat, pname=pname,
+                                            **kw)
+
+class Derived_Def(Base_Def, TypeDefinition):
+    schema = NS
+    type = (schema, 'Derived')
+    def __init__(self, pname, **kw):
+        Base_Def.__init__(self, pname, **kw)
+        self.ofwhat += (ZSI.TC.Integer(pname='count', aname='_count'),)
+
+class head_Dec(ZSI.TC.String, ElementDeclaration):
+    literal = 'head'
+    schema = NS
+    substitutionGroup = None
+    def __init__(self, **kw):
+        kw['pname'] = (NS, 'head')
+        ZSI.TC.String.__init__(self, **kw)
+
+class member_Dec(ZSI.TC.String, ElementDeclaration):
+    literal = 'member'
+    schema = NS
+    substitutionGroup = (NS, 'head')
+    def __init__(self, **kw):
+        kw['pname'] = (NS, 'member')
+        ZSI.TC.String.__init__(self, **kw)
+
+
+MESSAGE = '''<e:Envelope xmlns:e="%s" xmlns:i="%s"><e:Body>
+<r xmlns:t="%s">
+<item i:type="t:%%s"><name>a</name><count>1</count></item>
+<item xmlns:d="%s" i:type="d:%%s"><name>b</name><count>2</count></item>
+</r></e:Body></e:Envelope>''' %(SOAP.ENV, SCHEMA.XSI3, NS, NS)
+
+GROUP = '''<e:Envelope xmlns:e="%s"><e:Body><r xmlns="%s"><%%s>x</%%s></r>
+</e:Body></e:Envelope>''' %(SOAP.ENV, NS)
+
+
+class SubstituteTestCase(unittest.TestCase):
+    "Derived type substitution through xsi:type"
+
+    def _items(self, xml, reader):
+        ps = ParsedSoap(xml, readerclass=reader)
+        return [ E for E in ps.body_root.childNodes
+                 if E.localName == 'item' ], ps
+
+    def check_cached(self):
+        tc = Base_Def('item')
+        for reader in (DefaultReader, ExpatReader):
+            elts, ps = self._items(MESSAGE %('Derived', 'Derived'), reader)
+            values = [ tc.parse(E, ps) for E in elts ]
+            self.failUnlessEqual([ (v['_name'], v['_count']) for v in values ],
+                                 [('a', 1), ('b', 2)])
+            # both prefixes resolve to one substitute typecode
+            substitutes = tc._substitutes.values()
+            self.failUnlessEqual(len(substitutes), 1)
+            self.failUnless(isinstance(substitutes[0], Derived_Def))
+            self.failUnlessEqual(substitutes[0].pname, tc.pname)
+
+    def check_unknown(self):
+        tc = Base_Def('item')
+        elts, ps = self._items(MESSAGE %('Nothing', 'Nothing'), DefaultReader)
+        for E in elts:
+            self.failUnlessRaises(EvaluateException, tc.parse, E, ps)
+        self.failIf(tc._substitutes)
+
+    def check_substitution_group(self):
+        self.failUnlessEqual(ZSI.schema.SchemaInstanceType.getSubstitutionGroup(
+            NS, 'head'), {(NS, 'member'): member_Dec})
+        tc = ZSI.TCcompound.ComplexType(None, [GED(NS, 'head')], pname='r')
+        for reader in (DefaultReader, ExpatReader):
+            for name in ('head', 'member'):
+                ps = ParsedSoap(GROUP %(name, name), readerclass=reader)
+                self.failUnlessEqual(tc.parse(ps.body_root, ps), {'head': 'x'})
+            ps = ParsedSoap(GROUP %('other', 'other'), readerclass=reader)
+            self.failUnlessEqual(tc.parse(ps.body_root, ps), {})
+        self.failUnless(_is_substitute_element(head_Dec(), GED(NS, 'member')))
+        self.failIf(_is_substitute_element(head_Dec(), GED(NS, 'head')))
+        self.failIf(_is_substitute_element(GED(NS, 'member'), head_Dec()))
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SubstituteTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import unittest, sys
+from ZSI import *
+from ZSI.parse import DefaultReader
+from ZSI.reader import ExpatReader
+
+
+def _typecode():
+    prop = TC.Struct(None, [TC.String('name'), TC.Any('val')], 'propSet')
+    prop.maxOccurs = TC.UNBOUNDED
+    item = TC.ComplexType(None, [TC.String('obj'),
+                                 TC.Integer('count', nillable=True),
+                                 TC.Iint('size'),
+                                 TC.Boolean('ok'),
+                                 prop,
+                                 TC.AnyElement(aname='extra',
+                                        maxOccurs=TC.UNBOUNDED,
+                                        processContents='lax')],
+                          'returnval', maxOccurs=TC.UNBOUNDED)
+    return TC.ComplexType(None, [item], ('urn:vim25', 'Response'))
+
+MESSAGE = '''<Response xmlns="urn:vim25"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <returnval>
+    <obj>vm-1</obj><count>1</count><size>10</size><ok>true</ok>
+    <propSet><name>name</name><val xsi:type="xsd:string">vm 1</val></propSet>
+    <propSet><name>cpu</name><val xsi:type="xsd:int">2</val></propSet>
+  </returnval>
+  <returnval>
+    <obj xsi:type="xsd:string">vm-2</obj><count xsi:nil="1"/><size>0</size>
+    <other>x</other><obj></obj>
+    <propSet><name><![CDATA[na]]>me</name><val>vm 2</val></propSet>
+  </returnval>
+</Response>'''
+
+class Item:
+    pass
+
+PYOBJ = {'returnval': [
+    {'obj': 'vm-1', 'count': 1, 'size': 10, 'ok': True,
+     'propSet': [{'name': 'name', 'val': 'vm 1'},
+                 {'name': u'cpu\xe9', 'val': 2}], 'extra': ['x']},
+    {'obj': 'vm-2', 'count': None, 'size': 0L, 'ok': False,
+     'propSet': [{'name': 'name', 'val': None}],
+     'extra': [1]},
+]}
+
+
+class CompiledTestCase(unittest.TestCase):
+    "Compiled parsers and serializers give the same result as the typecode methods"
+
+    def _parse(self, tc, xml, readerclass):
+        return ParsedSoap(xml, readerclass=readerclass, envelope=False).Parse(tc)
+
+    def _serialize(self, tc, pyobj, **kw):
+        sw = SoapWriter(envelope=False)
+        try:
+            sw.serialize(pyobj, tc, **kw)
+        except (EvaluateException, TypeError), ex:
+            return ex.__class__
+        return str(sw)
+
+    def check_compile(self):
+        tc = _typecode()
+        self.failUnless(TC.compile_typecode(tc) is tc)
+        self.failUnless(tc.__dict__.has_key('parse'))
+        self.failUnless(tc.ofwhat[0].ofwhat[0].__dict__.has_key('parse'))
+        self.failUnless(tc.ofwhat[0].__dict__.has_key('serialize'))
+        self.failUnless(tc.ofwhat[0].ofwhat[0].__dict__.has_key('serialize'))
+
+    def check_same_result(self):
+        for reader in (DefaultReader, ExpatReader):
+            expect = self._parse(_typecode(), MESSAGE, reader)
+            self.failUnlessEqual(
+                self._parse(TC.compile_typecode(_typecode()), MESSAGE, reader), expect)
+
+    def check_errors(self):
+        tests = [
+            '<Response xmlns="urn:vim25"><returnval><size>x</size></returnval></Response>',
+            '<Response xmlns="urn:vim25"><returnval><size>2147483648</size></returnval></Response>',
+            '<Response xmlns="urn:vim25"><returnval><obj><a/></obj></returnval></Response>',
+            '<Response><returnval/></Response>',
+        ]
+        for xml in tests:
+            self.failUnlessRaises(EvaluateException, self._parse,
+                                  TC.compile_typecode(_typecode()), xml, ExpatReader)
+
+    def check_same_output(self):
+        tests = [
+            (PYOBJ, {}),
+            (PYOBJ, {'typed': True}),
+            ({'returnval': [{'obj': 'vm-1', 'size': 'x'}]}, {}),
+            ({'returnval': [{'size': 1, 'count': 1}]}, {}),
+            ({'returnval': [{'obj': 'a', 'size': 1, 'propSet': 'x'}]}, {}),
+            ({'returnval': {'obj': 'a'}}, {}),
+        ]
+        for pyobj,kw in tests:
+            expect = self._serialize(_typecode(), pyobj, **kw)
+            self.failUnlessEqual(
+                self._serialize(TC.compile_typecode(_typecode()), pyobj, **kw), expect)
+        self.failUnless(self._serialize(_typecode(), PYOBJ).find('vm-2') > 0)
+
+    def check_pyclass(self):
+        tc = TC.compile_typecode(TC.Struct(Item, [TC.String('s', typed=False),
+                                         TC.Iint('i', typed=False)],
+                                  'item', inline=True))
+        pyobj = Item()
+        pyobj.s, pyobj.i = 'a', 1
+        self.failUnlessEqual(self._serialize(tc, pyobj),
+            '<item><s>a</s><i>1</i></item>')
+        self.failUnlessEqual(self._serialize(tc, pyobj, name='other'),
+            '<other><s>a</s><i>1</i></other>')
+
+    def check_ofwhat_replaced(self):
+        tc = TC.compile_typecode(TC.ComplexType(None, [TC.Integer('i')], 'item'))
+        xml = '''<item><i>1</i><s>a</s></item>'''
+        self.failUnlessEqual(self._parse(tc, xml, ExpatReader), {'i': 1})
+        tc.setDerivedTypeContents(extensions=[TC.String('s')])
+        self.failUnlessEqual(self._parse(tc, xml, ExpatReader),
+                             {'i': 1, 's': 'a'})
+
+    def check_overrides(self):
+        class Checked(TC.Integer):
+            def checkname(self, elt, ps):
+                raise EvaluateException('checked')
+        class Ranged(TC.Iint):
+            def check_range(self, v, type, elt, ps):
+                return -v
+        tc = TC.compile_typecode(TC.ComplexType(None, [Checked('i')], 'o'))
+        self.failIf(tc.ofwhat[0].__dict__.has_key('parse'))
+        self.failUnlessRaises(EvaluateException, self._parse, tc,
+                              '<o><i>1</i></o>', ExpatReader)
+        tc = TC.compile_typecode(Ranged('i'))
+        self.failIf(tc.__dict__.has_key('parse'))
+        self.failUnlessEqual(self._parse(tc, '<i>1</i>', ExpatReader), -1)
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CompiledTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
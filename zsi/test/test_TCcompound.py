@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import unittest, sys
+from ZSI import *
+
+
+class ComplexTypeParseTestCase(unittest.TestCase):
+    "Dispatch of child elements to the ofwhat typecodes"
+
+    def _parse(self, tc, xml):
+        ps = ParsedSoap(xml, envelope=False)
+        return ps.Parse(tc)
+
+    def check_names(self):
+        tc = TC.Struct(None, [TC.String(('urn:a', 'name')), TC.Integer('count'),
+                              TC.String('name', aname='other')], 'item')
+        pyobj = self._parse(tc, '''<item xmlns:a="urn:a">
+<count>3</count><name>x</name><a:name>y</a:name></item>''')
+        self.failUnlessEqual(pyobj, {'count': 3, 'other': u'x', 'name': u'y'})
+
+    def check_arrays(self):
+        tc = TC.ComplexType(None, [TC.Integer('i', maxOccurs=TC.UNBOUNDED),
+                                   TC.String('s', maxOccurs=TC.UNBOUNDED)],
+                            'item')
+        pyobj = self._parse(tc, '''<item>
+<i>1</i><s>a</s><i>2</i><s>b</s><i>3</i></item>''')
+        self.failUnlessEqual(pyobj, {'i': [1, 2, 3], 's': [u'a', u'b']})
+
+    def check_wildcard(self):
+        tc = TC.ComplexType(None, [TC.Integer('i'), TC.AnyElement(aname='any',
+                            maxOccurs=TC.UNBOUNDED, processContents='lax')], 'item')
+        pyobj = self._parse(tc, '''<item><x>a</x><i>1</i><y>b</y></item>''')
+        self.failUnlessEqual(pyobj['i'], 1)
+        self.failUnlessEqual(pyobj['any'], [u'a', u'b'])
+
+    def check_inorder(self):
+        tc = TC.ComplexType(None, [TC.Integer('i', maxOccurs=TC.UNBOUNDED),
+                                   TC.String('s')], 'item', inorder=True)
+        pyobj = self._parse(tc, '''<item><i>1</i><s>a</s></item>''')
+        self.failUnlessEqual(pyobj, {'i': [1], 's': u'a'})
+        self.failUnlessRaises(EvaluateException, self._parse, tc,
+                              '''<item><s>a</s><i>1</i></item>''')
+
+    def check_ofwhat_replaced(self):
+        tc = TC.ComplexType(None, [TC.Integer('i')], 'item')
+        xml = '''<item><i>1</i><s>a</s></item>'''
+        self.failUnlessEqual(self._parse(tc, xml), {'i': 1})
+        tc.setDerivedTypeContents(extensions=[TC.String('s')])
+        self.failUnlessEqual(self._parse(tc, xml), {'i': 1, 's': u'a'})
+
+
+def makeTestSuite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ComplexTypeParseTestCase, "check"))
+    return suite
+
+def main():
+    unittest.main(defaultTest="makeTestSuite")
+
+
+if __name__ == "__main__" : main()
@@ -15,6 +15,20 @@ import test_URI
 import test_rfc2617
 import test_QName
 import test_AnyType
+import test_ExpatReader
+import test_TCcompound
+import test_TCcompiled
+import test_StreamElementProxy
+import test_ConnectionPool
+import test_ServiceContainer
+import test_ModelCache
+import test_ServiceProxy
+import test_LocalHREF
+import test_ClientStreaming
+import test_IterParse
+import test_SimpleParse
+import test_Substitute
+import test_ElementProxy
 
 def makeTestSuite():
     return unittest.TestSuite(